@@ -1,10 +1,28 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+
 import streamlit as st
-import PyPDF2
 from litellm import completion
 from dotenv import load_dotenv
 
+from pdf_text import extract_pdf_text
+
 load_dotenv()
 
+# Map-reduce summarization settings for books too large for a single prompt.
+SUMMARY_CHUNK_SIZE = 12000
+SUMMARY_MAP_WORKERS = 4
+SUMMARY_SINGLE_PASS_MAX_CHARS = 60000
+
+# Extracted texts kept in memory, one per distinct uploaded PDF.
+PDF_TEXT_CACHE_MAX_ENTRIES = 8
+# LLM results kept in memory and shared by every session; the oldest are dropped first.
+LLM_RESULT_CACHE_MAX_ENTRIES = 256
+
 
 # Generic LLM Helper Function
 def call_llm(prompt, model_name, **kwargs):
@@ -25,11 +43,92 @@ def call_llm(prompt, model_name, **kwargs):
         return None # Or raise a custom exception
 
 
+def file_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+@st.cache_data(max_entries=PDF_TEXT_CACHE_MAX_ENTRIES, show_spinner="Extracting text from PDF...")
+def load_pdf_text(pdf_hash, _pdf_bytes):
+    """
+    Extracts the text of an uploaded PDF once per distinct file. Streamlit reruns
+    the script on every widget interaction; the cache is keyed by `pdf_hash`
+    only (the leading underscore keeps Streamlit from hashing the bytes again).
+    """
+    return extract_pdf_text(_pdf_bytes)
+
+
+@st.cache_resource
+def _llm_results():
+    return OrderedDict(), threading.Lock()
+
+
+def cached_llm_call(operation, model_name, inputs, func):
+    """
+    Returns `(result, cached)` for `func()`, memoized per operation, model and
+    inputs across reruns and sessions. Failed calls (None) are not cached, so
+    they are retried on the next click.
+    """
+    key = hashlib.sha256(json.dumps([operation, model_name, *inputs]).encode("utf-8")).hexdigest()
+    results, lock = _llm_results()
+    with lock:
+        if key in results:
+            results.move_to_end(key)
+            return results[key], True
+    result = func()
+    if result is not None:
+        with lock:
+            results[key] = result
+            while len(results) > LLM_RESULT_CACHE_MAX_ENTRIES:
+                results.popitem(last=False)
+    return result, False
+
+
+def show_cached_notice(cached):
+    if cached:
+        st.caption("⚡ Served from cache. No model call was made.")
+
+
+def _summarize_section(section_text, model_name):
+    # Runs in a worker thread, so errors are raised instead of shown with st.error.
+    prompt = (
+        f"The following text is one part of a longer document.\n\n{section_text}\n\n"
+        "Summarize this part in a few paragraphs. Keep the main ideas, key facts, figures, "
+        "names and any notable quotable sentences."
+    )
+    response = completion(model=model_name, messages=[{"role": "user", "content": prompt}])
+    return response.choices[0].message.content
+
+
+def summarize_sections(pdf_text, model_name):
+    """
+    Summarizes the text in sections of SUMMARY_CHUNK_SIZE characters, several at a time.
+    Section summaries are kept in the session per document and model, so changing
+    the summary length or keywords doesn't re-read the book.
+    """
+    cache = st.session_state.setdefault("section_summaries", {})
+    doc_key = (hashlib.sha256(pdf_text.encode("utf-8")).hexdigest(), model_name)
+    if doc_key not in cache:
+        sections = [pdf_text[i:i + SUMMARY_CHUNK_SIZE] for i in range(0, len(pdf_text), SUMMARY_CHUNK_SIZE)]
+        with ThreadPoolExecutor(max_workers=SUMMARY_MAP_WORKERS) as pool:
+            cache[doc_key] = list(pool.map(_summarize_section, sections, repeat(model_name)))
+    return cache[doc_key]
+
+
 def extract_key_info(pdf_text, model_name, summary_length="Comprehensive", keywords=None):
     """
     Extracts key information from PDF text using an LLM, with customizable summary length and keyword focus.
+    Long texts are summarized section by section first and the section summaries are then combined.
     """
-    prompt_parts = [f"Analyze the following text:\n\n{pdf_text}\n\n"]
+    if len(pdf_text) > SUMMARY_SINGLE_PASS_MAX_CHARS:
+        try:
+            section_summaries = summarize_sections(pdf_text, model_name)
+        except Exception as e:
+            st.error(f"LLM API call failed: {e}")
+            return None
+        joined = "\n\n".join(f"Part {i}:\n{summary}" for i, summary in enumerate(section_summaries, start=1))
+        prompt_parts = [f"Below are summaries of consecutive parts of a document, in order:\n\n{joined}\n\n"]
+    else:
+        prompt_parts = [f"Analyze the following text:\n\n{pdf_text}\n\n"]
 
     if summary_length == "Short":
         prompt_parts.append("Provide a very brief summary (1-2 sentences).")
@@ -123,8 +222,9 @@ def main():
     uploaded_file = st.file_uploader("Upload a PDF", type=["pdf"])
 
     if uploaded_file:
-        pdf_reader = PyPDF2.PdfReader(uploaded_file)
-        pdf_text = "\n".join(page.extract_text() for page in pdf_reader.pages)
+        pdf_bytes = uploaded_file.getvalue()
+        pdf_hash = file_hash(pdf_bytes)
+        pdf_text = load_pdf_text(pdf_hash, pdf_bytes)
 
         with st.form("qa_form"):
             query = st.text_input("Ask your question:")
@@ -146,18 +246,6 @@ def main():
             keywords = st.text_input("Enter keywords/topics (optional):")
             generate_summary_submitted = st.form_submit_button("Generate Summary")
 
-            if qa_submitted and query:
-                qa_prompt = f"Here is the entire book:\n\n{pdf_text}\n\nQuestion: {query}\nAnswer:"
-                answer = call_llm(qa_prompt, selected_model)
-                if answer:
-                    st.write("Answer:", answer)
-            
-            if generate_summary_submitted:
-                summary_info = extract_key_info(pdf_text, selected_model, summary_length, keywords)
-                if summary_info:
-                    with st.expander("Generated Summary", expanded=True):
-                        st.markdown(summary_info)
-            
             # Terminology and Concept Explanation Section
             st.subheader("Terminology and Concept Explanation")
             st.caption(
@@ -168,12 +256,6 @@ def main():
             surrounding_context = st.text_area("Paste surrounding context (optional):")
             explain_term_submitted = st.form_submit_button("Explain Term")
 
-            if explain_term_submitted and term_to_explain:
-                explanation = explain_term(term_to_explain, surrounding_context, selected_model)
-                if explanation:
-                    st.markdown("### Explanation")
-                    st.markdown(explanation)
-
             # Experimental Misinformation Detection Section
             with st.expander("🧪 Experimental: Misinformation Detection", expanded=False):
                 st.warning(
@@ -193,41 +275,63 @@ def main():
             sentiment_text_to_analyze = st.text_area("Enter text for sentiment analysis:", key="sentiment_text_area", height=150)
             analyze_sentiment_submitted = st.form_submit_button("Analyze Sentiment")
 
+            # Each action is handled once, after the whole form is laid out.
             if qa_submitted and query:
-                qa_prompt = f"Here is the entire book:\n\n{pdf_text}\n\nQuestion: {query}\nAnswer:"
-                answer = call_llm(qa_prompt, selected_model)
+                answer, cached = cached_llm_call(
+                    "qa", selected_model, [pdf_hash, query],
+                    lambda: call_llm(
+                        f"Here is the entire book:\n\n{pdf_text}\n\nQuestion: {query}\nAnswer:", selected_model
+                    ),
+                )
                 if answer:
                     st.write("Answer:", answer)
-            
+                    show_cached_notice(cached)
+
             if generate_summary_submitted:
-                summary_info = extract_key_info(pdf_text, selected_model, summary_length, keywords)
+                summary_info, cached = cached_llm_call(
+                    "summary", selected_model, [pdf_hash, summary_length, keywords],
+                    lambda: extract_key_info(pdf_text, selected_model, summary_length, keywords),
+                )
                 if summary_info:
                     with st.expander("Generated Summary", expanded=True):
                         st.markdown(summary_info)
-            
+                        show_cached_notice(cached)
+
             if explain_term_submitted and term_to_explain:
-                explanation = explain_term(term_to_explain, surrounding_context, selected_model)
+                explanation, cached = cached_llm_call(
+                    "explain_term", selected_model, [term_to_explain, surrounding_context],
+                    lambda: explain_term(term_to_explain, surrounding_context, selected_model),
+                )
                 if explanation:
                     st.markdown("### Explanation")
                     st.markdown(explanation)
+                    show_cached_notice(cached)
 
             if analyze_misinfo_submitted:
-                    if not misinfo_text_segment.strip():
-                        st.error("Please paste some text to analyze.")
-                    else:
-                        misinformation_analysis = detect_misinformation(misinfo_text_segment, selected_model)
-                        if misinformation_analysis:
-                            st.markdown("### Misinformation Analysis")
-                            st.markdown(misinformation_analysis)
-            
+                if not misinfo_text_segment.strip():
+                    st.error("Please paste some text to analyze.")
+                else:
+                    misinformation_analysis, cached = cached_llm_call(
+                        "misinformation", selected_model, [misinfo_text_segment],
+                        lambda: detect_misinformation(misinfo_text_segment, selected_model),
+                    )
+                    if misinformation_analysis:
+                        st.markdown("### Misinformation Analysis")
+                        st.markdown(misinformation_analysis)
+                        show_cached_notice(cached)
+
             if analyze_sentiment_submitted:
                 if not sentiment_text_to_analyze.strip():
                     st.error("Please enter some text to analyze for sentiment.")
                 else:
-                    sentiment_result = analyze_sentiment(sentiment_text_to_analyze, selected_model)
+                    sentiment_result, cached = cached_llm_call(
+                        "sentiment", selected_model, [sentiment_text_to_analyze],
+                        lambda: analyze_sentiment(sentiment_text_to_analyze, selected_model),
+                    )
                     if sentiment_result:
                         st.markdown("### Sentiment Analysis Result")
                         st.markdown(sentiment_result)
+                        show_cached_notice(cached)
 
 
 if __name__ == "__main__":
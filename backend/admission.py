@@ -0,0 +1,367 @@
+import asyncio
+import math
+import os
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, Iterable, Optional
+
+from starlette.responses import JSONResponse
+
+from metrics import current_trace, registry as metrics_registry
+from token_budget import current_request_usage
+
+# Admission control for the LLM-backed endpoints, per API worker. Requests
+# served at once across all clients; ADMISSION_MAX_CONCURRENT=0 turns it off.
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "32"))
+# Requests one client can have served at once; the rest of its requests queue.
+ADMISSION_MAX_CONCURRENT_PER_CLIENT = int(os.getenv("ADMISSION_MAX_CONCURRENT_PER_CLIENT", "4"))
+# Requests waiting for a slot across all clients (beyond: 503) and per client (beyond: 429).
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "128"))
+ADMISSION_MAX_QUEUE_PER_CLIENT = int(os.getenv("ADMISSION_MAX_QUEUE_PER_CLIENT", "8"))
+# A queued request still waiting after this many seconds gets a 503.
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "10"))
+# LLM tokens (prompt + completion) per minute across all clients (beyond: 503)
+# and per client (beyond: 429). 0 disables the limit.
+ADMISSION_TOKENS_PER_MINUTE = int(os.getenv("ADMISSION_TOKENS_PER_MINUTE", "0"))
+ADMISSION_CLIENT_TOKENS_PER_MINUTE = int(os.getenv("ADMISSION_CLIENT_TOKENS_PER_MINUTE", "0"))
+# Header identifying the client, e.g. X-Real-IP behind a proxy or an API key
+# header set by a gateway. Empty uses the connection's peer address.
+ADMISSION_CLIENT_HEADER = os.getenv("ADMISSION_CLIENT_HEADER", "")
+# Upper bound on the Retry-After sent with rejections.
+ADMISSION_MAX_RETRY_AFTER_SECONDS = 60
+
+# Idle clients with nothing left to refill are forgotten once this many are tracked.
+_MAX_TRACKED_CLIENTS = 10000
+
+admission_wait = metrics_registry.histogram(
+    "bookai_admission_wait_seconds", "Time LLM requests spent queued for admission, by outcome (admitted, timeout).",
+    ("outcome",),
+)
+admission_rejections = metrics_registry.counter(
+    "bookai_admission_rejections_total", "LLM requests turned away by admission control, by reason.", ("reason",)
+)
+
+
+class AdmissionRejected(Exception):
+    """A request refused by admission control: 429 when the client is over its own limits, 503 when the server is."""
+
+    def __init__(self, status_code: int, reason: str, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.reason = reason
+        self.detail = detail
+        self.retry_after = max(1, min(ADMISSION_MAX_RETRY_AFTER_SECONDS, math.ceil(retry_after)))
+
+
+class TokenBucket:
+    """
+    Tokens per minute with up to a minute's worth of burst. Requests are charged
+    their actual usage after they finish, so the level can go negative; new
+    requests are admitted only while it is positive.
+    """
+
+    def __init__(self, tokens_per_minute: float, clock: Callable[[], float] = time.monotonic):
+        self.capacity = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self.clock = clock
+        self._level = self.capacity
+        self._updated = clock()
+
+    def level(self) -> float:
+        now = self.clock()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+        return self._level
+
+    def charge(self, tokens: int):
+        self._level = self.level() - tokens
+
+    def seconds_until_available(self) -> float:
+        level = self.level()
+        return 0.0 if level > 0 else (1 - level) / self.rate
+
+    @property
+    def full(self) -> bool:
+        return self.level() >= self.capacity
+
+
+@dataclass
+class _Waiter:
+    loop: asyncio.AbstractEventLoop
+    future: asyncio.Future
+    queued_at: float
+    ticket: Optional["AdmissionTicket"] = None
+
+
+@dataclass
+class _ClientState:
+    active: int = 0
+    waiting: Deque[_Waiter] = field(default_factory=deque)
+    bucket: Optional[TokenBucket] = None
+
+
+@dataclass
+class AdmissionTicket:
+    client_id: str
+    started_at: float
+    waited: float
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdmissionController:
+    """
+    Caps the LLM requests in progress, globally and per client, and queues
+    the overflow. Slots freed by finished requests go round-robin to the
+    clients with queued requests, so one client with many requests waiting
+    doesn't starve the others. Arrivals that can't wait are refused at once:
+    a full queue or a client over its token budget gets AdmissionRejected
+    with a Retry-After estimate instead of adding to the backlog.
+    State is guarded by a thread lock and waiters are woken on their own
+    event loop, so one controller can serve requests from several loops.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = ADMISSION_MAX_CONCURRENT,
+        max_concurrent_per_client: int = ADMISSION_MAX_CONCURRENT_PER_CLIENT,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        max_queue_per_client: int = ADMISSION_MAX_QUEUE_PER_CLIENT,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        tokens_per_minute: int = ADMISSION_TOKENS_PER_MINUTE,
+        client_tokens_per_minute: int = ADMISSION_CLIENT_TOKENS_PER_MINUTE,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_concurrent_per_client = max(1, max_concurrent_per_client)
+        self.max_queue = max(0, max_queue)
+        self.max_queue_per_client = max(0, max_queue_per_client)
+        self.queue_timeout = queue_timeout
+        self.tokens_per_minute = tokens_per_minute
+        self.client_tokens_per_minute = client_tokens_per_minute
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._clients: Dict[str, _ClientState] = {}
+        # Clients with queued requests, in the order they get the next free slot.
+        self._turns: Deque[str] = deque()
+        self._active = 0
+        self._queued = 0
+        self._bucket: Optional[TokenBucket] = None
+        # Running average of how long an admitted request holds its slot, for Retry-After.
+        self._service_seconds = 1.0
+        self._counters = {"admitted": 0, "queued": 0, "timeouts": 0, "rejected_429": 0, "rejected_503": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrent > 0
+
+    def _global_bucket(self) -> Optional[TokenBucket]:
+        if self._bucket is None and self.tokens_per_minute > 0:
+            self._bucket = TokenBucket(self.tokens_per_minute, self.clock)
+        return self._bucket
+
+    def _client(self, client_id: str) -> _ClientState:
+        client = self._clients.get(client_id)
+        if client is None:
+            if len(self._clients) >= _MAX_TRACKED_CLIENTS:
+                self._prune()
+            client = self._clients[client_id] = _ClientState()
+            if self.client_tokens_per_minute > 0:
+                client.bucket = TokenBucket(self.client_tokens_per_minute, self.clock)
+        return client
+
+    def _prune(self):
+        for client_id, client in list(self._clients.items()):
+            self._forget_if_idle(client_id, client)
+
+    def _forget_if_idle(self, client_id: str, client: _ClientState):
+        if not client.active and not client.waiting and (client.bucket is None or client.bucket.full):
+            self._clients.pop(client_id, None)
+
+    def _reject(self, client_id: str, status_code: int, reason: str, detail: str, retry_after: float) -> AdmissionRejected:
+        self._forget_if_idle(client_id, self._clients[client_id])
+        self._counters[f"rejected_{status_code}"] += 1
+        admission_rejections.inc(reason)
+        return AdmissionRejected(status_code, reason, detail, retry_after)
+
+    def _drain_estimate(self, queued: int, slots: int) -> float:
+        """Seconds until `queued` requests ahead have been served by `slots` concurrent slots."""
+        return self._service_seconds * (queued + 1) / max(1, slots)
+
+    def _can_start(self, client: _ClientState) -> bool:
+        return self._active < self.max_concurrent and client.active < self.max_concurrent_per_client
+
+    def _start(self, client_id: str, client: _ClientState, waited: float) -> AdmissionTicket:
+        self._active += 1
+        client.active += 1
+        self._counters["admitted"] += 1
+        return AdmissionTicket(client_id, self.clock(), waited)
+
+    def _dispatch(self):
+        """Hands free slots to queued requests, one client at a time in turn."""
+        skipped = 0
+        while self._turns and self._active < self.max_concurrent and skipped < len(self._turns):
+            client_id = self._turns.popleft()
+            client = self._clients[client_id]
+            if client.active >= self.max_concurrent_per_client:
+                self._turns.append(client_id)
+                skipped += 1
+                continue
+            skipped = 0
+            waiter = client.waiting.popleft()
+            self._queued -= 1
+            if client.waiting:
+                self._turns.append(client_id)
+            waiter.ticket = self._start(client_id, client, self.clock() - waiter.queued_at)
+            waiter.loop.call_soon_threadsafe(_wake, waiter.future)
+
+    def _dequeue(self, client_id: str, client: _ClientState, waiter: _Waiter):
+        client.waiting.remove(waiter)
+        self._queued -= 1
+        if not client.waiting:
+            self._turns.remove(client_id)
+
+    async def acquire(self, client_id: str) -> AdmissionTicket:
+        """Waits for a slot for one of `client_id`'s requests. Raises AdmissionRejected."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._client(client_id)
+            bucket = self._global_bucket()
+            if client.bucket is not None and client.bucket.level() <= 0:
+                raise self._reject(
+                    client_id, 429, "client_tokens", "Token rate limit exceeded for this client.", client.bucket.seconds_until_available()
+                )
+            if bucket is not None and bucket.level() <= 0:
+                raise self._reject(client_id, 503, "tokens", "The server is over its token rate limit.", bucket.seconds_until_available())
+            if not client.waiting and self._can_start(client):
+                return self._start(client_id, client, 0.0)
+            if len(client.waiting) >= self.max_queue_per_client:
+                raise self._reject(
+                    client_id, 429, "client_queue_full", "Too many requests from this client are in progress.",
+                    self._drain_estimate(len(client.waiting), self.max_concurrent_per_client),
+                )
+            if self._queued >= self.max_queue:
+                raise self._reject(
+                    client_id, 503, "queue_full", "The server is busy.", self._drain_estimate(self._queued, self.max_concurrent)
+                )
+            waiter = _Waiter(loop, loop.create_future(), self.clock())
+            client.waiting.append(waiter)
+            if len(client.waiting) == 1:
+                self._turns.append(client_id)
+            self._queued += 1
+            self._counters["queued"] += 1
+
+        try:
+            await asyncio.wait_for(waiter.future, self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                if waiter.ticket is None:
+                    self._dequeue(client_id, client, waiter)
+                    if isinstance(e, asyncio.CancelledError):
+                        self._forget_if_idle(client_id, client)
+                        raise
+                    self._counters["timeouts"] += 1
+                    admission_wait.observe(self.clock() - waiter.queued_at, "timeout")
+                    raise self._reject(
+                        client_id, 503, "queue_timeout", "The server is busy.", self._drain_estimate(self._queued, self.max_concurrent)
+                    ) from None
+            # The slot was granted just as the wait ended.
+            if isinstance(e, asyncio.CancelledError):
+                self.release(waiter.ticket)
+                raise
+        admission_wait.observe(waiter.ticket.waited, "admitted")
+        return waiter.ticket
+
+    def release(self, ticket: AdmissionTicket, tokens: int = 0):
+        """Frees the ticket's slot and charges the LLM tokens its request used."""
+        with self._lock:
+            client = self._clients[ticket.client_id]
+            client.active -= 1
+            self._active -= 1
+            self._service_seconds = 0.9 * self._service_seconds + 0.1 * (self.clock() - ticket.started_at)
+            if tokens:
+                if client.bucket is not None:
+                    client.bucket.charge(tokens)
+                bucket = self._global_bucket()
+                if bucket is not None:
+                    bucket.charge(tokens)
+            self._dispatch()
+            self._forget_if_idle(ticket.client_id, client)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                **self._counters,
+                "active": self._active,
+                "waiting": self._queued,
+                "clients": len(self._clients),
+                "max_concurrent": self.max_concurrent,
+            }
+
+    def clear(self):
+        """Forgets token budgets and counters. Requests in progress keep their slots."""
+        with self._lock:
+            for client_id, client in list(self._clients.items()):
+                client.bucket = None
+                if not client.active and not client.waiting:
+                    del self._clients[client_id]
+            self._bucket = None
+            self._counters = dict.fromkeys(self._counters, 0)
+
+
+def client_id_for(scope, header: str = ADMISSION_CLIENT_HEADER) -> str:
+    """The client a request counts against: the configured header's first value, or the peer address."""
+    if header:
+        name = header.lower().encode()
+        for key, value in scope["headers"]:
+            if key == name:
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class AdmissionControlMiddleware:
+    """
+    Puts POST requests to the given path patterns through an AdmissionController.
+    The slot is held until the last body chunk is sent, so streamed responses
+    count for as long as they stream, and the request's LLM tokens (from
+    TokenUsageMiddleware, which must run outside this one) are then charged to
+    its client. Rejections are answered with Retry-After before the body is read.
+    """
+
+    def __init__(self, app, controller: AdmissionController, paths: Iterable[str], client_header: str = ADMISSION_CLIENT_HEADER):
+        self.app = app
+        self.controller = controller
+        self.patterns = [re.compile(path) for path in paths]
+        self.client_header = client_header
+
+    def _applies(self, scope) -> bool:
+        return (
+            scope["type"] == "http" and scope["method"] == "POST" and self.controller.enabled
+            and any(pattern.fullmatch(scope["path"]) for pattern in self.patterns)
+        )
+
+    async def __call__(self, scope, receive, send):
+        if not self._applies(scope):
+            await self.app(scope, receive, send)
+            return
+        try:
+            ticket = await self.controller.acquire(client_id_for(scope, self.client_header))
+        except AdmissionRejected as e:
+            response = JSONResponse({"detail": e.detail}, status_code=e.status_code, headers={"Retry-After": str(e.retry_after)})
+            await response(scope, receive, send)
+            return
+        trace = current_trace.get()
+        if trace is not None and ticket.waited:
+            trace.add("admission_wait", ticket.waited)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            usage = current_request_usage.get()
+            self.controller.release(ticket, usage.prompt_tokens + usage.completion_tokens if usage else 0)
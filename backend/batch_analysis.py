@@ -0,0 +1,263 @@
+import asyncio
+import json
+import os
+from dataclasses import dataclass
+from itertools import groupby
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from document_cache import CachedDocument, DocumentView, join_pages
+from metrics import span
+from response_cache import ResponseCache, make_cache_key, normalize_text
+from retrieval import chunk_pages
+from token_budget import fit_text
+
+# Segments packed into one LLM call, and LLM calls in flight per batch request.
+BATCH_SEGMENTS_PER_CALL = int(os.getenv("BATCH_SEGMENTS_PER_CALL", "10"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_SEGMENTS = int(os.getenv("BATCH_MAX_SEGMENTS", "10000"))
+# Segments longer than this many tokens are truncated before being packed.
+BATCH_MAX_SEGMENT_TOKENS = int(os.getenv("BATCH_MAX_SEGMENT_TOKENS", "1000"))
+
+SEGMENTATION_RULES = ("paragraph", "page", "chunk")
+# Paragraphs shorter than this are merged with the next one on the same page.
+_MIN_PARAGRAPH_CHARS = 200
+_MAX_PARAGRAPH_CHARS = 2000
+
+
+@dataclass
+class Segment:
+    index: int
+    text: str
+    page: Optional[int] = None  # 1-based, for segments taken from an uploaded document
+
+
+@dataclass
+class BatchAnalysis:
+    """A per-segment analysis: what to ask for and the JSON fields each answer must have."""
+    name: str
+    instructions: str
+    fields: Dict[str, str]
+
+
+ANALYSES = {
+    "sentiment": BatchAnalysis(
+        name="analyze_sentiment",
+        instructions="Analyze the sentiment of each text segment below.",
+        fields={
+            "sentiment": 'one of "positive", "negative" or "neutral"',
+            "explanation": "one sentence explaining the reasoning",
+        },
+    ),
+    "misinformation": BatchAnalysis(
+        name="detect_misinformation",
+        instructions="Analyze each text segment below for potential misinformation.",
+        fields={
+            "likelihood": 'one of "low", "medium" or "high": how likely the segment is to be misinformation',
+            "claims": "a list of specific claims that might be inaccurate or misleading (may be empty)",
+            "assessment": "a brief assessment",
+        },
+    ),
+}
+
+
+def segments_from_texts(texts: Sequence[str]) -> List[Segment]:
+    return [Segment(i, text) for i, text in enumerate(texts) if text.strip()]
+
+
+def segment_pages(pages: Sequence[str], rule: str = "paragraph", first_page: int = 1) -> List[Segment]:
+    """
+    Splits document pages into segments by `rule`: "page" (one per page),
+    "chunk" (fixed-size chunks) or "paragraph" (blank-line separated, with
+    short paragraphs merged and long ones split). Segments never cross pages.
+    `pages[0]` is numbered `first_page`, e.g. for a page range of a document.
+    """
+    if rule not in SEGMENTATION_RULES:
+        raise ValueError(f"Unknown segmentation rule: {rule!r}. Expected one of {', '.join(SEGMENTATION_RULES)}.")
+    if rule == "chunk":
+        return [
+            Segment(i, chunk.text, chunk.page + first_page - 1)
+            for i, chunk in enumerate(chunk_pages(pages, _MAX_PARAGRAPH_CHARS, 0))
+        ]
+    if rule == "paragraph":
+        if not pages:
+            return []
+        # Split like a stored document, so pasted pages and uploads agree.
+        document = CachedDocument("", "", *join_pages(pages))
+        paragraphs = document.view().page_paragraphs()
+        return _paragraph_segments((page + first_page - 1, paragraph) for page, paragraph in paragraphs)
+    segments: List[Segment] = []
+    for page_number, page in enumerate(pages, start=first_page):
+        if page.strip():
+            segments.append(Segment(len(segments), page.strip(), page_number))
+    return segments
+
+
+def segment_document(view: DocumentView, rule: str = "paragraph") -> List[Segment]:
+    """
+    segment_pages for a page range of a stored document. Paragraph segments
+    are built from the document's paragraph offsets, the same paragraphs that
+    its num_paragraphs counts.
+    """
+    if rule != "paragraph":
+        return segment_pages(view.pages(), rule, view.first_page)
+    return _paragraph_segments(view.page_paragraphs())
+
+
+def _paragraph_segments(page_paragraphs: Iterable[Tuple[int, str]]) -> List[Segment]:
+    segments: List[Segment] = []
+    for page_number, paragraphs in groupby(page_paragraphs, key=lambda item: item[0]):
+        pieces, pending = [], ""
+        for _, paragraph in paragraphs:
+            paragraph = " ".join(paragraph.split())
+            if not paragraph:
+                continue
+            pending = f"{pending} {paragraph}".strip()
+            if len(pending) >= _MIN_PARAGRAPH_CHARS:
+                pieces.append(pending)
+                pending = ""
+        if pending:
+            pieces.append(pending)
+        # Pages without blank lines come out as one paragraph; chunk those.
+        for piece in pieces:
+            for chunk in chunk_pages([piece], _MAX_PARAGRAPH_CHARS, 0):
+                if chunk.text:
+                    segments.append(Segment(len(segments), chunk.text, page_number))
+    return segments
+
+
+def build_batch_prompt(analysis: BatchAnalysis, segments: Sequence[Segment]) -> str:
+    fields = "\n".join(f'- "{name}": {description}' for name, description in analysis.fields.items())
+    body = "\n\n".join(f"[{segment.index}] {segment.text}" for segment in segments)
+    return (
+        f"{analysis.instructions} Each segment starts with its id in square brackets.\n\n"
+        f"{body}\n\n"
+        "Respond with only a JSON array containing one object per segment, in any order. "
+        'Each object must have an "id" field with the segment id and these fields:\n'
+        f"{fields}"
+    )
+
+
+def parse_batch_response(text: str, ids: Sequence[int]) -> Dict[int, dict]:
+    """Extracts {id: result} from the model's JSON array, ignoring ids that weren't asked for."""
+    start, end = text.find("["), text.rfind("]")
+    if start == -1 or end <= start:
+        raise ValueError("Model response does not contain a JSON array.")
+    items = json.loads(text[start:end + 1])
+    wanted = set(ids)
+    results = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        try:
+            item_id = int(item.pop("id"))
+        except (KeyError, TypeError, ValueError):
+            continue
+        if item_id in wanted:
+            results[item_id] = item
+    return results
+
+
+class BatchAnalyzer:
+    """
+    Runs a per-segment analysis over many segments: segments are packed into
+    prompts of up to `segments_per_call` (and the token budget), the prompts
+    run concurrently, and results are yielded as each call finishes. Each
+    segment's result is cached on its own, so overlapping batches only pay for
+    new segments.
+    """
+
+    def __init__(
+        self,
+        llm_call: Callable[[str, str], Awaitable[str]],
+        cache: ResponseCache,
+        segments_per_call: int = BATCH_SEGMENTS_PER_CALL,
+        concurrency: int = BATCH_CONCURRENCY,
+        max_segment_tokens: int = BATCH_MAX_SEGMENT_TOKENS,
+    ):
+        self.llm_call = llm_call
+        self.cache = cache
+        self.segments_per_call = max(1, segments_per_call)
+        self.concurrency = max(1, concurrency)
+        self.max_segment_tokens = max_segment_tokens
+
+    def _cache_key(self, analysis: BatchAnalysis, model_name: str, segment: Segment) -> str:
+        return make_cache_key(model_name, f"{analysis.name}_item", text=normalize_text(segment.text))
+
+    def _pack(self, segments: Sequence[Tuple[Segment, int]], max_prompt_tokens: int) -> List[List[Segment]]:
+        """Groups (segment, token count) pairs into batches that fit `max_prompt_tokens`."""
+        batches: List[List[Segment]] = []
+        tokens = 0
+        for segment, segment_tokens in segments:
+            if batches and len(batches[-1]) < self.segments_per_call and tokens + segment_tokens <= max_prompt_tokens:
+                batches[-1].append(segment)
+                tokens += segment_tokens
+            else:
+                batches.append([segment])
+                tokens = segment_tokens
+        return batches
+
+    async def _run_batch(self, analysis: BatchAnalysis, model_name: str, batch: List[Segment]) -> List[dict]:
+        cache_endpoint = f"{analysis.name}_batch"
+        try:
+            parsed = parse_batch_response(await self.llm_call(build_batch_prompt(analysis, batch), model_name), [s.index for s in batch])
+        except Exception as e:
+            detail = getattr(e, "detail", None) or str(e)
+            return [_result(segment, error=f"Batch analysis failed: {detail}") for segment in batch]
+
+        results = []
+        for segment in batch:
+            item = parsed.get(segment.index)
+            if item is None:
+                results.append(_result(segment, error="The model returned no result for this segment."))
+                continue
+            await self.cache.store(cache_endpoint, self._cache_key(analysis, model_name, segment), json.dumps(item))
+            results.append(_result(segment, result=item))
+        return results
+
+    async def analyze(
+        self, analysis: BatchAnalysis, segments: Sequence[Segment], model_name: str, max_prompt_tokens: int,
+    ) -> AsyncIterator[dict]:
+        """Yields one result dict per segment (cached ones first), in completion order."""
+        cache_endpoint = f"{analysis.name}_batch"
+        # Each segment is tokenized once, off the event loop: a whole book's paragraphs add up.
+        def fit_segments():
+            with span("token_count", model_name):
+                return [fit_text(segment.text, self.max_segment_tokens) for segment in segments]
+
+        fitted = await asyncio.to_thread(fit_segments)
+        pending: List[Tuple[Segment, int]] = []
+        for segment, fit in zip(segments, fitted):
+            segment = Segment(segment.index, fit.text, segment.page)
+            cached = await self.cache.lookup(cache_endpoint, self._cache_key(analysis, model_name, segment))
+            if cached is not None:
+                yield _result(segment, result=json.loads(cached), cached=True)
+            else:
+                pending.append((segment, fit.tokens))
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(batch: List[Segment]) -> List[dict]:
+            async with semaphore:
+                return await self._run_batch(analysis, model_name, batch)
+
+        tasks = [asyncio.ensure_future(run(batch)) for batch in self._pack(pending, max_prompt_tokens)]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                for result in await finished:
+                    yield result
+        finally:
+            # The client went away: don't keep paying for calls nobody will read.
+            for task in tasks:
+                task.cancel()
+
+
+def _result(segment: Segment, result: Optional[dict] = None, error: Optional[str] = None, cached: bool = False) -> dict:
+    item = {"index": segment.index}
+    if segment.page is not None:
+        item["page"] = segment.page
+    if error is not None:
+        item["error"] = error
+    else:
+        item["result"] = result
+        item["cached"] = cached
+    return item
@@ -0,0 +1,135 @@
+"""
+Load test for admission control: one heavy client floods /explain_term/ with
+many concurrent requests while several light clients send a few each, against
+the fake provider. Run with admission control off and on, it shows how many
+calls reach the provider at once, what each kind of client gets back
+(200 / 429 / 503) and the light clients' latency while the heavy one floods.
+
+Clients are told apart by an X-Client-ID header (ADMISSION_CLIENT_HEADER).
+
+Run from the backend directory:
+    python -m benchmarks.bench_admission --heavy-concurrency 64 --light-clients 4
+"""
+import argparse
+import asyncio
+import sys
+import os
+import time
+from collections import Counter
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+# Read when admission.py is imported.
+os.environ.setdefault("ADMISSION_CLIENT_HEADER", "X-Client-ID")
+
+import httpx
+
+import llm_client
+import main
+from fake_llm import FakeProvider
+
+
+class PeakTracker:
+    """Wraps a provider to record the most calls it had in flight at once."""
+
+    def __init__(self, provider: FakeProvider):
+        self.provider = provider
+        self.in_flight = 0
+        self.peak = 0
+
+    async def acompletion(self, *args, **kwargs):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            return await self.provider.acompletion(*args, **kwargs)
+        finally:
+            self.in_flight -= 1
+
+
+def _percentile(values, fraction):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run_load(args, model_name: str) -> dict:
+    transport = httpx.ASGITransport(app=main.app)
+    statuses = {"heavy": Counter(), "light": Counter()}
+    latencies = {"heavy": [], "light": []}
+    counter = iter(range(10**9))
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def request(kind: str, client_id: str):
+            start = time.perf_counter()
+            # A distinct term per request, so the response cache never answers.
+            response = await client.post(
+                "/explain_term/", data={"term": f"term {next(counter)}", "model_name": model_name},
+                headers={"X-Client-ID": client_id},
+            )
+            statuses[kind][response.status_code] += 1
+            if response.status_code == 200:
+                latencies[kind].append(time.perf_counter() - start)
+
+        async def heavy_worker():
+            for _ in range(args.heavy_requests):
+                await request("heavy", "heavy")
+
+        async def light_client(i: int):
+            await asyncio.sleep(args.light_delay)  # arrive once the flood is underway
+            for _ in range(args.light_requests):
+                await request("light", f"light-{i}")
+
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(heavy_worker() for _ in range(args.heavy_concurrency)),
+            *(light_client(i) for i in range(args.light_clients)),
+        )
+        elapsed = time.perf_counter() - start
+    return {"statuses": statuses, "latencies": latencies, "elapsed": elapsed}
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--heavy-concurrency", type=int, default=64, help="Concurrent requests from the heavy client.")
+    parser.add_argument("--heavy-requests", type=int, default=4, help="Requests per heavy worker.")
+    parser.add_argument("--light-clients", type=int, default=4)
+    parser.add_argument("--light-requests", type=int, default=3, help="Sequential requests per light client.")
+    parser.add_argument("--light-delay", type=float, default=0.1)
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake provider latency in seconds.")
+    parser.add_argument("--max-concurrent", type=int, default=8)
+    parser.add_argument("--max-concurrent-per-client", type=int, default=4)
+    parser.add_argument("--max-queue-per-client", type=int, default=8)
+    parser.add_argument("--queue-timeout", type=float, default=5.0)
+    parser.add_argument("--model", default="fake/bench")
+    args = parser.parse_args()
+
+    controller = main.admission_controller
+    print(
+        f"heavy client: {args.heavy_concurrency} concurrent x {args.heavy_requests} requests; "
+        f"{args.light_clients} light clients x {args.light_requests} requests; provider latency {args.latency * 1000:.0f} ms"
+    )
+    print(f"{'admission':<10}{'peak in flight':>15}{'heavy 200/429/503':>20}{'light 200/429/503':>20}{'light p50 ms':>14}{'light p95 ms':>14}{'seconds':>9}")
+    settings = {
+        "off": {"max_concurrent": 0},
+        "on": {
+            "max_concurrent": args.max_concurrent,
+            "max_concurrent_per_client": args.max_concurrent_per_client,
+            "max_queue_per_client": args.max_queue_per_client,
+            "queue_timeout": args.queue_timeout,
+        },
+    }
+    for name, values in settings.items():
+        tracker = PeakTracker(FakeProvider(latency=args.latency, jitter=0, error_rate=0))
+        with patch.object(llm_client.fake_llm, "fake_provider", tracker), patch.multiple(controller, **values):
+            result = asyncio.run(run_load(args, args.model))
+        statuses, light = result["statuses"], result["latencies"]["light"]
+        counts = {kind: "/".join(str(statuses[kind][code]) for code in (200, 429, 503)) for kind in statuses}
+        print(
+            f"{name:<10}{tracker.peak:>15}{counts['heavy']:>20}{counts['light']:>20}"
+            f"{_percentile(light, 0.5) * 1000:>14.0f}{_percentile(light, 0.95) * 1000:>14.0f}{result['elapsed']:>9.1f}"
+        )
+    print(controller.stats())
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,97 @@
+"""
+Segments/sec of /analyze_sentiment/batch/ against one /analyze_sentiment/
+request per segment, with `acompletion` stubbed. The stub's latency is a fixed
+per-call cost plus a per-segment cost, so packing several segments into one
+call isn't free.
+
+Run from the backend directory:
+    python -m benchmarks.bench_batch_analysis --segments 200 --latency 0.2 --per-segment 0.02
+"""
+import argparse
+import asyncio
+import json
+import re
+import sys
+import os
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import httpx
+
+import llm_client
+import main
+
+
+def stub_completion(latency: float, per_segment: float):
+    async def _completion(model, messages, **kwargs):
+        prompt = messages[-1]["content"]
+        ids = [int(i) for i in re.findall(r"^\[(\d+)\]", prompt, re.MULTILINE)]
+        await asyncio.sleep(latency + per_segment * max(1, len(ids)))
+        if ids:
+            content = json.dumps([{"id": i, "sentiment": "neutral", "explanation": "stub"} for i in ids])
+        else:
+            content = "Neutral: stub."
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+    return _completion
+
+
+async def run_single(segments, model_name: str, clients: int) -> float:
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        queue = list(segments)
+
+        async def worker():
+            while queue:
+                segment = queue.pop()
+                response = await client.post("/analyze_sentiment/", data={"text_segment": segment, "model_name": model_name})
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        return len(segments) / (time.perf_counter() - start)
+
+
+async def run_batch(segments, model_name: str) -> float:
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        response = await client.post(
+            "/analyze_sentiment/batch/", data={"text_segments": segments, "model_name": model_name}
+        )
+        response.raise_for_status()
+        summary = json.loads(response.text.splitlines()[-1])
+        assert summary["errors"] == 0, summary
+        return len(segments) / (time.perf_counter() - start)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--segments", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.2, help="Stubbed fixed latency per call in seconds.")
+    parser.add_argument("--per-segment", type=float, default=0.02, help="Stubbed extra latency per segment in a call.")
+    parser.add_argument("--clients", type=int, default=4, help="Concurrent clients for the single-segment endpoint.")
+    parser.add_argument("--model", default="gemini/gemini-2.0-flash")
+    args = parser.parse_args()
+
+    segments = [f"Paragraph {i}: the harvest was {'good' if i % 2 else 'poor'} this year." for i in range(args.segments)]
+    print(f"{args.segments} segments, stub latency {args.latency * 1000:.0f} ms + {args.per_segment * 1000:.0f} ms/segment")
+    print(f"{'mode':>22}{'segments/s':>12}{'speedup':>10}")
+    with patch.object(llm_client, "acompletion", stub_completion(args.latency, args.per_segment)):
+        runs = [
+            ("single, sequential", lambda: run_single(segments, args.model, 1)),
+            (f"single, {args.clients} clients", lambda: run_single(segments, args.model, args.clients)),
+            ("batch", lambda: run_batch(segments, args.model)),
+        ]
+        baseline = None
+        for label, run in runs:
+            main.response_cache.clear()  # every mode starts cold
+            throughput = asyncio.run(run())
+            baseline = baseline or throughput
+            print(f"{label:>22}{throughput:>12.1f}{throughput / baseline:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main_cli()
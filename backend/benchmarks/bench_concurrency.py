@@ -0,0 +1,67 @@
+"""
+Load test for the async LLM path: N concurrent clients hit /explain_term/
+against a stubbed `acompletion` with a fixed latency. Throughput should grow
+with the number of clients until the provider's concurrency cap is reached.
+
+Run from the backend directory:
+    python -m benchmarks.bench_concurrency --clients 1 2 4 8 16 --requests-per-client 5
+"""
+import argparse
+import asyncio
+import sys
+import os
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import httpx
+
+import llm_client
+import main
+
+
+def stub_completion(latency: float):
+    async def _completion(model, messages, **kwargs):
+        await asyncio.sleep(latency)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="stub"))])
+    return _completion
+
+
+async def run_clients(num_clients: int, requests_per_client: int, model_name: str) -> float:
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker():
+            for _ in range(requests_per_client):
+                response = await client.post("/explain_term/", data={"term": "entropy", "model_name": model_name})
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(num_clients)))
+        elapsed = time.perf_counter() - start
+    return num_clients * requests_per_client / elapsed
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--requests-per-client", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.2, help="Stubbed completion latency in seconds.")
+    parser.add_argument("--model", default="gemini/gemini-2.0-flash")
+    args = parser.parse_args()
+
+    provider = llm_client.provider_for_model(args.model)
+    cap = llm_client.provider_limiter.limit_for(provider)
+    print(f"Model {args.model} -> provider '{provider}', concurrency cap {cap}, stub latency {args.latency * 1000:.0f} ms")
+    print(f"{'clients':>8}{'req/s':>10}{'speedup':>10}")
+    baseline = None
+    with patch.object(llm_client, "acompletion", stub_completion(args.latency)):
+        for num_clients in args.clients:
+            throughput = asyncio.run(run_clients(num_clients, args.requests_per_client, args.model))
+            baseline = baseline or throughput
+            print(f"{num_clients:>8}{throughput:>10.1f}{throughput / baseline:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,124 @@
+"""
+Memory held by a corpus of extracted books in different in-memory layouts,
+and the cost of reading a page range from each:
+
+- dict of strings: {file_id: text}, the whole book as one string and no page boundaries
+- dict of page strings: {file_id: [page, ...]}, one string per page
+- dict of paragraph strings: {file_id: [[paragraph, ...], ...]}, one string per paragraph
+- buffer + offsets: CachedDocument, one string per book plus page offsets and a
+  compact array of paragraph offsets, read through DocumentView
+
+Books are synthetic, with paragraphs separated by blank lines. Memory is the
+tracemalloc total retained once each corpus is built.
+
+Run from the backend directory:
+    python -m benchmarks.bench_document_memory --books 20 --pages 400
+"""
+import argparse
+import gc
+import sys
+import os
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.synthetic_pdf import book_pages
+from document_cache import CachedDocument, join_pages
+
+
+def make_book(num_pages: int, words_per_page: int, paragraphs_per_page: int, seed: int) -> List[str]:
+    pages = []
+    for page in book_pages(num_pages, words_per_page, seed):
+        words = page.split()
+        step = max(1, len(words) // max(1, paragraphs_per_page))
+        pages.append("\n\n".join(" ".join(words[i:i + step]) for i in range(0, len(words), step)))
+    return pages
+
+
+def _dict_of_strings(pages: List[str]):
+    return "\n".join(pages)
+
+
+def _dict_of_pages(pages: List[str]):
+    # Copies, so the corpus doesn't share strings with the generator's list.
+    return ["".join(page) for page in pages]
+
+
+def _dict_of_paragraphs(pages: List[str]):
+    return [page.split("\n\n") for page in pages]
+
+
+def _buffer_offsets(pages: List[str]):
+    text, offsets = join_pages(pages)
+    document = CachedDocument("book", "book.pdf", text, offsets)
+    document.paragraph_offsets()
+    return document
+
+
+LAYOUTS: Dict[str, Callable[[List[str]], object]] = {
+    "dict of strings": _dict_of_strings,
+    "dict of page strings": _dict_of_pages,
+    "dict of paragraph strings": _dict_of_paragraphs,
+    "buffer + offsets": _buffer_offsets,
+}
+
+
+def _page_range_text(layout: str, book, first: int, last: int) -> str:
+    """Pages first..last (1-based, inclusive) as one string, the way each layout has to produce it."""
+    if layout == "dict of page strings":
+        return "\n".join(book[first - 1:last])
+    if layout == "dict of paragraph strings":
+        return "\n".join("\n\n".join(page) for page in book[first - 1:last])
+    return book.view(first, last).text
+
+
+def measure(layout: str, args) -> dict:
+    gc.collect()
+    tracemalloc.start()
+    corpus = {}
+    for i in range(args.books):
+        pages = make_book(args.pages, args.words_per_page, args.paragraphs_per_page, seed=i)
+        corpus[f"book-{i}"] = LAYOUTS[layout](pages)
+        del pages
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    range_ms = None
+    if layout != "dict of strings":  # no page boundaries to select a range by
+        first = max(1, args.pages // 2 - args.range_pages // 2)
+        last = min(args.pages, first + args.range_pages - 1)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for book in corpus.values():
+                _page_range_text(layout, book, first, last)
+        range_ms = (time.perf_counter() - start) * 1000 / (args.repeat * len(corpus))
+    return {"layout": layout, "retained_mb": retained / 2**20, "range_ms": range_ms}
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--words-per-page", type=int, default=300)
+    parser.add_argument("--paragraphs-per-page", type=int, default=4)
+    parser.add_argument("--range-pages", type=int, default=20, help="Pages read per page-range access.")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    results = [measure(layout, args) for layout in LAYOUTS]
+    print(f"{args.books} books x {args.pages} pages x {args.words_per_page} words, {args.paragraphs_per_page} paragraphs per page")
+    print(f"{'layout':<28}{'retained MB':>12}{'vs dict of strings':>20}{f'{args.range_pages}-page range ms':>22}")
+    baseline = results[0]["retained_mb"]
+    for result in results:
+        range_ms = "n/a" if result["range_ms"] is None else f"{result['range_ms']:.3f}"
+        print(
+            f"{result['layout']:<28}{result['retained_mb']:>12.1f}"
+            f"{result['retained_mb'] / baseline:>19.2f}x{range_ms:>22}"
+        )
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,51 @@
+"""
+Measures PDF text extraction throughput (pages/sec) against the number of
+process-pool workers, on a generated multi-hundred-page PDF.
+
+Run from the backend directory:
+    python -m benchmarks.bench_extraction --pages 600 --workers 1 2 4 8
+"""
+import argparse
+import multiprocessing
+import sys
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.synthetic_pdf import make_book
+from pdf_extraction import extract_pages
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=600)
+    parser.add_argument("--words-per-page", type=int, default=400)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--pages-per-task", type=int, default=16)
+    args = parser.parse_args()
+
+    pdf_bytes = make_book(args.pages, args.words_per_page)
+    print(f"Synthetic PDF: {args.pages} pages, {len(pdf_bytes) / 1e6:.1f} MB, {os.cpu_count()} CPUs")
+
+    start = time.perf_counter()
+    serial_pages = extract_pages(pdf_bytes)
+    serial = args.pages / (time.perf_counter() - start)
+    print(f"{'workers':>8}{'pages/s':>10}{'speedup':>10}")
+    print(f"{'serial':>8}{serial:>10.1f}{1.0:>9.1f}x")
+
+    for workers in args.workers:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            # Warm the pool so process start-up isn't counted as extraction time.
+            list(pool.map(abs, range(workers)))
+            start = time.perf_counter()
+            pages = extract_pages(pdf_bytes, pool, args.pages_per_task)
+            rate = args.pages / (time.perf_counter() - start)
+        assert pages == serial_pages, "parallel extraction must preserve page order"
+        print(f"{workers:>8}{rate:>10.1f}{rate / serial:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main_cli()
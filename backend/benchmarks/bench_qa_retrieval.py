@@ -0,0 +1,125 @@
+"""
+Compares prompt size and end-to-end /qa/ latency of retrieval (top-k chunks)
+against the full-text prompt, using a mocked `acompletion` whose latency grows
+with the prompt length the way a real provider's does. The response cache is
+off so every question reaches the mock, and prompt sizes are those of the
+prompts it receives, after any trimming to the model's context window.
+
+Run from the backend directory:
+    python -m benchmarks.bench_qa_retrieval --pages 300
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import os
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi.testclient import TestClient
+
+import llm_client
+import main
+
+BENCH_MODEL = "bench-model"
+
+WORDS = (
+    "library river economy theory window garden history signal market planet "
+    "engine language memory forest method circuit harbor culture climate vector"
+).split()
+
+QUESTIONS = [
+    "What was the name of the lighthouse keeper?",
+    "Which year did the harbor flood?",
+    "What colour was the signal lamp?",
+]
+
+NEEDLES = [
+    "The lighthouse keeper was named Ottoline Varga.",
+    "The harbor flood happened in the year 1887.",
+    "The signal lamp was painted a deep green colour.",
+]
+
+
+def make_pages(num_pages: int, words_per_page: int, seed: int = 0):
+    rng = random.Random(seed)
+    pages = [" ".join(rng.choice(WORDS) for _ in range(words_per_page)) for _ in range(num_pages)]
+    for needle in NEEDLES:
+        page = rng.randrange(num_pages)
+        pages[page] += " " + needle
+    return pages
+
+
+def fake_completion(base_latency: float, chars_per_second: float, prompt_sizes: list):
+    async def _completion(model, messages, **kwargs):
+        prompt_chars = sum(len(m["content"]) for m in messages)
+        prompt_sizes.append(prompt_chars)
+        await asyncio.sleep(base_latency + prompt_chars / chars_per_second)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="mock answer"))])
+    return _completion
+
+
+def run(top_k: int, client: TestClient, file_id: str, repeats: int, args):
+    prompt_sizes, prompt_tokens, latencies = [], [], []
+    completion = fake_completion(args.base_latency, args.chars_per_second, prompt_sizes)
+    with patch.object(main, "QA_TOP_K", top_k), patch.object(llm_client, "acompletion", completion):
+        for _ in range(repeats):
+            for question in QUESTIONS:
+                start = time.perf_counter()
+                response = client.post("/qa/", data={"file_id": file_id, "query": question, "model_name": BENCH_MODEL})
+                latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+                prompt_tokens.append(int(response.headers["X-Prompt-Tokens"]))
+    return {
+        "mean_prompt_chars": statistics.mean(prompt_sizes),
+        "mean_prompt_tokens": statistics.mean(prompt_tokens),
+        "mean_latency_ms": statistics.mean(latencies) * 1000,
+        "max_latency_ms": max(latencies) * 1000,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--words-per-page", type=int, default=400)
+    parser.add_argument("--top-k", type=int, default=main.QA_TOP_K or 4)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--base-latency", type=float, default=0.05, help="Fixed mock LLM latency in seconds.")
+    parser.add_argument("--chars-per-second", type=float, default=2_000_000, help="Mock prompt processing speed.")
+    parser.add_argument(
+        "--context-window", type=int, default=1_048_576,
+        help="Context window of the mock model; the default fits the full text of a 300-page book.",
+    )
+    args = parser.parse_args()
+
+    file_id = "bench.pdf"
+    pages = make_pages(args.pages, args.words_per_page)
+    start = time.perf_counter()
+    main.store_document(file_id, pages)
+    index_ms = (time.perf_counter() - start) * 1000
+
+    client = TestClient(main.app)
+    context_windows = {**llm_client.MODELS_CONFIG.get("context_windows", {}), BENCH_MODEL: args.context_window}
+    with patch.dict(llm_client.MODELS_CONFIG, {"context_windows": context_windows}), \
+         patch.object(main.response_cache, "backend", None):
+        full = run(0, client, file_id, args.repeats, args)
+        retrieval = run(args.top_k, client, file_id, args.repeats, args)
+
+    document = main.document_store.get(file_id)
+    print(f"Document: {args.pages} pages, {len(document.text):,} chars, "
+          f"{len(document.index)} chunks (indexed in {index_ms:.0f} ms)")
+    print(f"{'mode':<16}{'prompt chars':>14}{'prompt tokens':>15}{'mean ms':>10}{'max ms':>10}")
+    for name, result in (("full text", full), (f"top-{args.top_k} chunks", retrieval)):
+        print(
+            f"{name:<16}{result['mean_prompt_chars']:>14,.0f}{result['mean_prompt_tokens']:>15,.0f}"
+            f"{result['mean_latency_ms']:>10.1f}{result['max_latency_ms']:>10.1f}"
+        )
+    print(f"Prompt size reduction: {full['mean_prompt_chars'] / retrieval['mean_prompt_chars']:.1f}x")
+
+
+if __name__ == "__main__":
+    main_cli()
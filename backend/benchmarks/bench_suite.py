@@ -0,0 +1,344 @@
+"""
+Offline benchmark suite. Runs repeatable scenarios (upload, Q&A, summarize,
+batch sentiment / misinformation) against the API in-process, with every LLM
+call served by the deterministic fake provider (fake_llm.py), and reports
+p50/p95 latency, throughput and peak memory per scenario as JSON. Pass an
+earlier report as --baseline to compare runs; --fail-on-regression exits
+non-zero when a scenario got slower than --threshold.
+
+Every request comes from the same in-process client, so admission control
+(admission.py) is off unless --with-admission is passed. With it, requests
+beyond ADMISSION_MAX_CONCURRENT_PER_CLIENT + ADMISSION_MAX_QUEUE_PER_CLIENT
+in flight (12 by default) are turned away with a 429 and reported as errors.
+
+Run from the backend directory:
+    python -m benchmarks.bench_suite --pages 300 --requests 50 --concurrency 8 --output bench.json
+    python -m benchmarks.bench_suite --baseline bench.json --fail-on-regression
+"""
+import argparse
+import asyncio
+import json
+import math
+import platform
+import statistics
+import sys
+import os
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import httpx
+
+from benchmarks.synthetic_pdf import book_pages, make_book
+
+SCENARIOS = ("upload", "qa", "summarize", "batch_sentiment", "batch_misinformation")
+BENCH_FILE_ID = "bench-book"
+
+QUESTIONS = [
+    "What does the book say about the river economy?",
+    "How is the theory of memory described?",
+    "Which chapter covers the harbor culture?",
+    "What signal does the market send?",
+]
+SUMMARY_LENGTHS = ["Short", "Medium", "Comprehensive"]
+
+
+@dataclass
+class SuiteConfig:
+    scenarios: List[str] = field(default_factory=lambda: list(SCENARIOS))
+    pages: int = 200
+    words_per_page: int = 300
+    upload_pages: int = 20
+    requests: int = 20
+    concurrency: int = 4
+    model: str = "fake/bench"
+    # Fake provider behaviour; see fake_llm.FakeProvider.
+    latency: float = 0.05
+    jitter: float = 0.0
+    prompt_tokens_per_second: float = 0.0
+    output_tokens_per_second: float = 0.0
+    reply_words: int = 0
+    seed: int = 0
+    # Serve repeated prompts from the response cache instead of measuring cold calls.
+    with_cache: bool = False
+    # Keep admission control on; all requests then count against one client's limits.
+    with_admission: bool = False
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile; 0 for no samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = math.ceil(pct / 100 * len(ordered))
+    return ordered[min(len(ordered), max(rank, 1)) - 1]
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except FileNotFoundError:
+        pass
+    return 0
+
+
+class PeakMemorySampler:
+    """
+    Samples this process's resident memory in a background thread while a
+    scenario runs. Falls back to the lifetime peak (ru_maxrss) without /proc.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_bytes = max(self.peak_bytes, _rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, _rss_bytes())
+        if not self.peak_bytes:
+            import resource
+            scale = 1 if platform.system() == "Darwin" else 1024
+            self.peak_bytes = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+async def run_scenario(
+    name: str, client: httpx.AsyncClient, request: Callable[[httpx.AsyncClient, int], Awaitable[Optional[int]]],
+    requests: int, concurrency: int,
+) -> dict:
+    """
+    Sends `requests` requests from `concurrency` concurrent workers. `request`
+    performs request number i and may return the prompt tokens it used.
+    """
+    latencies: List[float] = []
+    prompt_tokens: List[int] = []
+    errors = 0
+    next_request = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in next_request:
+            start = time.perf_counter()
+            try:
+                tokens = await request(client, i)
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            if tokens:
+                prompt_tokens.append(tokens)
+
+    with PeakMemorySampler() as memory:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+        elapsed = time.perf_counter() - start
+    return {
+        "scenario": name,
+        "requests": requests,
+        "errors": errors,
+        "concurrency": concurrency,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "mean_ms": statistics.mean(latencies) * 1000 if latencies else 0.0,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "mean_prompt_tokens": statistics.mean(prompt_tokens) if prompt_tokens else None,
+        "peak_rss_mb": memory.peak_bytes / (1024 * 1024),
+    }
+
+
+def _prompt_tokens(response: httpx.Response) -> Optional[int]:
+    response.raise_for_status()
+    value = response.headers.get("X-Prompt-Tokens")
+    return int(value) if value else None
+
+
+def scenario_requests(config: SuiteConfig) -> Dict[str, Callable[[httpx.AsyncClient, int], Awaitable[Optional[int]]]]:
+    async def upload(client: httpx.AsyncClient, i: int) -> None:
+        # A different seed per request, so every upload is a new document and is parsed.
+        pdf_bytes = make_book(config.upload_pages, config.words_per_page, seed=config.seed + 1000 + i)
+        response = await client.post("/upload_pdf/", files={"file": (f"bench-{i}.pdf", pdf_bytes, "application/pdf")})
+        response.raise_for_status()
+        job_id = response.json()["job_id"]
+        while job_id:
+            status = (await client.get(f"/upload_pdf/status/{job_id}")).json()
+            if status["status"] == "failed":
+                raise httpx.HTTPError(status["detail"])
+            if status["status"] == "done":
+                return None
+            await asyncio.sleep(0.01)
+
+    async def qa(client: httpx.AsyncClient, i: int) -> Optional[int]:
+        data = {"file_id": BENCH_FILE_ID, "query": QUESTIONS[i % len(QUESTIONS)], "model_name": config.model}
+        return _prompt_tokens(await client.post("/qa/", data=data))
+
+    async def summarize(client: httpx.AsyncClient, i: int) -> Optional[int]:
+        data = {
+            "file_id": BENCH_FILE_ID, "model_name": config.model,
+            "summary_length": SUMMARY_LENGTHS[i % len(SUMMARY_LENGTHS)], "mode": "auto",
+        }
+        return _prompt_tokens(await client.post("/summarize/", data=data))
+
+    def batch(path: str):
+        async def run(client: httpx.AsyncClient, i: int) -> None:
+            data = {"file_id": BENCH_FILE_ID, "model_name": config.model, "segmentation": "page"}
+            async with client.stream("POST", path, data=data) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if line and "error" in json.loads(line):
+                        raise httpx.HTTPError(f"Batch segment failed: {line}")
+            return None
+        return run
+
+    return {
+        "upload": upload,
+        "qa": qa,
+        "summarize": summarize,
+        "batch_sentiment": batch("/analyze_sentiment/batch/"),
+        "batch_misinformation": batch("/detect_misinformation/batch/"),
+    }
+
+
+async def _run_all(config: SuiteConfig) -> List[dict]:
+    import main
+
+    main.store_document(BENCH_FILE_ID, book_pages(config.pages, config.words_per_page, config.seed), "bench.pdf")
+    requests = scenario_requests(config)
+    results = []
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for name in config.scenarios:
+            results.append(await run_scenario(name, client, requests[name], config.requests, config.concurrency))
+    return results
+
+
+def run_suite(config: SuiteConfig) -> dict:
+    """Runs the configured scenarios and returns the JSON-serializable report."""
+    import llm_client
+    import main
+    from fake_llm import FakeProvider
+
+    unknown = set(config.scenarios) - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    provider = FakeProvider(
+        latency=config.latency, jitter=config.jitter, seed=config.seed,
+        prompt_tokens_per_second=config.prompt_tokens_per_second,
+        output_tokens_per_second=config.output_tokens_per_second, reply_words=config.reply_words,
+    )
+    with patch.object(llm_client.fake_llm, "fake_provider", provider), \
+         patch.object(main.response_cache, "backend", main.response_cache.backend if config.with_cache else None), \
+         patch.object(main.admission_controller, "max_concurrent",
+                      main.admission_controller.max_concurrent if config.with_admission else 0):
+        results = asyncio.run(_run_all(config))
+    return {
+        "config": asdict(config),
+        "python": platform.python_version(),
+        "llm_calls": provider.calls,
+        "scenarios": {result.pop("scenario"): result for result in results},
+    }
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> List[dict]:
+    """
+    Per-scenario ratios against `baseline` (current / baseline). A scenario
+    regressed when its p95 latency rose, or its throughput fell, by more than `threshold`.
+    """
+    rows = []
+    for name, current in report["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        row = {"scenario": name}
+        for metric in ("p50_ms", "p95_ms", "throughput_rps", "peak_rss_mb"):
+            row[metric] = current[metric] / previous[metric] if previous[metric] else None
+        row["regressed"] = bool(
+            (row["p95_ms"] and row["p95_ms"] > 1 + threshold)
+            or (row["throughput_rps"] and row["throughput_rps"] < 1 - threshold)
+        )
+        rows.append(row)
+    return rows
+
+
+def _isolate_state():
+    """Points the app's on-disk caches at a temporary directory unless they're configured."""
+    state_dir = tempfile.mkdtemp(prefix="bookai-bench-")
+    os.environ.setdefault("DOCUMENT_CACHE_DIR", os.path.join(state_dir, "documents"))
+    os.environ.setdefault("STORAGE_PATH", os.path.join(state_dir, "storage.sqlite3"))
+    os.environ.setdefault("RESPONSE_CACHE_PATH", os.path.join(state_dir, "responses.sqlite3"))
+
+
+def main_cli():
+    defaults = SuiteConfig()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--pages", type=int, default=defaults.pages, help="Pages of the document used by Q&A, summarize and batch.")
+    parser.add_argument("--words-per-page", type=int, default=defaults.words_per_page)
+    parser.add_argument("--upload-pages", type=int, default=defaults.upload_pages, help="Pages per uploaded PDF.")
+    parser.add_argument("--requests", type=int, default=defaults.requests, help="Requests per scenario.")
+    parser.add_argument("--concurrency", type=int, default=defaults.concurrency)
+    parser.add_argument("--model", default=defaults.model, help="A fake/<name> model; its context window sets prompt budgets.")
+    parser.add_argument("--latency", type=float, default=defaults.latency, help="Fake LLM base latency in seconds.")
+    parser.add_argument("--jitter", type=float, default=defaults.jitter, help="Extra random fake LLM latency, up to this many seconds.")
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=defaults.prompt_tokens_per_second)
+    parser.add_argument("--output-tokens-per-second", type=float, default=defaults.output_tokens_per_second)
+    parser.add_argument("--reply-words", type=int, default=defaults.reply_words)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--with-cache", action="store_true", help="Leave the LLM response cache on.")
+    parser.add_argument(
+        "--with-admission", action="store_true",
+        help="Leave admission control on. All requests share one client, so concurrency above the "
+             "per-client concurrent + queued limits (12 by default) gets 429s, reported as errors.",
+    )
+    parser.add_argument("--output", help="Write the JSON report here as well as to stdout.")
+    parser.add_argument("--baseline", help="An earlier JSON report to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative change that counts as a regression.")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    _isolate_state()
+    config = SuiteConfig(
+        scenarios=args.scenarios, pages=args.pages, words_per_page=args.words_per_page,
+        upload_pages=args.upload_pages, requests=args.requests, concurrency=args.concurrency,
+        model=args.model, latency=args.latency, jitter=args.jitter,
+        prompt_tokens_per_second=args.prompt_tokens_per_second,
+        output_tokens_per_second=args.output_tokens_per_second,
+        reply_words=args.reply_words, seed=args.seed, with_cache=args.with_cache,
+        with_admission=args.with_admission,
+    )
+    report = run_suite(config)
+    regressed = False
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            report["comparison"] = compare(report, json.load(baseline_file), args.threshold)
+        regressed = any(row["regressed"] for row in report["comparison"])
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(text + "\n")
+    if regressed and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
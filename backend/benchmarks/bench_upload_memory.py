@@ -0,0 +1,144 @@
+"""
+Peak resident memory of the API server while it ingests one large PDF. A
+uvicorn server is started in a subprocess, a synthetic scanned-style book is
+streamed to /upload_pdf/ from disk, and the server (plus its extraction worker
+processes) is sampled through /proc until the job finishes. Linux only.
+
+Run from the backend directory:
+    python -m benchmarks.bench_upload_memory --size-mb 300 --pages 600
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import httpx
+
+from benchmarks.synthetic_pdf import make_book
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _status_kb(pid: int, field: str) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except FileNotFoundError:
+        pass
+    return 0
+
+
+def _descendants(pid: int):
+    children = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                children.extend(int(child) for child in f.read().split())
+    except FileNotFoundError:
+        return []
+    return children + [grandchild for child in children for grandchild in _descendants(child)]
+
+
+class RssSampler(threading.Thread):
+    """Samples the RSS of a process and of the process plus its descendants."""
+
+    def __init__(self, pid: int, interval: float = 0.02):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak_server_kb = 0
+        self.peak_total_kb = 0
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            server = _status_kb(self.pid, "VmRSS")
+            total = server + sum(_status_kb(child, "VmRSS") for child in _descendants(self.pid))
+            self.peak_server_kb = max(self.peak_server_kb, server)
+            self.peak_total_kb = max(self.peak_total_kb, total)
+            time.sleep(self.interval)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=300, help="Approximate PDF size.")
+    parser.add_argument("--pages", type=int, default=600)
+    parser.add_argument("--workers", type=int, default=2, help="PDF_EXTRACTION_WORKERS for the server.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = os.path.join(tmp, "book.pdf")
+        image_bytes = max(0, args.size_mb * 1024 * 1024 // args.pages)
+        with open(pdf_path, "wb") as pdf_file:
+            pdf_file.write(make_book(args.pages, words_per_page=200, image_bytes_per_page=image_bytes))
+        pdf_size = os.path.getsize(pdf_path)
+
+        port = _free_port()
+        env = {
+            **os.environ,
+            "DOCUMENT_CACHE_DIR": os.path.join(tmp, "documents"),
+            "RESPONSE_CACHE_BACKEND": "none",
+            "PDF_EXTRACTION_WORKERS": str(args.workers),
+            "LITELLM_LOCAL_MODEL_COST_MAP": "True",
+        }
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env,
+        )
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            for _ in range(200):
+                try:
+                    httpx.get(base_url + "/", timeout=1)
+                    break
+                except httpx.TransportError:
+                    time.sleep(0.1)
+            idle_kb = _status_kb(server.pid, "VmRSS")
+
+            sampler = RssSampler(server.pid)
+            sampler.start()
+            start = time.perf_counter()
+            with open(pdf_path, "rb") as pdf_file:
+                response = httpx.post(
+                    base_url + "/upload_pdf/", files={"file": ("book.pdf", pdf_file, "application/pdf")}, timeout=None
+                )
+            response.raise_for_status()
+            upload_seconds = time.perf_counter() - start
+            job_id = response.json()["job_id"]
+            status = {"status": "processing"}
+            while job_id and status["status"] == "processing":
+                time.sleep(0.1)
+                status = httpx.get(f"{base_url}/upload_pdf/status/{job_id}").json()
+            total_seconds = time.perf_counter() - start
+            sampler.stop()
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f"PDF: {pdf_size / 2**20:.0f} MB, {args.pages} pages, {args.workers} extraction workers")
+    print(f"job status: {status['status']}, upload {upload_seconds:.1f} s, upload + extraction {total_seconds:.1f} s")
+    print(f"server RSS idle:            {idle_kb / 1024:8.0f} MB")
+    print(f"server RSS peak:            {sampler.peak_server_kb / 1024:8.0f} MB")
+    print(f"server + workers RSS peak:  {sampler.peak_total_kb / 1024:8.0f} MB")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,88 @@
+"""
+Minimal PDF writer used by tests and benchmarks to produce text PDFs of any
+page count without extra dependencies. Only plain ASCII text is supported.
+"""
+import random
+from typing import List, Sequence
+
+WORDS = (
+    "library river economy theory window garden history signal market planet "
+    "engine language memory forest method circuit harbor culture climate vector"
+).split()
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _wrap(text: str, width: int = 90) -> List[str]:
+    lines, current = [], ""
+    for word in text.split():
+        if current and len(current) + 1 + len(word) > width:
+            lines.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        lines.append(current)
+    return lines
+
+
+def make_pdf(pages: Sequence[str], image_bytes_per_page: int = 0) -> bytes:
+    """
+    Builds a PDF with one page per entry in `pages`, text wrapped into lines.
+    `image_bytes_per_page` adds an uncompressed image to every page, which makes
+    the file as large as a scanned book without changing the extracted text.
+    """
+    objects: List[bytes] = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"",  # page tree, filled in once the page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_refs = []
+    for page_text in pages:
+        lines = "".join(f"({_escape(line)}) Tj T* " for line in _wrap(page_text))
+        stream = f"BT /F1 10 Tf 12 TL 40 800 Td {lines}ET".encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_ref = len(objects)
+        xobjects = b""
+        if image_bytes_per_page > 0:
+            objects.append(
+                b"<< /Type /XObject /Subtype /Image /Width %d /Height 1 /ColorSpace /DeviceGray "
+                b"/BitsPerComponent 8 /Length %d >>\nstream\n%s\nendstream"
+                % (image_bytes_per_page, image_bytes_per_page, bytes(image_bytes_per_page))
+            )
+            xobjects = b" /XObject << /Im1 %d 0 R >>" % len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >>%s >> /Contents %d 0 R >>" % (xobjects, content_ref)
+        )
+        page_refs.append(len(objects))
+    kids = " ".join(f"{ref} 0 R" for ref in page_refs).encode()
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_refs))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref_offset = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    return bytes(out)
+
+
+def book_pages(num_pages: int, words_per_page: int = 300, seed: int = 0) -> List[str]:
+    """Page texts of a synthetic book of random words, deterministic for a given seed."""
+    rng = random.Random(seed)
+    return [
+        f"Page {number}. " + " ".join(rng.choice(WORDS) for _ in range(words_per_page))
+        for number in range(1, num_pages + 1)
+    ]
+
+
+def make_book(num_pages: int, words_per_page: int = 300, seed: int = 0, image_bytes_per_page: int = 0) -> bytes:
+    """A synthetic book of random words, deterministic for a given seed."""
+    return make_pdf(book_pages(num_pages, words_per_page, seed), image_bytes_per_page)
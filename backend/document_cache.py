@@ -0,0 +1,359 @@
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import re
+import shutil
+import tempfile
+from array import array
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence, Tuple
+
+from storage import STORAGE_BACKEND, StorageBackend
+
+DOCUMENT_CACHE_DIR = os.getenv(
+    "DOCUMENT_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".document_cache"),
+)
+
+_FILE_ID_RE = re.compile(r"^[0-9a-f]{64}$")
+# Paragraphs are separated by blank lines within a page; a page break always
+# starts one. Batch analysis segments documents by the same paragraphs.
+_PARAGRAPH_BREAK_RE = re.compile(r"\n[ \t\r\f\v]*\n\s*")
+_NON_SPACE_RE = re.compile(r"\S")
+
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 of the uploaded bytes, used as the document's file_id."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def join_pages(pages: Sequence[str]) -> Tuple[str, List[int]]:
+    """
+    Joins page texts into one string, each non-empty page followed by a newline.
+    Returns (text, page_offsets) where page i spans text[offsets[i]:offsets[i + 1]].
+    """
+    parts, offsets, position = [], [0], 0
+    for page in pages:
+        if page:
+            parts.append(page + "\n")
+            position += len(page) + 1
+        offsets.append(position)
+    return "".join(parts), offsets
+
+
+def _read_text(path: str) -> str:
+    # Decoding straight from a memory map avoids holding a second, bytes copy
+    # of a large book in memory while it is turned into a str.
+    with open(path, "rb") as text_file:
+        if os.fstat(text_file.fileno()).st_size == 0:
+            return ""
+        with mmap.mmap(text_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return str(mapped, "utf-8")
+
+
+def _page_texts(text: str, offsets: Sequence[int], base: int = 0) -> List[str]:
+    # Each non-empty page ends with the separating newline, which is dropped.
+    return [
+        text[start - base:end - base - 1] if end > start else ""
+        for start, end in zip(offsets, offsets[1:])
+    ]
+
+
+@dataclass
+class CachedDocument:
+    """
+    A document's text as one buffer, with page i spanning
+    text[page_offsets[i]:page_offsets[i + 1]]. Page and paragraph boundaries
+    are offsets into the buffer, so pages, page ranges and paragraphs are
+    sliced out on demand instead of being stored as separate strings.
+    """
+    file_id: str
+    filename: str
+    text: str
+    page_offsets: List[int]
+    _paragraph_offsets: Optional[array] = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def num_pages(self) -> int:
+        return len(self.page_offsets) - 1
+
+    def pages(self) -> List[str]:
+        """Page texts without the separating newline; empty pages are kept."""
+        return _page_texts(self.text, self.page_offsets)
+
+    def paragraph_offsets(self) -> array:
+        """
+        Start offsets of every paragraph, computed on first use and kept as a
+        compact int64 array. Each points at the paragraph's first non-space
+        character, so blank pages and blank lines count as no paragraph.
+        """
+        if self._paragraph_offsets is None:
+            offsets = array("q")
+            for start, end in zip(self.page_offsets, self.page_offsets[1:]):
+                first = _NON_SPACE_RE.search(self.text, start, end - 1) if end > start else None
+                if first is None:
+                    continue
+                offsets.append(first.start())
+                for match in _PARAGRAPH_BREAK_RE.finditer(self.text, first.start(), end - 1):
+                    if match.end() < end - 1:
+                        offsets.append(match.end())
+            self._paragraph_offsets = offsets
+        return self._paragraph_offsets
+
+    @property
+    def num_paragraphs(self) -> int:
+        return len(self.paragraph_offsets())
+
+    def view(self, first_page: Optional[int] = None, last_page: Optional[int] = None) -> "DocumentView":
+        """
+        Pages `first_page` to `last_page` (1-based, inclusive; the whole
+        document by default). Raises ValueError for a range outside the document.
+        """
+        first_page = 1 if first_page is None else first_page
+        last_page = self.num_pages if last_page is None else last_page
+        if not 1 <= first_page <= last_page <= self.num_pages:
+            raise ValueError(
+                f"Invalid page range {first_page}-{last_page}; the document has {self.num_pages} pages."
+            )
+        return DocumentView(self, first_page, last_page)
+
+
+class DocumentView:
+    """
+    A page range of a document, described by offsets into its buffer. The
+    range's text is sliced out once, on first use; a view of the whole
+    document shares the document's own string. Page numbers reported by
+    consumers (citations, section labels) start at `first_page`.
+    """
+
+    def __init__(self, document: CachedDocument, first_page: int, last_page: int):
+        self.document = document
+        self.first_page = first_page
+        self.last_page = last_page
+        self.start = document.page_offsets[first_page - 1]
+        self.end = document.page_offsets[last_page]
+        self._text: Optional[str] = None
+
+    @property
+    def file_id(self) -> str:
+        return self.document.file_id
+
+    @property
+    def filename(self) -> str:
+        return self.document.filename
+
+    @property
+    def is_whole_document(self) -> bool:
+        return self.first_page == 1 and self.last_page == self.document.num_pages
+
+    @property
+    def page_range(self) -> Optional[Tuple[int, int]]:
+        """(first_page, last_page), or None for the whole document, e.g. for cache keys."""
+        return None if self.is_whole_document else (self.first_page, self.last_page)
+
+    @property
+    def num_pages(self) -> int:
+        return self.last_page - self.first_page + 1
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            whole = self.start == 0 and self.end == len(self.document.text)
+            self._text = self.document.text if whole else self.document.text[self.start:self.end]
+        return self._text
+
+    def pages(self) -> List[str]:
+        offsets = self.document.page_offsets[self.first_page - 1:self.last_page + 1]
+        if self._text is not None:
+            return _page_texts(self._text, offsets, base=self.start)
+        return _page_texts(self.document.text, offsets)
+
+    def paragraphs(self) -> List[str]:
+        """The range's paragraphs, sliced from the document buffer with trailing whitespace removed."""
+        return [paragraph for _, paragraph in self.page_paragraphs()]
+
+    def page_paragraphs(self) -> List[Tuple[int, str]]:
+        """(page number, paragraph) for each of the range's paragraphs, in order."""
+        offsets = self.document.paragraph_offsets()
+        lo = bisect.bisect_left(offsets, self.start)
+        hi = bisect.bisect_left(offsets, self.end)
+        bounds = list(offsets[lo:hi]) + [self.end]
+        page_offsets = self.document.page_offsets
+        return [
+            (bisect.bisect_right(page_offsets, start), self.document.text[start:end].rstrip())
+            for start, end in zip(bounds, bounds[1:])
+        ]
+
+
+class DiskDocumentCache:
+    """
+    Content-addressed store of extracted PDF text on the local filesystem.
+    Each document lives in <root>/<id[:2]>/<id>/ as text.txt plus meta.json with
+    the filename and page offsets. Entries are written to a temporary directory
+    and renamed into place, so several workers can share one root safely.
+    """
+
+    def __init__(self, root: str = DOCUMENT_CACHE_DIR):
+        self.root = root
+
+    def _path(self, file_id: str) -> Optional[str]:
+        # file_id comes from clients; only accept real SHA-256 digests as path components.
+        if not _FILE_ID_RE.match(file_id):
+            return None
+        return os.path.join(self.root, file_id[:2], file_id)
+
+    def __contains__(self, file_id: str) -> bool:
+        path = self._path(file_id)
+        return path is not None and os.path.exists(os.path.join(path, "meta.json"))
+
+    def get(self, file_id: str) -> Optional[CachedDocument]:
+        path = self._path(file_id)
+        if path is None:
+            return None
+        try:
+            with open(os.path.join(path, "meta.json"), "r") as meta_file:
+                meta = json.load(meta_file)
+            text = _read_text(os.path.join(path, "text.txt"))
+        except FileNotFoundError:
+            return None
+        return CachedDocument(file_id, meta["filename"], text, meta["page_offsets"])
+
+    def writer(self, file_id: str, filename: str) -> "DocumentWriter":
+        """Starts writing a document page by page; see DocumentWriter."""
+        path = self._path(file_id)
+        if path is None:
+            raise ValueError(f"Invalid document id: {file_id!r}")
+        return DocumentWriter(self, file_id, filename, path)
+
+    def put(self, file_id: str, filename: str, pages: Sequence[str]) -> CachedDocument:
+        with self.writer(file_id, filename) as writer:
+            for page in pages:
+                writer.append(page)
+        text, offsets = join_pages(pages)
+        return CachedDocument(file_id, filename, text, offsets)
+
+
+class DocumentWriter:
+    """
+    Appends page texts to a document's text.txt as they are extracted, so a
+    large book never has to be held in memory as one list of pages. Nothing is
+    visible to readers until `commit()` renames the finished directory into
+    place; leaving the `with` block without committing (or on an error)
+    discards the partial document.
+    """
+
+    def __init__(self, cache: DiskDocumentCache, file_id: str, filename: str, path: str):
+        self.cache = cache
+        self.file_id = file_id
+        self.filename = filename
+        self.path = path
+        self.page_offsets = [0]
+        parent = os.path.dirname(path)
+        os.makedirs(parent, exist_ok=True)
+        self._tmp_dir = tempfile.mkdtemp(prefix=f".{file_id}.", dir=parent)
+        self._text_file = open(os.path.join(self._tmp_dir, "text.txt"), "w", encoding="utf-8", newline="")
+        self._committed = False
+
+    def append(self, page: str):
+        # Same layout as join_pages: non-empty pages followed by a newline.
+        position = self.page_offsets[-1]
+        if page:
+            self._text_file.write(page)
+            self._text_file.write("\n")
+            position += len(page) + 1
+        self.page_offsets.append(position)
+
+    def commit(self):
+        self._text_file.close()
+        try:
+            with open(os.path.join(self._tmp_dir, "meta.json"), "w") as meta_file:
+                json.dump({"filename": self.filename, "page_offsets": self.page_offsets}, meta_file)
+            os.rename(self._tmp_dir, self.path)
+        except OSError:
+            # Another worker stored the same content first; its copy is identical.
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            if self.file_id not in self.cache:
+                raise
+        self._committed = True
+
+    def abort(self):
+        self._text_file.close()
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+
+    def __enter__(self) -> "DocumentWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None and not self._committed:
+            self.commit()
+        elif not self._committed:
+            self.abort()
+
+
+class StorageDocumentCache:
+    """
+    Document tier kept in a StorageBackend instead of the local filesystem, for
+    deployments whose workers don't share a disk (e.g. STORAGE_BACKEND=redis).
+    Same interface as DiskDocumentCache.
+    """
+
+    def __init__(self, storage: StorageBackend):
+        self.storage = storage
+
+    def __contains__(self, file_id: str) -> bool:
+        return self.storage.get("document_meta", file_id) is not None
+
+    def get(self, file_id: str) -> Optional[CachedDocument]:
+        meta = self.storage.get("document_meta", file_id)
+        text = self.storage.get("document_text", file_id)
+        if meta is None or text is None:
+            return None
+        meta = json.loads(meta)
+        return CachedDocument(file_id, meta["filename"], text.decode("utf-8"), meta["page_offsets"])
+
+    def writer(self, file_id: str, filename: str) -> "StorageDocumentWriter":
+        if not _FILE_ID_RE.match(file_id):
+            raise ValueError(f"Invalid document id: {file_id!r}")
+        return StorageDocumentWriter(self, file_id, filename)
+
+    def put(self, file_id: str, filename: str, pages: Sequence[str]) -> CachedDocument:
+        with self.writer(file_id, filename) as writer:
+            for page in pages:
+                writer.append(page)
+        text, offsets = join_pages(pages)
+        return CachedDocument(file_id, filename, text, offsets)
+
+
+class StorageDocumentWriter(DocumentWriter):
+    """Collects pages in a local temporary file and uploads the text on commit."""
+
+    def __init__(self, cache: StorageDocumentCache, file_id: str, filename: str):
+        self.cache = cache
+        self.file_id = file_id
+        self.filename = filename
+        self.page_offsets = [0]
+        self._text_file = tempfile.TemporaryFile("w+", encoding="utf-8", newline="")
+        self._committed = False
+
+    def commit(self):
+        self._text_file.seek(0)
+        text = self._text_file.read()
+        self._text_file.close()
+        storage = self.cache.storage
+        storage.set("document_text", self.file_id, text.encode("utf-8"))
+        # The metadata is written last: readers treat it as the marker of a complete document.
+        meta = {"filename": self.filename, "page_offsets": self.page_offsets}
+        storage.set("document_meta", self.file_id, json.dumps(meta).encode("utf-8"))
+        self._committed = True
+
+    def abort(self):
+        self._text_file.close()
+
+
+def create_document_cache(storage: StorageBackend, backend_name: str = STORAGE_BACKEND):
+    """Local storage keeps documents as files next to the SQLite store; other backends hold them too."""
+    if backend_name == "local":
+        return DiskDocumentCache()
+    return StorageDocumentCache(storage)
@@ -0,0 +1,56 @@
+import re
+from typing import List, Sequence
+
+from summarization import SUMMARY_CHUNK_SIZE, split_into_sections
+
+# Longest line still treated as a heading.
+MAX_HEADING_CHARS = 80
+# An outline longer than this is probably matching body text, not headings.
+MAX_OUTLINE_ENTRIES = 500
+
+# "Chapter 3", "PART IV: The Return", "Appendix A", "Preface"; not "Part of the problem..."
+_NAMED_HEADING_RE = re.compile(
+    r"^(chapter|part|book|section|appendix|prologue|epilogue|preface|introduction|conclusion|foreword|afterword)"
+    r"(\s+(\d+|[IVXLC]+|[A-Z])\b|\s*[:.\-]|\s*$)",
+    re.IGNORECASE,
+)
+# "3 Results", "2.1 Method", "IV. The Storm"
+_NUMBERED_HEADING_RE = re.compile(r"^((\d+(\.\d+)*)|([IVXLC]+))\.?\s+[A-Z]")
+
+
+def _heading_level(line: str) -> int:
+    """1 for chapter-like headings, 2 and deeper for numbered subsections, 0 for body text."""
+    if len(line) > MAX_HEADING_CHARS:
+        return 0
+    if _NAMED_HEADING_RE.match(line):
+        return 1
+    if line.endswith((".", ",", ";", ":")):
+        return 0
+    numbered = _NUMBERED_HEADING_RE.match(line)
+    if numbered:
+        return numbered.group(2).count(".") + 1 if numbered.group(2) else 1
+    letters = [c for c in line if c.isalpha()]
+    if len(letters) >= 4 and all(c.isupper() for c in letters):
+        return 1
+    return 0
+
+
+def build_outline(pages: Sequence[str], chunk_size: int = SUMMARY_CHUNK_SIZE) -> List[dict]:
+    """
+    A table of contents: headings found at the start of lines, with the 1-based
+    page they appear on. Documents without recognisable headings get one entry
+    per summary section ("Pages 1-12") instead, so every document has a map.
+    """
+    outline: List[dict] = []
+    for page_number, page in enumerate(pages, start=1):
+        for line in page.splitlines():
+            line = line.strip()
+            level = _heading_level(line) if line else 0
+            if level:
+                outline.append({"title": line, "page": page_number, "level": level})
+    if 0 < len(outline) <= MAX_OUTLINE_ENTRIES:
+        return outline
+    return [
+        {"title": section.label, "page": section.first_page, "level": 1}
+        for section in split_into_sections(pages, chunk_size)
+    ]
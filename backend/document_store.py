@@ -0,0 +1,178 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+from document_cache import CachedDocument, DiskDocumentCache
+from retrieval import BM25Index
+
+DOCUMENT_STORE_MAX_BYTES = int(os.getenv("DOCUMENT_STORE_MAX_BYTES", str(512 * 1024 * 1024)))
+# Documents not accessed for this many seconds are dropped from memory. 0 disables the TTL.
+DOCUMENT_STORE_TTL_SECONDS = float(os.getenv("DOCUMENT_STORE_TTL_SECONDS", "0"))
+
+
+@dataclass
+class StoredDocument(CachedDocument):
+    """A document held in memory, with its retrieval index when one was built."""
+    index: Optional[BM25Index] = None
+
+    @property
+    def nbytes(self) -> int:
+        return sys.getsizeof(self.text) + (self.index.nbytes if self.index is not None else 0)
+
+
+@dataclass
+class _Entry:
+    document: StoredDocument
+    nbytes: int
+    last_access: float
+
+
+class DocumentStore:
+    """
+    In-memory documents bounded by a byte budget, evicted least-recently-used
+    first and optionally after a TTL. With a spill tier, evicted documents are
+    written to disk (if not already there) and reloaded lazily on the next get;
+    `index_builder` rebuilds the retrieval index for reloaded documents, and
+    `on_evict` is called with the id of every document evicted or expired.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = DOCUMENT_STORE_MAX_BYTES,
+        ttl_seconds: float = DOCUMENT_STORE_TTL_SECONDS,
+        spill: Optional[DiskDocumentCache] = None,
+        index_builder: Optional[Callable[[CachedDocument], BM25Index]] = None,
+        on_evict: Optional[Callable[[str], None]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.spill = spill
+        self.index_builder = index_builder
+        self.on_evict = on_evict
+        self._clock = clock
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._resident_bytes = 0
+        self._lock = threading.RLock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "spill_writes": 0, "spill_loads": 0}
+
+    def __contains__(self, file_id: str) -> bool:
+        with self._lock:
+            return file_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def put(self, document: StoredDocument):
+        with self._lock:
+            self._remove(document.file_id)
+            nbytes = document.nbytes
+            self._entries[document.file_id] = _Entry(document, nbytes, self._clock())
+            self._resident_bytes += nbytes
+            self._enforce_limits(keep=document.file_id)
+
+    def get(self, file_id: str) -> Optional[StoredDocument]:
+        """Returns the document, reloading it from the spill tier after an eviction."""
+        document = self.get_resident(file_id)
+        if document is not None:
+            return document
+        return self.load_spilled(file_id)
+
+    def get_resident(self, file_id: str) -> Optional[StoredDocument]:
+        """Returns the document if it is held in memory, without touching the spill tier."""
+        with self._lock:
+            entry = self._entries.get(file_id)
+            if entry is not None and self._expired(entry):
+                self._evict(file_id, counter="expirations")
+                entry = None
+            if entry is not None:
+                entry.last_access = self._clock()
+                self._entries.move_to_end(file_id)
+                self._counters["hits"] += 1
+                return entry.document
+            self._counters["misses"] += 1
+            return None
+
+    def load_spilled(self, file_id: str) -> Optional[StoredDocument]:
+        """
+        Reloads an evicted document from the spill tier and rebuilds its index.
+        This reads the whole text, so async callers run it in a worker thread.
+        """
+        reloaded = self._load_from_spill(file_id)
+        if reloaded is not None:
+            with self._lock:
+                self._counters["spill_loads"] += 1
+            self.put(reloaded)
+        return reloaded
+
+    def _load_from_spill(self, file_id: str) -> Optional[StoredDocument]:
+        if self.spill is None:
+            return None
+        cached = self.spill.get(file_id)
+        if cached is None:
+            return None
+        index = self.index_builder(cached) if self.index_builder else None
+        return StoredDocument(cached.file_id, cached.filename, cached.text, cached.page_offsets, index)
+
+    def reload(self, file_id: str) -> Optional[StoredDocument]:
+        """(Re)loads a document from the spill tier, e.g. after it was written there directly."""
+        document = self._load_from_spill(file_id)
+        if document is not None:
+            self.put(document)
+        return document
+
+    def discard(self, file_id: str):
+        with self._lock:
+            self._remove(file_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._resident_bytes = 0
+
+    def metrics(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                **self._counters,
+                "resident_documents": len(self._entries),
+                "resident_bytes": self._resident_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _expired(self, entry: _Entry) -> bool:
+        return self.ttl_seconds > 0 and self._clock() - entry.last_access > self.ttl_seconds
+
+    def _remove(self, file_id: str) -> Optional[_Entry]:
+        entry = self._entries.pop(file_id, None)
+        if entry is not None:
+            self._resident_bytes -= entry.nbytes
+        return entry
+
+    def _evict(self, file_id: str, counter: str = "evictions"):
+        entry = self._remove(file_id)
+        if entry is None:
+            return
+        self._counters[counter] += 1
+        if self.on_evict is not None:
+            self.on_evict(file_id)
+        if self.spill is not None and file_id not in self.spill:
+            document = entry.document
+            try:
+                self.spill.put(file_id, document.filename, document.pages())
+                self._counters["spill_writes"] += 1
+            except ValueError:
+                pass  # ids that aren't content hashes can't be spilled; the document is just dropped
+
+    def _enforce_limits(self, keep: str):
+        for file_id in [file_id for file_id, entry in self._entries.items() if self._expired(entry)]:
+            self._evict(file_id, counter="expirations")
+        # The document just stored is kept even if it alone exceeds the budget.
+        while self._resident_bytes > self.max_bytes and len(self._entries) > 1:
+            oldest = next(iter(self._entries))
+            if oldest == keep:
+                break
+            self._evict(oldest)
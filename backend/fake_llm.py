@@ -0,0 +1,152 @@
+import asyncio
+import json
+import os
+import random
+import re
+from collections import deque
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import AsyncIterator, Iterable, Optional
+
+# Behaviour of the "fake/..." models served by the module-level `fake_provider`.
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "50"))
+FAKE_LLM_JITTER_MS = float(os.getenv("FAKE_LLM_JITTER_MS", "0"))
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+FAKE_LLM_ERROR_STATUS = int(os.getenv("FAKE_LLM_ERROR_STATUS", "503"))
+FAKE_LLM_SEED = os.getenv("FAKE_LLM_SEED")
+# Throughput of the fake model: prompt tokens read and reply tokens written per
+# second (0 = instant), and a reply length in words (0 = a one-line reply).
+FAKE_LLM_PROMPT_TOKENS_PER_SECOND = float(os.getenv("FAKE_LLM_PROMPT_TOKENS_PER_SECOND", "0"))
+FAKE_LLM_OUTPUT_TOKENS_PER_SECOND = float(os.getenv("FAKE_LLM_OUTPUT_TOKENS_PER_SECOND", "0"))
+FAKE_LLM_REPLY_WORDS = int(os.getenv("FAKE_LLM_REPLY_WORDS", "0"))
+
+_SEGMENT_ID_RE = re.compile(r"^\[(\d+)\]", re.MULTILINE)
+_JSON_FIELD_RE = re.compile(r'^- "(\w+)":', re.MULTILINE)
+_WORD_RE = re.compile(r"\S+\s*")
+# Rough size of a token in characters; close enough for simulated timings.
+_CHARS_PER_TOKEN = 4
+
+
+class FakeProviderError(Exception):
+    """An injected provider failure. `status_code` mirrors litellm's exceptions."""
+
+    def __init__(self, status_code: int = 503, message: Optional[str] = None):
+        super().__init__(message or f"Fake provider injected a {status_code} error.")
+        self.status_code = status_code
+
+
+@dataclass
+class FakeStep:
+    """Scripted behaviour for one call: a fixed latency and/or an error to raise."""
+    latency: Optional[float] = None
+    error: Optional[BaseException] = None
+
+
+def fake_reply(prompt: str, model: str, reply_words: int = 0) -> str:
+    """
+    A deterministic reply. Batch analysis prompts get a well-formed JSON array;
+    other replies are padded with filler words up to `reply_words`.
+    """
+    ids = _SEGMENT_ID_RE.findall(prompt)
+    if ids and "JSON array" in prompt:
+        fields = _JSON_FIELD_RE.findall(prompt)
+        return json.dumps([{"id": int(i), **{field: "fake" for field in fields}} for i in ids])
+    reply = f"Fake answer from {model} to a {len(prompt)}-character prompt."
+    padding = reply_words - len(reply.split())
+    if padding > 0:
+        reply += " " + " ".join(f"word{i}" for i in range(padding))
+    return reply
+
+
+class FakeProvider:
+    """
+    Local stand-in for a model provider, used by models named "fake/<anything>".
+    It answers after `latency` (+ up to `jitter`) seconds plus the time to
+    read the prompt at `prompt_tokens_per_second` and write the reply at
+    `output_tokens_per_second` (streams pace each word), and fails with
+    FakeProviderError(`error_status`) for a fraction `error_rate` of calls.
+    Like providers with prompt caching, a leading system message it has seen
+    before is not read again and is reported as `cached_tokens` in the usage.
+    Tests can queue FakeSteps in `script` to control individual calls.
+    """
+
+    def __init__(
+        self,
+        latency: float = FAKE_LLM_LATENCY_MS / 1000,
+        jitter: float = FAKE_LLM_JITTER_MS / 1000,
+        error_rate: float = FAKE_LLM_ERROR_RATE,
+        error_status: int = FAKE_LLM_ERROR_STATUS,
+        seed: Optional[int] = int(FAKE_LLM_SEED) if FAKE_LLM_SEED else None,
+        script: Iterable[FakeStep] = (),
+        prompt_tokens_per_second: float = FAKE_LLM_PROMPT_TOKENS_PER_SECOND,
+        output_tokens_per_second: float = FAKE_LLM_OUTPUT_TOKENS_PER_SECOND,
+        reply_words: int = FAKE_LLM_REPLY_WORDS,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.script = deque(script)
+        self.prompt_tokens_per_second = prompt_tokens_per_second
+        self.output_tokens_per_second = output_tokens_per_second
+        self.reply_words = reply_words
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._cached_prefixes = set()
+
+    async def acompletion(self, model: str, messages: list, stream: bool = False, **kwargs):
+        self.calls += 1
+        step = self.script.popleft() if self.script else FakeStep()
+        prompt = _text(messages[-1]["content"])
+        prompt_chars = sum(len(_text(message["content"])) for message in messages)
+        cached_chars = self._cached_prefix_chars(messages)
+        latency = step.latency
+        if latency is None:
+            latency = self.latency + self._rng.uniform(0, self.jitter)
+            if self.prompt_tokens_per_second > 0:
+                latency += (prompt_chars - cached_chars) / _CHARS_PER_TOKEN / self.prompt_tokens_per_second
+        await asyncio.sleep(latency)
+        if step.error is not None:
+            raise step.error
+        if self.error_rate and self._rng.random() < self.error_rate:
+            raise FakeProviderError(self.error_status)
+
+        content = fake_reply(prompt, model, self.reply_words)
+        if stream:
+            return _stream(content, self.output_tokens_per_second)
+        if self.output_tokens_per_second > 0 and step.latency is None:
+            await asyncio.sleep(len(content) / _CHARS_PER_TOKEN / self.output_tokens_per_second)
+        usage = SimpleNamespace(
+            prompt_tokens=prompt_chars // _CHARS_PER_TOKEN,
+            completion_tokens=len(content) // _CHARS_PER_TOKEN,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=cached_chars // _CHARS_PER_TOKEN),
+        )
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+    def _cached_prefix_chars(self, messages: list) -> int:
+        if len(messages) < 2 or messages[0]["role"] != "system":
+            return 0
+        prefix = _text(messages[0]["content"])
+        key = hash(prefix)
+        if key in self._cached_prefixes:
+            return len(prefix)
+        self._cached_prefixes.add(key)
+        return 0
+
+
+def _text(content) -> str:
+    # Content is a string, or a list of parts such as {"type": "text", "text": ...}.
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content)
+    return content
+
+
+async def _stream(content: str, tokens_per_second: float = 0) -> AsyncIterator[SimpleNamespace]:
+    # Each word counts as one token when pacing the stream.
+    delay = 1 / tokens_per_second if tokens_per_second > 0 else 0
+    for word in _WORD_RE.findall(content):
+        await asyncio.sleep(delay)
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word))])
+
+
+fake_provider = FakeProvider()
@@ -0,0 +1,288 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from batch_analysis import parse_batch_response
+from response_cache import normalize_question
+from storage import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+# Candidate terms extracted from each document for its glossary.
+GLOSSARY_MAX_TERMS = int(os.getenv("GLOSSARY_MAX_TERMS", "200"))
+# A word or phrase must occur at least this many times to be a candidate.
+GLOSSARY_MIN_COUNT = int(os.getenv("GLOSSARY_MIN_COUNT", "3"))
+# Terms explained per LLM call, and calls in flight while a glossary is built.
+GLOSSARY_TERMS_PER_CALL = int(os.getenv("GLOSSARY_TERMS_PER_CALL", "25"))
+GLOSSARY_CONCURRENCY = int(os.getenv("GLOSSARY_CONCURRENCY", "4"))
+# Characters of surrounding text sent with each term.
+GLOSSARY_CONTEXT_CHARS = 240
+
+_WORD_RE = re.compile(r"[A-Za-z][A-Za-z'\-]*[A-Za-z]")
+# Phrases never span punctuation.
+_CLAUSE_BREAK_RE = re.compile(r"[.,;:!?()\[\]{}\"\u201c\u201d]")
+
+# Everyday words that make poor glossary entries however often they occur.
+_COMMON_WORDS = frozenset(
+    "a about above after again against all also although always among an and another any are around as at "
+    "back be because been before being below between both but by can could did do does doing done down during "
+    "each either enough even ever every few first for from further get gets given go good great had has have "
+    "having he her here hers herself him himself his how however if in into is it its itself just know last "
+    "less like made make makes many may me might more most much must my myself never new next no nor not now "
+    "of off often on once one only or other others our ours ourselves out over own part per perhaps put rather "
+    "really said same say says see seen several shall she should since so some something still such take than "
+    "that the their theirs them themselves then there these they thing things this those though three through "
+    "thus time times to too two under until up upon us use used using very was way ways we well were what "
+    "whatever when where whether which while who whom whose why will with within without would yet you your "
+    "yours yourself chapter page figure table section see also example".split()
+)
+
+
+def term_key(term: str) -> str:
+    """Lookup key of a term: whitespace, case and trailing punctuation don't matter."""
+    return normalize_question(term.strip("\"'`"))
+
+
+@dataclass
+class TermCandidate:
+    term: str
+    count: int
+    page: int  # 1-based page of the first occurrence
+    score: float
+    context: str
+
+
+def term_context(text: str, term: str, max_chars: int = GLOSSARY_CONTEXT_CHARS) -> Optional[str]:
+    """The text around the first whole-word occurrence of `term`, or None if it doesn't occur."""
+    pattern = r"\b" + r"\s+".join(re.escape(word) for word in term.split()) + r"\b"
+    match = re.search(pattern, text, re.IGNORECASE)
+    if match is None:
+        return None
+    start = max(0, match.start() - max_chars // 2)
+    end = min(len(text), match.end() + max_chars // 2)
+    snippet = " ".join(text[start:end].split())
+    return ("..." if start > 0 else "") + snippet + ("..." if end < len(text) else "")
+
+
+def locate_term(pages: Sequence[str], term: str) -> Tuple[Optional[int], Optional[str]]:
+    """The 1-based page of the first use of `term` and the text around it, or (None, None)."""
+    for page_number, page in enumerate(pages, start=1):
+        context = term_context(page, term)
+        if context is not None:
+            return page_number, context
+    return None, None
+
+
+def _clauses(page: str) -> Iterable[List[Tuple[str, str]]]:
+    """(lower-cased, as written) words of each punctuation-delimited clause of a page."""
+    for clause in _CLAUSE_BREAK_RE.split(page):
+        words = [(match.group(0).lower(), match.group(0)) for match in _WORD_RE.finditer(clause)]
+        if words:
+            yield words
+
+
+def extract_terms(
+    pages: Sequence[str], max_terms: int = GLOSSARY_MAX_TERMS, min_count: int = GLOSSARY_MIN_COUNT,
+) -> List[TermCandidate]:
+    """
+    Picks the document's likely glossary terms without an LLM. Single words
+    and two-word phrases are scored by TF-IDF over the document's pages:
+    total count times log(1 + pages / pages containing the term), so terms
+    concentrated in a few chapters rank above ones spread evenly everywhere.
+    A word counted mostly inside a chosen phrase ("neural" in "neural
+    network") is dropped in favour of the phrase.
+    """
+    counts: Counter = Counter()
+    doc_freqs: Counter = Counter()
+    first_page: Dict[str, int] = {}
+    surface_forms: Dict[str, Counter] = {}
+    for page_number, page in enumerate(pages, start=1):
+        on_page = set()
+        for words in _clauses(page):
+            for i, (word, surface) in enumerate(words):
+                if len(word) < 4 or word in _COMMON_WORDS:
+                    continue
+                candidates = [(word, surface)]
+                if i + 1 < len(words):
+                    next_word, next_surface = words[i + 1]
+                    if len(next_word) >= 3 and next_word not in _COMMON_WORDS:
+                        candidates.append((f"{word} {next_word}", f"{surface} {next_surface}"))
+                for key, form in candidates:
+                    counts[key] += 1
+                    on_page.add(key)
+                    first_page.setdefault(key, page_number)
+                    surface_forms.setdefault(key, Counter())[form] += 1
+        doc_freqs.update(on_page)
+
+    phrases = {key: count for key, count in counts.items() if " " in key and count >= min_count}
+    in_phrases: Counter = Counter()
+    for phrase, count in phrases.items():
+        for word in phrase.split():
+            in_phrases[word] += count
+
+    num_pages = max(1, len(pages))
+    scored: List[Tuple[float, str, int]] = []
+    for key, count in counts.items():
+        if " " not in key:
+            count -= in_phrases[key]
+        if count < min_count:
+            continue
+        score = count * math.log(1 + num_pages / doc_freqs[key])
+        scored.append((score, key, count))
+    scored.sort(key=lambda item: (-item[0], item[1]))
+
+    text = "\n".join(pages)
+    candidates: List[TermCandidate] = []
+    for score, key, count in scored[:max(0, max_terms)]:
+        term = surface_forms[key].most_common(1)[0][0]
+        page = first_page[key]
+        context = term_context(pages[page - 1], term) or term_context(text, term) or ""
+        candidates.append(TermCandidate(term, count, page, round(score, 3), context))
+    return candidates
+
+
+@dataclass
+class GlossaryEntry:
+    term: str
+    explanation: str
+    page: Optional[int] = None
+    source: str = "batch"  # batch: generated with the glossary | live: added by an /explain_term/ miss
+
+
+@dataclass
+class Glossary:
+    """Explanations of one document's terms by one model, keyed by `term_key`."""
+    file_id: str
+    model_name: str
+    entries: Dict[str, GlossaryEntry] = field(default_factory=dict)
+    updated_at: float = 0.0
+
+    def lookup(self, term: str) -> Optional[GlossaryEntry]:
+        return self.entries.get(term_key(term))
+
+    def add(self, entry: GlossaryEntry):
+        self.entries[term_key(entry.term)] = entry
+        self.updated_at = time.time()
+
+    def to_json(self) -> bytes:
+        return json.dumps(asdict(self)).encode()
+
+    @classmethod
+    def from_json(cls, data: bytes) -> "Glossary":
+        values = json.loads(data)
+        values["entries"] = {key: GlossaryEntry(**entry) for key, entry in values["entries"].items()}
+        return cls(**values)
+
+    def to_dict(self) -> dict:
+        entries = sorted(self.entries.values(), key=lambda entry: term_key(entry.term))
+        return {
+            "file_id": self.file_id,
+            "model_name": self.model_name,
+            "updated_at": self.updated_at,
+            "terms": [asdict(entry) for entry in entries],
+        }
+
+
+class GlossaryStore:
+    """
+    Glossaries persisted in shared storage, one per document and model, so
+    every worker serves the same lookups. Additions re-read the stored
+    glossary under a lock, so a build and concurrent live misses on this
+    worker don't overwrite each other's entries. Storage calls block, so
+    async code runs these methods in a worker thread.
+    """
+
+    namespace = "glossaries"
+
+    def __init__(self, storage: StorageBackend):
+        self.storage = storage
+        self._lock = threading.Lock()
+
+    def _key(self, file_id: str, model_name: str) -> str:
+        return f"{file_id}:{model_name}"
+
+    def get(self, file_id: str, model_name: str) -> Optional[Glossary]:
+        data = self.storage.get(self.namespace, self._key(file_id, model_name))
+        return Glossary.from_json(data) if data is not None else None
+
+    def add_entries(self, file_id: str, model_name: str, entries: Iterable[GlossaryEntry]) -> Glossary:
+        with self._lock:
+            glossary = self.get(file_id, model_name) or Glossary(file_id, model_name)
+            for entry in entries:
+                glossary.add(entry)
+            glossary.updated_at = time.time()
+            self.storage.set(self.namespace, self._key(file_id, model_name), glossary.to_json())
+            return glossary
+
+    def delete(self, file_id: str, model_name: str):
+        self.storage.delete(self.namespace, self._key(file_id, model_name))
+
+
+def build_glossary_prompt(candidates: Sequence[TermCandidate]) -> str:
+    body = "\n\n".join(
+        f"[{i}] {candidate.term}\nContext: \"{candidate.context}\"" for i, candidate in enumerate(candidates)
+    )
+    return (
+        "You are writing the glossary of a book. Explain each term below as it is used in the book, "
+        "in two or three sentences a newcomer can follow. Each term starts with its id in square "
+        "brackets and comes with a passage where the book uses it.\n\n"
+        f"{body}\n\n"
+        "Respond with only a JSON array containing one object per term, in any order. "
+        'Each object must have an "id" field with the term id and these fields:\n'
+        '- "explanation": the explanation of the term'
+    )
+
+
+class GlossaryBuilder:
+    """
+    Explains many terms in few LLM calls: candidates are packed `terms_per_call`
+    to a prompt and up to `concurrency` prompts run at once. Terms the model
+    skipped and batches that failed are reported as failed, not retried.
+    """
+
+    def __init__(
+        self,
+        llm_call: Callable[[str, str], Awaitable[str]],
+        terms_per_call: int = GLOSSARY_TERMS_PER_CALL,
+        concurrency: int = GLOSSARY_CONCURRENCY,
+    ):
+        self.llm_call = llm_call
+        self.terms_per_call = max(1, terms_per_call)
+        self.concurrency = max(1, concurrency)
+
+    async def _run_batch(self, batch: Sequence[TermCandidate], model_name: str) -> List[GlossaryEntry]:
+        try:
+            parsed = parse_batch_response(await self.llm_call(build_glossary_prompt(batch), model_name), range(len(batch)))
+        except Exception as e:
+            logger.warning("Glossary batch of %d terms failed: %s", len(batch), getattr(e, "detail", None) or e)
+            return []
+        entries = []
+        for i, candidate in enumerate(batch):
+            explanation = parsed.get(i, {}).get("explanation")
+            if isinstance(explanation, str) and explanation.strip():
+                entries.append(GlossaryEntry(candidate.term, explanation.strip(), candidate.page))
+        return entries
+
+    async def explain(
+        self, candidates: Sequence[TermCandidate], model_name: str, check_cancelled: Optional[Callable[[], None]] = None,
+    ) -> List[GlossaryEntry]:
+        """`check_cancelled` runs before each batch's LLM call and may raise to stop the build."""
+        batches = [candidates[i:i + self.terms_per_call] for i in range(0, len(candidates), self.terms_per_call)]
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(batch: Sequence[TermCandidate]) -> List[GlossaryEntry]:
+            async with semaphore:
+                if check_cancelled is not None:
+                    check_cancelled()
+                return await self._run_batch(batch, model_name)
+
+        results = await asyncio.gather(*(run(batch) for batch in batches))
+        return [entry for entries in results for entry in entries]
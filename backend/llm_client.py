@@ -0,0 +1,394 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, TypeVar
+
+from litellm import acompletion
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+
+import fake_llm
+from metrics import record_span, register_models
+
+logger = logging.getLogger(__name__)
+T = TypeVar("T")
+
+MODELS_CONFIG_PATH = os.getenv(
+    "MODELS_CONFIG_PATH",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "models_config.json")),
+)
+# Cap used for providers that have no entry in models_config.json.
+DEFAULT_PROVIDER_CONCURRENCY = int(os.getenv("LLM_DEFAULT_CONCURRENCY", "4"))
+# Timeout per attempt for providers without an entry in "provider_timeouts".
+DEFAULT_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+LLM_RETRY_INITIAL_WAIT = float(os.getenv("LLM_RETRY_INITIAL_WAIT", "0.5"))
+LLM_RETRY_MAX_WAIT = float(os.getenv("LLM_RETRY_MAX_WAIT", "8"))
+# Send a second, identical request when the first is slower than this latency
+# percentile of the model's recent calls (e.g. 95). 0 disables hedging.
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+
+# Rate limits, timeouts and server-side failures are worth another attempt.
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+# Errors about the request itself would fail the same way on any model.
+NO_FALLBACK_STATUS_CODES = frozenset({400, 413, 422})
+
+
+def load_models_config(config_file: str) -> dict:
+    try:
+        with open(config_file, "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+MODELS_CONFIG = load_models_config(MODELS_CONFIG_PATH)
+register_models(MODELS_CONFIG.get("models", {}))
+
+
+def model_config_value(section: str, model_name: str, default=None):
+    """
+    Looks a model up in a section of models_config.json, accepting both the
+    LiteLLM name ("gemini/gemini-2.0-flash") and the bare model name.
+    """
+    values = MODELS_CONFIG.get(section, {})
+    if model_name in values:
+        return values[model_name]
+    return values.get(model_name.rpartition("/")[2], default)
+
+
+def provider_for_model(model_name: str) -> str:
+    """
+    Maps a LiteLLM model name such as "gemini/gemini-2.0-flash" to the provider
+    listed in models_config.json. Unknown models fall back to their LiteLLM prefix.
+    """
+    return model_config_value("models", model_name) or model_name.rpartition("/")[0] or "default"
+
+
+class ProcessSemaphore:
+    """
+    An asyncio semaphore shared by every event loop in the process: the
+    server's loop and the loops that background threads (precompute, test
+    clients) run their LLM calls on all count against the same cap. State is
+    guarded by a thread lock and each waiter is woken on its own loop.
+    """
+
+    def __init__(self, value: int):
+        self._value = value
+        self._lock = threading.Lock()
+        self._waiters: Deque[list] = deque()  # [loop, future, granted]
+
+    async def acquire(self):
+        with self._lock:
+            if self._value > 0 and not self._waiters:
+                self._value -= 1
+                return
+            loop = asyncio.get_running_loop()
+            waiter = [loop, loop.create_future(), False]
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = waiter[2]
+                if not granted:
+                    self._waiters.remove(waiter)
+            if granted:
+                self.release()  # pass on the slot handed to us as we were cancelled
+            raise
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                loop, future, _ = waiter
+                waiter[2] = True
+                try:
+                    loop.call_soon_threadsafe(_wake, future)
+                    return
+                except RuntimeError:
+                    continue  # that waiter's loop has closed
+            self._value += 1
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class ProviderLimiter:
+    """
+    Per-provider concurrency caps, shared by every event loop in the process,
+    so LLM calls made from background threads count against the same cap as
+    the server's requests.
+    """
+
+    def __init__(self, limits: Dict[str, int], default_limit: int):
+        self.limits = dict(limits)
+        self.default_limit = default_limit
+        self._semaphores: Dict[str, ProcessSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def limit_for(self, provider: str) -> int:
+        return max(1, int(self.limits.get(provider, self.default_limit)))
+
+    def semaphore(self, provider: str) -> ProcessSemaphore:
+        with self._lock:
+            if provider not in self._semaphores:
+                self._semaphores[provider] = ProcessSemaphore(self.limit_for(provider))
+            return self._semaphores[provider]
+
+
+provider_limiter = ProviderLimiter(MODELS_CONFIG.get("provider_concurrency", {}), DEFAULT_PROVIDER_CONCURRENCY)
+
+
+def timeout_for(provider: str) -> float:
+    return float(MODELS_CONFIG.get("provider_timeouts", {}).get(provider, DEFAULT_TIMEOUT_SECONDS))
+
+
+def context_window(model_name: str) -> int:
+    return int(model_config_value("context_windows", model_name, MODELS_CONFIG.get("default_context_window", 8192)))
+
+
+def fallback_chain(model_name: str, prompt_tokens: Optional[int] = None) -> List[str]:
+    """
+    The model followed by its fallbacks from the "fallbacks" section of
+    models_config.json. Given the prompt's size, fallbacks whose context
+    window is too small for it are left out rather than tried and rejected.
+    """
+    chain = [model_name]
+    for fallback in model_config_value("fallbacks", model_name, []):
+        if fallback in chain:
+            continue
+        if prompt_tokens is not None and prompt_tokens > context_window(fallback):
+            logger.info("Skipping fallback %s: a %d-token prompt exceeds its context window", fallback, prompt_tokens)
+            continue
+        chain.append(fallback)
+    return chain
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    return _status_code(error) in RETRYABLE_STATUS_CODES
+
+
+def should_fall_back(error: BaseException) -> bool:
+    return _status_code(error) not in NO_FALLBACK_STATUS_CODES
+
+
+@dataclass
+class ResiliencePolicy:
+    max_attempts: int = LLM_MAX_ATTEMPTS
+    initial_wait: float = LLM_RETRY_INITIAL_WAIT
+    max_wait: float = LLM_RETRY_MAX_WAIT
+    hedge_percentile: float = LLM_HEDGE_PERCENTILE
+    hedge_min_samples: int = LLM_HEDGE_MIN_SAMPLES
+
+
+default_policy = ResiliencePolicy()
+
+
+class LatencyTracker:
+    """Recent successful call latencies per model, for choosing when to hedge."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._latencies: Dict[str, Deque[float]] = {}
+
+    def record(self, model_name: str, seconds: float):
+        self._latencies.setdefault(model_name, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, model_name: str, percentile: float, min_samples: int = 1) -> Optional[float]:
+        samples = sorted(self._latencies.get(model_name, ()))
+        if len(samples) < max(1, min_samples):
+            return None
+        index = min(len(samples) - 1, int(round(percentile / 100 * (len(samples) - 1))))
+        return samples[index]
+
+
+latency_tracker = LatencyTracker()
+# Counts of retries, hedges (sent/won), fallbacks and exhausted calls since start-up.
+resilience_stats: Counter = Counter()
+
+
+async def _completion(model_name: str, messages: list, **kwargs):
+    if model_name.startswith("fake/"):
+        return await fake_llm.fake_provider.acompletion(model=model_name, messages=messages, **kwargs)
+    return await acompletion(model=model_name, messages=messages, **kwargs)
+
+
+async def _retrying(call: Callable[[], Awaitable[T]], model_name: str, policy: ResiliencePolicy) -> T:
+    def before_sleep(retry_state):
+        resilience_stats["retries"] += 1
+        logger.warning(
+            "LLM call to %s failed (attempt %d): %s; retrying",
+            model_name, retry_state.attempt_number, retry_state.outcome.exception(),
+        )
+
+    retrying = AsyncRetrying(
+        stop=stop_after_attempt(max(1, policy.max_attempts)),
+        wait=wait_exponential_jitter(initial=policy.initial_wait, max=policy.max_wait),
+        retry=retry_if_exception(is_retryable),
+        before_sleep=before_sleep,
+        reraise=True,
+    )
+    async for attempt in retrying:
+        with attempt:
+            return await call()
+
+
+async def _attempt(messages: list, model_name: str, limiter: ProviderLimiter, **kwargs):
+    provider = provider_for_model(model_name)
+    queued = time.perf_counter()
+    async with limiter.semaphore(provider):
+        start = time.perf_counter()
+        record_span("queue_wait", start - queued, model_name)
+        response = await asyncio.wait_for(_completion(model_name, messages, **kwargs), timeout_for(provider))
+    latency_tracker.record(model_name, time.perf_counter() - start)
+    return response
+
+
+async def _hedged_attempt(messages: list, model_name: str, limiter: ProviderLimiter, policy: ResiliencePolicy, **kwargs):
+    """
+    One attempt, plus a duplicate request if the first is still running after
+    the model's hedge-percentile latency; whichever succeeds first wins.
+    """
+    threshold = None
+    if policy.hedge_percentile > 0:
+        threshold = latency_tracker.percentile(model_name, policy.hedge_percentile, policy.hedge_min_samples)
+    if threshold is None:
+        return await _attempt(messages, model_name, limiter, **kwargs)
+
+    primary = asyncio.ensure_future(_attempt(messages, model_name, limiter, **kwargs))
+    tasks = [primary]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=threshold)
+        if done:
+            return primary.result()
+        resilience_stats["hedges_sent"] += 1
+        hedge = asyncio.ensure_future(_attempt(messages, model_name, limiter, **kwargs))
+        tasks.append(hedge)
+        pending = set(tasks)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        resilience_stats["hedges_won"] += 1
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def acall_chat(
+    messages: list, model_name: str, limiter: Optional[ProviderLimiter] = None,
+    policy: Optional[ResiliencePolicy] = None, prompt_tokens: Optional[int] = None, **kwargs,
+):
+    """
+    Sends chat messages through litellm's async API and returns the provider's
+    response, respecting the provider's concurrency cap. Each attempt has the
+    provider's timeout; retryable failures are retried with exponential backoff,
+    slow attempts may be hedged, and when a model keeps failing its fallbacks
+    are tried in order. Callers that know the prompt's size pass `prompt_tokens`
+    so fallbacks with a smaller context window are skipped.
+    """
+    limiter = limiter or provider_limiter
+    policy = policy or default_policy
+    chain = fallback_chain(model_name, prompt_tokens)
+    for position, candidate in enumerate(chain):
+        try:
+            return await _retrying(
+                lambda: _hedged_attempt(messages, candidate, limiter, policy, **kwargs), candidate, policy
+            )
+        except Exception as e:
+            if position == len(chain) - 1 or not should_fall_back(e):
+                resilience_stats["failures"] += 1
+                raise
+            resilience_stats["fallbacks"] += 1
+            logger.warning("LLM call to %s failed (%s); falling back to %s", candidate, e, chain[position + 1])
+
+
+async def acall_completion(
+    prompt: str, model_name: str, limiter: Optional[ProviderLimiter] = None,
+    policy: Optional[ResiliencePolicy] = None, prompt_tokens: Optional[int] = None, **kwargs,
+) -> str:
+    """Sends a single-turn prompt; see acall_chat. Returns the reply text."""
+    response = await acall_chat([{"role": "user", "content": prompt}], model_name, limiter, policy, prompt_tokens, **kwargs)
+    return response.choices[0].message.content
+
+
+def cached_prompt_tokens(response) -> int:
+    """
+    Prompt tokens the provider served from its prompt cache, as reported in
+    the response usage (OpenAI-style `prompt_tokens_details.cached_tokens`
+    or Anthropic-style `cache_read_input_tokens`); 0 when not reported.
+    """
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) if details is not None else None
+    if not cached:
+        cached = getattr(usage, "cache_read_input_tokens", None)
+    return int(cached or 0)
+
+
+async def astream_completion(
+    prompt: str, model_name: str, limiter: Optional[ProviderLimiter] = None,
+    policy: Optional[ResiliencePolicy] = None, prompt_tokens: Optional[int] = None, **kwargs,
+) -> AsyncIterator[str]:
+    """
+    Streams the text deltas of a single-turn prompt. The provider slot is held
+    until the stream ends. Opening the stream is retried and falls back like
+    acall_completion; once text has been sent, errors are passed on as they are.
+    """
+    limiter = limiter or provider_limiter
+    policy = policy or default_policy
+    messages = [{"role": "user", "content": prompt}]
+    chain = fallback_chain(model_name, prompt_tokens)
+    for position, candidate in enumerate(chain):
+        provider = provider_for_model(candidate)
+        started = False
+        try:
+            queued = time.perf_counter()
+            async with limiter.semaphore(provider):
+                record_span("queue_wait", time.perf_counter() - queued, candidate)
+                response = await _retrying(
+                    lambda: asyncio.wait_for(
+                        _completion(candidate, messages, stream=True, **kwargs), timeout_for(provider)
+                    ),
+                    candidate, policy,
+                )
+                async for chunk in response:
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        started = True
+                        yield delta
+            return
+        except Exception as e:
+            if started or position == len(chain) - 1 or not should_fall_back(e):
+                resilience_stats["failures"] += 1
+                raise
+            resilience_stats["fallbacks"] += 1
+            logger.warning("LLM stream from %s failed (%s); falling back to %s", candidate, e, chain[position + 1])
@@ -1,16 +1,125 @@
-import io
-from typing import Dict, Optional
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from typing import AsyncIterator, Awaitable, Callable, Iterator, List, Optional, Tuple
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
-import PyPDF2
-from litellm import completion
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 
+from admission import AdmissionControlMiddleware, AdmissionController
+from batch_analysis import (
+    ANALYSES,
+    BATCH_MAX_SEGMENTS,
+    SEGMENTATION_RULES,
+    BatchAnalyzer,
+    Segment,
+    segment_document,
+    segments_from_texts,
+)
+from document_cache import CachedDocument, DocumentView, create_document_cache, join_pages
+from document_outline import build_outline
+from document_store import DocumentStore, StoredDocument
+from glossary import (
+    GLOSSARY_MAX_TERMS,
+    GlossaryBuilder,
+    GlossaryEntry,
+    GlossaryStore,
+    extract_terms,
+    locate_term,
+)
+from llm_client import acall_chat, acall_completion, astream_completion, cached_prompt_tokens, resilience_stats
+from metrics import PROMETHEUS_CONTENT_TYPE, MetricsMiddleware, record_span, registry as metrics_registry, span
+from pdf_extraction import ExtractionJob, ExtractionService
+from precompute import (
+    PRECOMPUTE_GLOSSARY_MODEL,
+    PRECOMPUTE_SUMMARY_LENGTH,
+    PRECOMPUTE_SUMMARY_MODEL,
+    PRECOMPUTE_WAIT_SECONDS,
+    PRIORITY_GLOSSARY,
+    PRIORITY_OUTLINE,
+    PRIORITY_SUMMARY,
+    ArtifactPipeline,
+    ArtifactTask,
+)
+from qa_sessions import (
+    QA_SESSION_HISTORY_TOKENS,
+    RETRIEVAL_INSTRUCTIONS,
+    SESSION_MODES,
+    PrefixCache,
+    QASession,
+    QATurn,
+    SessionStore,
+    build_turn_messages,
+    count_message_tokens,
+    document_prefix,
+    prefix_message,
+    uses_cache_control,
+)
+from response_cache import (
+    create_response_cache,
+    make_cache_key,
+    normalize_keywords,
+    normalize_question,
+    normalize_text,
+)
+from retrieval import BM25Index, Chunk, build_index, format_context
+from storage import create_storage
+from summarization import SUMMARY_MODES, MapReduceSummarizer, use_map_reduce
+from token_budget import (
+    FittedText,
+    TokenUsageMiddleware,
+    TokenUsageStats,
+    acount_tokens,
+    afit_text,
+    context_window,
+    current_request_usage,
+    fit_text,
+    fit_to_budget,
+    prompt_budget,
+    token_counter,
+)
+from uploads import MAX_UPLOAD_BYTES, UploadSizeLimitMiddleware, UploadTooLarge, spool_to_disk
+
 # It's good practice to load .env variables early, 
 # especially if they configure aspects of the app initialization
 load_dotenv()
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+# State shared by every API worker (STORAGE_BACKEND=local|redis): extraction jobs,
+# retrieval indexes and, depending on the backend, documents and cached responses.
+storage = create_storage()
+
+# PDF text extraction runs in a process pool so large books never block the event loop.
+extraction_service = ExtractionService(storage=storage)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    extraction_service.shutdown()
+    artifact_pipeline.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+
+# Per-client and global limits on the LLM-backed endpoints, with a fair queue
+# for the overflow (see admission.py). Added first so it runs innermost: its
+# 429/503 responses still get CORS headers, and TokenUsageMiddleware has
+# counted a request's tokens by the time they are charged to its client.
+admission_controller = AdmissionController()
+app.add_middleware(
+    AdmissionControlMiddleware,
+    controller=admission_controller,
+    paths=[
+        r"/qa/", r"/qa/stream/", r"/qa/sessions/[^/]+/", r"/summarize/", r"/summarize/stream/",
+        r"/explain_term/", r"/detect_misinformation/", r"/analyze_sentiment/",
+        r"/analyze_sentiment/batch/", r"/detect_misinformation/batch/", r"/documents/[^/]+/glossary/",
+    ],
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,24 +127,316 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
+    expose_headers=["X-Cache", "X-Prompt-Tokens", "X-Completion-Tokens", "Retry-After"],
 )
 
-pdf_texts: Dict[str, str] = {}
+# Per-request token counts (X-Prompt-Tokens / X-Completion-Tokens) and per-endpoint totals.
+token_usage_stats = TokenUsageStats()
+app.add_middleware(TokenUsageMiddleware, stats=token_usage_stats)
+# Refuse uploads that declare a size over MAX_UPLOAD_BYTES before reading the body.
+app.add_middleware(UploadSizeLimitMiddleware, paths=["/upload_pdf/"], max_bytes=MAX_UPLOAD_BYTES)
+# Outermost, so every request is counted and timed, including rejected uploads.
+# Exported in Prometheus format at GET /metrics (METRICS_LOG_REQUESTS=1 also logs each request as JSON).
+app.add_middleware(MetricsMiddleware)
+
+# Tokens set aside for instructions and the question when fitting document
+# text or user-supplied segments into a model's prompt budget.
+PROMPT_INSTRUCTION_TOKENS = 1000
+
+# Retrieval settings for /qa/. QA_TOP_K=0 disables retrieval and sends the whole document.
+QA_TOP_K = int(os.getenv("QA_TOP_K", "4"))
+QA_CHUNK_SIZE = int(os.getenv("QA_CHUNK_SIZE", "1500"))
+QA_CHUNK_OVERLAP = int(os.getenv("QA_CHUNK_OVERLAP", "200"))
+
+def build_qa_index(pages: List[str]) -> BM25Index:
+    return build_index(pages, QA_CHUNK_SIZE, QA_CHUNK_OVERLAP)
+
+# Retrieval chunks and outlines shared through storage expire after this many
+# seconds; a document used again after that rebuilds them on first use.
+DOCUMENT_ARTIFACT_TTL_SECONDS = float(os.getenv("DOCUMENT_ARTIFACT_TTL_SECONDS", "86400"))
+
+def load_qa_index(document: CachedDocument) -> BM25Index:
+    """The document's retrieval index, chunked once and shared with the other workers through storage."""
+    key = f"{document.file_id}:{QA_CHUNK_SIZE}:{QA_CHUNK_OVERLAP}"
+    cached = storage.get("qa_chunks", key)
+    if cached is not None:
+        # Storage may be reachable by other hosts, so it holds plain chunk data
+        # and each worker builds the index itself.
+        return BM25Index([Chunk(**chunk) for chunk in json.loads(cached)])
+    index = build_qa_index(document.pages())
+    chunks = json.dumps([asdict(chunk) for chunk in index.chunks]).encode()
+    storage.set("qa_chunks", key, chunks, DOCUMENT_ARTIFACT_TTL_SECONDS)
+    return index
+
+# Outlines and a default summary are precomputed in the background after each
+# upload (PRECOMPUTE_WORKERS), and cancelled if the document is evicted first.
+artifact_pipeline = ArtifactPipeline()
+
+# Extracted text persisted by content hash, shared by all workers (on this
+# host for local storage, everywhere for Redis).
+document_cache = create_document_cache(storage)
+# Documents held in memory, bounded by DOCUMENT_STORE_MAX_BYTES. Evicted documents
+# spill to the document cache and are reloaded on their next use, by any worker.
+document_store = DocumentStore(spill=document_cache, index_builder=load_qa_index, on_evict=artifact_pipeline.cancel)
 
-# Generic LLM Helper Function
-def call_llm(prompt: str, model_name: str, **kwargs):
+def load_outline(document: CachedDocument) -> List[dict]:
+    """The document's table of contents, precomputed after upload or built on first use, shared through storage."""
+    cached = storage.get("outlines", document.file_id)
+    if cached is not None:
+        return json.loads(cached)
+    outline = build_outline(document.pages())
+    storage.set("outlines", document.file_id, json.dumps(outline).encode(), DOCUMENT_ARTIFACT_TTL_SECONDS)
+    return outline
+
+def store_document(file_id: str, pages: List[str], filename: str = ""):
+    """Keeps the full text and a chunked retrieval index for an uploaded document."""
+    text, page_offsets = join_pages(pages)
+    document_store.put(StoredDocument(file_id, filename, text, page_offsets, build_qa_index(pages)))
+
+async def load_document(file_id: str) -> Optional[StoredDocument]:
+    """
+    document_store.get for async handlers: resident documents are returned
+    directly, evicted ones are reloaded and re-indexed in a worker thread.
+    """
+    document = document_store.get_resident(file_id)
+    if document is None:
+        document = await asyncio.to_thread(document_store.load_spilled, file_id)
+    return document
+
+async def require_document(file_id: str) -> StoredDocument:
+    document = await load_document(file_id)
+    if document is not None:
+        return document
+    if extraction_service.is_processing(file_id):
+        raise HTTPException(status_code=409, detail="PDF is still being processed. Please try again shortly.")
+    raise HTTPException(status_code=404, detail="PDF not found. Please upload it first.")
+
+def require_page_range(document: StoredDocument, page_start: Optional[int], page_end: Optional[int]) -> DocumentView:
+    """The pages a request asked for (1-based, inclusive; either end may be omitted), or the whole document."""
+    try:
+        return document.view(page_start, page_end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def build_qa_prompt(
+    document: StoredDocument, query: str, top_k: Optional[int] = None, model_name: Optional[str] = None,
+    page_range: Optional[Tuple[int, int]] = None,
+) -> Tuple[str, int]:
+    """
+    Builds the Q&A prompt from the top-k retrieved chunks, or the whole document
+    when retrieval is off, and returns it with its token count. With a model
+    name, content is trimmed to its prompt budget; with a page range, only
+    those pages are searched or sent. The full text is tokenized once, so
+    async callers run this in a worker thread.
+    """
+    with span("prompt_build", model_name):
+        return _build_qa_prompt(document, query, QA_TOP_K if top_k is None else top_k, model_name, page_range)
+
+def with_template_tokens(fitted: FittedText, template: Callable[[str], str], model_name: str) -> Tuple[str, int]:
+    """template(fitted.text) and its token count, tokenizing only the template's own words again."""
+    with span("token_count", model_name):
+        template_tokens = token_counter.count(template(""))
+    return template(fitted.text), fitted.tokens + template_tokens
+
+def _build_qa_prompt(
+    document: StoredDocument, query: str, top_k: int, model_name: Optional[str], page_range: Optional[Tuple[int, int]],
+) -> Tuple[str, int]:
+    budget = prompt_budget(model_name) - PROMPT_INSTRUCTION_TOKENS if model_name else None
+    if top_k <= 0 or document.index is None:
+        if page_range is None:
+            text, heading = document.text, "Here is the entire document content:"
+        else:
+            text, heading = document.view(*page_range).text, f"Here are pages {page_range[0]}-{page_range[1]} of the document:"
+        with span("token_count", model_name):
+            fitted = fit_text(text, budget) if budget else FittedText(text, token_counter.count(text), False)
+        return with_template_tokens(fitted, lambda body: f"{heading}\n\n{body}\n\nQuestion: {query}\nAnswer:", model_name)
+
+    results = document.index.search(query, top_k, page_range)
+    if budget:
+        # Keep the best-ranked chunks that fit; lower-ranked ones are dropped first.
+        selected, used = [], 0
+        with span("token_count", model_name):
+            for chunk, score in results:
+                tokens = token_counter.count(chunk.text)
+                if used + tokens > budget:
+                    break
+                selected.append((chunk, score))
+                used += tokens
+        results = selected
+    context = format_context(results)
+    prompt = (
+        "Here are the most relevant excerpts from the document, each marked with its page number:\n\n"
+        f"{context}\n\n"
+        "Answer the question using these excerpts and cite the page numbers you relied on.\n"
+        f"Question: {query}\nAnswer:"
+    )
+    # A few chunks at most, so counting the whole prompt is cheap.
+    with span("token_count", model_name):
+        return prompt, token_counter.count(prompt)
+
+async def fit_segment(text: str, model_name: str) -> FittedText:
+    """Trims user-supplied text (context, segments) so the prompt fits the model, counting its tokens once."""
+    with span("token_count", model_name):
+        return await afit_text(text, prompt_budget(model_name) - PROMPT_INSTRUCTION_TOKENS)
+
+# Generic LLM Helper Function. Uses litellm's async API so a slow provider
+# call never blocks the event loop; concurrency is capped per provider.
+async def call_llm(prompt: str, model_name: str, prompt_tokens: Optional[int] = None, **kwargs):
+    """Callers that already know the prompt's token count pass it, so long prompts aren't tokenized twice."""
+    # Oversized prompts fail fast here instead of slowly (and expensively) at the provider.
+    if prompt_tokens is None:
+        with span("token_count", model_name):
+            prompt_tokens = await acount_tokens(prompt)
+    if prompt_tokens > context_window(model_name):
+        raise HTTPException(
+            status_code=413,
+            detail=f"Prompt of {prompt_tokens} tokens exceeds the {context_window(model_name)}-token context window of {model_name}.",
+        )
+    start = time.perf_counter()
     try:
-        messages = [{"role": "user", "content": prompt}]
-        response = completion(
-            model=model_name,
-            messages=messages,
-            **kwargs
+        result = await acall_completion(prompt, model_name, prompt_tokens=prompt_tokens, **kwargs)
+        record_span("llm_total", time.perf_counter() - start, model_name)
+        usage = current_request_usage.get()
+        if usage is not None:
+            usage.add(prompt_tokens, token_counter.count(result or ""), time.perf_counter() - start)
+        return result
+    except Exception as e:
+        logger.warning("LLM API call failed: %s", e)
+        raise HTTPException(status_code=500, detail=f"LLM API call failed: {str(e)}")
+
+async def call_llm_chat(messages: List[dict], model_name: str, prompt_tokens: int):
+    """
+    Like call_llm, for a multi-message conversation whose prompt size the
+    caller has already counted. Returns the provider response, with its usage.
+    """
+    if prompt_tokens > context_window(model_name):
+        raise HTTPException(
+            status_code=413,
+            detail=f"Prompt of {prompt_tokens} tokens exceeds the {context_window(model_name)}-token context window of {model_name}.",
         )
-        return response.choices[0].message.content
+    start = time.perf_counter()
+    try:
+        response = await acall_chat(messages, model_name, prompt_tokens=prompt_tokens)
+        record_span("llm_total", time.perf_counter() - start, model_name)
+        usage = current_request_usage.get()
+        if usage is not None:
+            usage.add(prompt_tokens, token_counter.count(response.choices[0].message.content or ""), time.perf_counter() - start)
+        return response
     except Exception as e:
-        print(f"LLM API call failed: {e}") # Log to server console
+        logger.warning("LLM API call failed: %s", e)
         raise HTTPException(status_code=500, detail=f"LLM API call failed: {str(e)}")
 
+# Cache of LLM responses for repeated questions, summaries and explanations
+# (RESPONSE_CACHE_BACKEND=memory|sqlite|none).
+response_cache = create_response_cache(storage=storage)
+
+async def cached_llm_result(endpoint: str, cache_key: str, call: Callable[[], Awaitable[str]], response: Response) -> str:
+    """Serves `call` from the response cache when possible; X-Cache tells clients which happened."""
+    result, hit = await response_cache.get_or_call(endpoint, cache_key, call)
+    if response_cache.enabled_for(endpoint):
+        response.headers["X-Cache"] = "HIT" if hit else "MISS"
+    return result
+
+# Map-reduce summarization for books too large for a single prompt. Section
+# summaries go through the response cache so they're reused across requests.
+summarizer = MapReduceSummarizer(lambda prompt, model_name: call_llm(prompt, model_name), response_cache)
+
+# Packs many segments into each sentiment / misinformation call for the batch endpoints.
+batch_analyzer = BatchAnalyzer(lambda prompt, model_name: call_llm(prompt, model_name), response_cache)
+
+# Per-document glossaries, persisted in shared storage and served by /explain_term/ with a file_id.
+glossaries = GlossaryStore(storage)
+glossary_builder = GlossaryBuilder(lambda prompt, model_name: call_llm(prompt, model_name))
+
+def _sse_event(data: dict, event: Optional[str] = None) -> str:
+    message = f"data: {json.dumps(data)}\n\n"
+    return f"event: {event}\n{message}" if event else message
+
+async def stream_llm_events(prompt: str, model_name: str, endpoint: str, prompt_tokens: Optional[int] = None) -> AsyncIterator[str]:
+    """
+    Relays LLM tokens as Server-Sent Events. Each token is sent as a `data:` event;
+    the stream ends with a `done` event carrying time-to-first-token and total time,
+    or an `error` event if the provider call fails part way through.
+    """
+    start = time.perf_counter()
+    ttft_ms = None
+    completion_parts: List[str] = []
+    if prompt_tokens is None:
+        with span("token_count", model_name):
+            prompt_tokens = await acount_tokens(prompt)
+    try:
+        async for token in astream_completion(prompt, model_name, prompt_tokens=prompt_tokens):
+            if ttft_ms is None:
+                ttft_ms = (time.perf_counter() - start) * 1000
+                record_span("ttft", ttft_ms / 1000, model_name)
+                logger.info("%s first token from %s after %.0f ms", endpoint, model_name, ttft_ms)
+            completion_parts.append(token)
+            yield _sse_event({"token": token})
+    except Exception as e:
+        logger.warning("LLM streaming call failed: %s", e)
+        yield _sse_event({"detail": f"LLM API call failed: {str(e)}"}, event="error")
+        return
+    total_ms = (time.perf_counter() - start) * 1000
+    record_span("llm_total", total_ms / 1000, model_name)
+    completion_tokens = token_counter.count("".join(completion_parts))
+    usage = current_request_usage.get()
+    if usage is not None:
+        usage.add(prompt_tokens, completion_tokens, total_ms / 1000)
+    logger.info("%s stream from %s finished in %.0f ms", endpoint, model_name, total_ms)
+    yield _sse_event(
+        {"ttft_ms": ttft_ms, "total_ms": total_ms, "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens},
+        event="done",
+    )
+
+def sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+    # X-Accel-Buffering stops nginx-style proxies from holding tokens back.
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def batch_segments(
+    text_segments: Optional[List[str]], file_id: Optional[str], segmentation: str,
+    page_start: Optional[int] = None, page_end: Optional[int] = None,
+) -> List[Segment]:
+    """
+    Segments for a batch request: the given texts, or the uploaded document
+    (or a page range of it) split by `segmentation`.
+    """
+    if text_segments and file_id:
+        raise HTTPException(status_code=400, detail="Provide either text_segments or file_id, not both.")
+    if file_id:
+        if segmentation not in SEGMENTATION_RULES:
+            raise HTTPException(status_code=400, detail=f"Invalid segmentation. Expected one of: {', '.join(SEGMENTATION_RULES)}.")
+        pages = require_page_range(await require_document(file_id), page_start, page_end)
+        segments = segment_document(pages, segmentation)
+    else:
+        segments = segments_from_texts(text_segments or [])
+    if not segments:
+        raise HTTPException(status_code=400, detail="No text segments to analyze.")
+    if len(segments) > BATCH_MAX_SEGMENTS:
+        raise HTTPException(status_code=400, detail=f"Too many segments ({len(segments)}); the limit is {BATCH_MAX_SEGMENTS}.")
+    return segments
+
+async def stream_batch_results(analysis_name: str, segments: List[Segment], model_name: str) -> AsyncIterator[str]:
+    """
+    One NDJSON line per segment as its batch finishes, then a summary line with
+    counts and elapsed time. Failed batches produce per-segment `error` lines.
+    """
+    start = time.perf_counter()
+    counts = {"segments": len(segments), "cached": 0, "errors": 0}
+    budget = prompt_budget(model_name) - PROMPT_INSTRUCTION_TOKENS
+    async for item in batch_analyzer.analyze(ANALYSES[analysis_name], segments, model_name, budget):
+        counts["cached"] += bool(item.get("cached"))
+        counts["errors"] += "error" in item
+        yield json.dumps(item) + "\n"
+    elapsed = time.perf_counter() - start
+    yield json.dumps({"done": True, **counts, "elapsed_ms": elapsed * 1000}) + "\n"
+
+def ndjson_response(lines: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(lines, media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to the PDF Q&A Backend API!"}
@@ -46,37 +447,197 @@ async def create_upload_pdf(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="No file name provided.")
     if not file.content_type == "application/pdf":
         raise HTTPException(status_code=400, detail="Invalid file type. Only PDFs are accepted.")
+    # The PDF is copied to disk in chunks and parsed from there, so a large
+    # book is never held in memory. Identical bytes always map to the same id,
+    # so re-uploads skip parsing and same-named files don't overwrite each other.
     try:
-        pdf_content = await file.read()
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_content))
-        text = ""
-        for page in pdf_reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
-        
-        # Use filename as a simple ID. For concurrent use, a more robust ID is needed.
-        file_id = file.filename 
-        pdf_texts[file_id] = text
-        return {"file_id": file_id, "filename": file.filename, "detail": "PDF processed successfully."}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to process PDF: {str(e)}")
+        upload = await asyncio.to_thread(spool_to_disk, file.file, MAX_UPLOAD_BYTES)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    file_id = upload.file_id
+    if await load_document(file_id) is not None:
+        upload.discard()
+        return {
+            "file_id": file_id,
+            "filename": file.filename,
+            "job_id": None,
+            "status": "done",
+            "detail": "PDF already processed.",
+            "cached": True,
+        }
+
+    def on_extracted(job: ExtractionJob, pages: Iterator[str]):
+        # Pages are written to the disk tier as they are extracted, then the
+        # finished document is loaded into memory with its retrieval index.
+        start = time.perf_counter()
+        with document_cache.writer(job.file_id, job.filename) as writer:
+            for page in pages:
+                writer.append(page)
+        document_store.reload(job.file_id)
+        record_span("pdf_parse", time.perf_counter() - start, endpoint="/upload_pdf/")
+        schedule_artifacts(job.file_id)
+
+    job = extraction_service.submit(file_id, file.filename, upload.path, on_extracted, delete_source=True)
+    return {
+        "file_id": file_id,
+        "filename": file.filename,
+        "job_id": job.job_id,
+        "status": job.status,
+        "detail": "PDF accepted for processing. Poll /upload_pdf/status/{job_id} for progress.",
+        "cached": False,
+    }
+
+@app.get("/documents/stats")
+async def document_store_stats():
+    """Hit/miss/eviction counters and resident bytes of the in-memory document store."""
+    return document_store.metrics()
+
+@app.get("/cache/stats")
+async def response_cache_stats():
+    """Per-endpoint hit/miss counts and hit rate of the LLM response cache."""
+    return response_cache.stats()
+
+@app.get("/tokens/stats")
+async def token_usage_stats_api():
+    """Per-endpoint request, LLM call, token and LLM-time totals."""
+    return token_usage_stats.snapshot()
+
+@app.get("/admission/stats")
+async def admission_stats_api():
+    """Requests admitted, queued and rejected by admission control, and those in progress or waiting now."""
+    return admission_controller.stats()
+
+@app.get("/llm/stats")
+async def llm_resilience_stats_api():
+    """Retries, hedged requests, fallbacks and failures of LLM calls since startup."""
+    return dict(resilience_stats)
+
+def _resilience_samples():
+    return {(event,): count for event, count in resilience_stats.items()}
+
+def _document_store_samples():
+    return {(name,): value for name, value in document_store.metrics().items()}
+
+def _response_cache_samples():
+    return {
+        (endpoint, outcome): counts[outcome]
+        for endpoint, counts in response_cache.stats().items() for outcome in ("hits", "misses")
+    }
+
+metrics_registry.callback(
+    "bookai_llm_resilience_events_total", "LLM retries, hedges, fallbacks and failures.", "counter", ("event",), _resilience_samples
+)
+metrics_registry.callback(
+    "bookai_document_store", "Document store counters and resident size.", "gauge", ("stat",), _document_store_samples
+)
+metrics_registry.callback(
+    "bookai_precompute_tasks", "Background precompute tasks by outcome, queue depth and workers.", "gauge",
+    ("stat",), lambda: {(name,): value for name, value in artifact_pipeline.metrics().items()},
+)
+metrics_registry.callback(
+    "bookai_admission", "Admission control counters, requests in progress and queue depth.", "gauge",
+    ("stat",), lambda: {(name,): value for name, value in admission_controller.stats().items()},
+)
+metrics_registry.callback(
+    "bookai_response_cache_lookups_total", "LLM response cache lookups by endpoint and outcome.", "counter",
+    ("endpoint", "outcome"), _response_cache_samples,
+)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Request counts, latency histograms and per-stage timing spans in the Prometheus text format."""
+    return Response(metrics_registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.get("/documents/{file_id}/outline")
+async def document_outline(file_id: str):
+    """Headings and the pages they start on (or page-range sections when the document has no headings)."""
+    document = await require_document(file_id)
+    outline = await asyncio.to_thread(load_outline, document)
+    return {"file_id": file_id, "outline": outline}
+
+@app.get("/documents/{file_id}/artifacts")
+async def document_artifacts(file_id: str):
+    """Status of the background precompute tasks for a document on this worker."""
+    await require_document(file_id)
+    return {"file_id": file_id, "artifacts": artifact_pipeline.status(file_id)}
+
+@app.post("/documents/{file_id}/glossary/")
+async def create_document_glossary(
+    file_id: str, model_name: str = Form(...), max_terms: int = Form(GLOSSARY_MAX_TERMS)
+):
+    """
+    Builds (or extends) the document's glossary: candidate terms are extracted
+    locally and only those not yet in the glossary are explained, in batches.
+    """
+    document = await require_document(file_id)
+    if not model_name:
+        raise HTTPException(status_code=400, detail="Model name cannot be empty.")
+    if max_terms <= 0:
+        raise HTTPException(status_code=400, detail="max_terms must be positive.")
+    counts = await build_glossary(document, model_name, max_terms)
+    return {"file_id": file_id, "model_name": model_name, **counts}
+
+@app.get("/documents/{file_id}/glossary")
+async def document_glossary(file_id: str, model_name: str):
+    glossary = await asyncio.to_thread(glossaries.get, file_id, model_name)
+    if glossary is None:
+        await require_document(file_id)
+        raise HTTPException(status_code=404, detail="No glossary for this document and model. POST to /documents/{file_id}/glossary/ to build one.")
+    return glossary.to_dict()
+
+@app.get("/documents/{file_id}/terms")
+async def document_terms(file_id: str, max_terms: int = GLOSSARY_MAX_TERMS):
+    """The document's candidate glossary terms, ranked by TF-IDF over its pages. No LLM calls."""
+    document = await require_document(file_id)
+    candidates = await asyncio.to_thread(extract_terms, document.pages(), max_terms)
+    return {"file_id": file_id, "terms": [asdict(candidate) for candidate in candidates]}
+
+@app.get("/documents/{file_id}")
+async def document_info(file_id: str):
+    """Whether a document is ready on this deployment; 409 while any worker is still extracting it."""
+    document = await require_document(file_id)
+    return {
+        "file_id": document.file_id,
+        "filename": document.filename,
+        "num_pages": document.num_pages,
+        "num_paragraphs": document.num_paragraphs,
+        "status": "done",
+    }
+
+@app.get("/upload_pdf/status/{job_id}")
+async def upload_status(job_id: str):
+    job = extraction_service.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Upload job not found.")
+    return job.to_dict()
 
 @app.post("/qa/")
-async def question_answer(file_id: str = Form(...), query: str = Form(...), model_name: str = Form(...)):
-    if file_id not in pdf_texts:
-        raise HTTPException(status_code=404, detail="PDF not found. Please upload it first.")
+async def question_answer(
+    response: Response,
+    file_id: str = Form(...),
+    query: str = Form(...),
+    model_name: str = Form(...),
+    page_start: Optional[int] = Form(None), # answer from these pages only (1-based, inclusive)
+    page_end: Optional[int] = Form(None)
+):
+    document = await require_document(file_id)
     
-    pdf_text = pdf_texts[file_id]
     if not query:
         raise HTTPException(status_code=400, detail="Query cannot be empty.")
     if not model_name:
         raise HTTPException(status_code=400, detail="Model name cannot be empty.")
 
-    qa_prompt = f"Here is the entire document content:\n\n{pdf_text}\n\nQuestion: {query}\nAnswer:"
+    page_range = require_page_range(document, page_start, page_end).page_range
+    qa_prompt, prompt_tokens = await asyncio.to_thread(
+        build_qa_prompt, document, query, model_name=model_name, page_range=page_range
+    )
     
     try:
-        answer = call_llm(qa_prompt, model_name)
+        cache_key = make_cache_key(
+            model_name, "qa", file_id=file_id, query=normalize_question(query),
+            top_k=QA_TOP_K, chunk_size=QA_CHUNK_SIZE, chunk_overlap=QA_CHUNK_OVERLAP, page_range=page_range,
+        )
+        answer = await cached_llm_result("qa", cache_key, lambda: call_llm(qa_prompt, model_name, prompt_tokens=prompt_tokens), response)
         return {"answer": answer}
     except HTTPException:
         # Re-raise if it's an HTTPException from call_llm
@@ -85,84 +646,429 @@ async def question_answer(file_id: str = Form(...), query: str = Form(...), mode
         # Catch any other unexpected errors during the QA process
         raise HTTPException(status_code=500, detail=f"Error during Q&A processing: {str(e)}")
 
+# Conversational Q&A. The document context is fixed when a session starts, and
+# follow-ups add only the question and a compacted history, so providers with
+# prompt caching process the document once per session rather than per turn.
+qa_sessions = SessionStore(storage)
+session_prefixes = PrefixCache()
+
+def session_prefix(document: StoredDocument, mode: str, max_tokens: Optional[int] = None) -> Tuple[str, int]:
+    """
+    The session prefix and its token count, built once per document and mode
+    while they stay cached. A prefix over `max_tokens` is returned but not kept.
+    """
+    cached = session_prefixes.get(document.file_id, mode)
+    if cached is not None:
+        return cached
+    text = document_prefix(document.pages()) if mode == "document" else RETRIEVAL_INSTRUCTIONS
+    tokens = token_counter.count(text)
+    if max_tokens is not None and tokens > max_tokens:
+        return text, tokens
+    return session_prefixes.put(document.file_id, mode, text, tokens)
+
+def choose_session_mode(document: StoredDocument, model_name: str, mode: str):
+    """
+    Returns (mode, prefix_tokens). "auto" puts the whole document in the
+    session prefix when it fits the model next to the history, and otherwise
+    retrieves excerpts for each question.
+    """
+    budget = prompt_budget(model_name) - PROMPT_INSTRUCTION_TOKENS - QA_SESSION_HISTORY_TOKENS
+    if mode != "retrieval":
+        _, prefix_tokens = session_prefix(document, "document", max_tokens=budget)
+        if prefix_tokens <= budget:
+            return "document", prefix_tokens
+        if mode == "document":
+            raise HTTPException(
+                status_code=413,
+                detail=f"The document doesn't fit the {budget}-token session budget of {model_name}; use mode=retrieval.",
+            )
+    return "retrieval", session_prefix(document, "retrieval")[1]
+
+def session_excerpts(document: StoredDocument, query: str, model_name: str) -> str:
+    budget = prompt_budget(model_name) - PROMPT_INSTRUCTION_TOKENS - QA_SESSION_HISTORY_TOKENS
+    if document.index is None:
+        return fit_to_budget(document.text, budget)
+    return fit_to_budget(format_context(document.index.search(query, QA_TOP_K or 4)), budget)
+
+def require_session(session_id: str) -> QASession:
+    session = qa_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Q&A session not found or expired.")
+    return session
+
+@app.post("/qa/sessions/")
+async def create_qa_session(file_id: str = Form(...), model_name: str = Form(...), mode: str = Form("auto")):
+    document = await require_document(file_id)
+    if not model_name:
+        raise HTTPException(status_code=400, detail="Model name cannot be empty.")
+    if mode not in SESSION_MODES:
+        raise HTTPException(status_code=400, detail=f"Invalid session mode. Expected one of: {', '.join(SESSION_MODES)}.")
+    mode, prefix_tokens = await asyncio.to_thread(choose_session_mode, document, model_name, mode)
+    return qa_sessions.create(file_id, model_name, mode, prefix_tokens).summary()
+
+@app.post("/qa/sessions/{session_id}/")
+async def ask_in_qa_session(session_id: str, query: str = Form(...)):
+    """
+    Answers the next question of a session. The response reports this turn's
+    prompt tokens, the tokens the provider served from its prompt cache, and
+    what a stateless /qa/ request would have sent, plus session totals.
+    """
+    session = require_session(session_id)
+    if not query:
+        raise HTTPException(status_code=400, detail="Query cannot be empty.")
+    document = await require_document(session.file_id)
+    model_name = session.model_name
+
+    excerpts = None
+    if session.mode == "retrieval":
+        # Without an index the excerpts are the document trimmed to the budget, so tokenize off the loop.
+        excerpts = await asyncio.to_thread(session_excerpts, document, query, model_name)
+    with span("prompt_build", model_name):
+        # Cached after the session's first turn; rebuilding it means reading the whole document.
+        prefix_text, _ = await asyncio.to_thread(session_prefix, document, session.mode)
+        prefix = prefix_message(prefix_text, uses_cache_control(model_name))
+        messages = build_turn_messages(prefix, session.turns, query, excerpts)
+    with span("token_count", model_name):
+        # The prefix was counted when the session started.
+        prompt_tokens = session.prefix_tokens + await asyncio.to_thread(count_message_tokens, messages[1:])
+    query_tokens = token_counter.count(query)
+    if session.baseline_context_tokens is None:
+        # What a stateless /qa/ request sends besides the question is measured once per session.
+        _, baseline_tokens = await asyncio.to_thread(build_qa_prompt, document, query, model_name=model_name)
+        session.baseline_context_tokens = baseline_tokens - query_tokens
+    baseline_tokens = session.baseline_context_tokens + query_tokens
+
+    start = time.perf_counter()
+    llm_response = await call_llm_chat(messages, model_name, prompt_tokens)
+    turn = QATurn(
+        question=query,
+        answer=llm_response.choices[0].message.content or "",
+        prompt_tokens=prompt_tokens,
+        cached_tokens=cached_prompt_tokens(llm_response),
+        baseline_prompt_tokens=baseline_tokens,
+        latency_ms=(time.perf_counter() - start) * 1000,
+    )
+    session.turns.append(turn)
+    qa_sessions.save(session)
+    usage = {name: value for name, value in asdict(turn).items() if name not in ("question", "answer")}
+    return {"answer": turn.answer, "turn": len(session.turns), "usage": usage, "session": session.stats()}
+
+@app.get("/qa/sessions/{session_id}")
+async def get_qa_session(session_id: str):
+    session = require_session(session_id)
+    return {**session.summary(), "turns": [asdict(turn) for turn in session.turns]}
+
+@app.delete("/qa/sessions/{session_id}")
+async def delete_qa_session(session_id: str):
+    require_session(session_id)
+    qa_sessions.delete(session_id)
+    return {"session_id": session_id, "deleted": True}
+
+@app.post("/qa/stream/")
+async def question_answer_stream(
+    file_id: str = Form(...),
+    query: str = Form(...),
+    model_name: str = Form(...),
+    page_start: Optional[int] = Form(None),
+    page_end: Optional[int] = Form(None)
+):
+    document = await require_document(file_id)
+    if not query:
+        raise HTTPException(status_code=400, detail="Query cannot be empty.")
+    if not model_name:
+        raise HTTPException(status_code=400, detail="Model name cannot be empty.")
+
+    page_range = require_page_range(document, page_start, page_end).page_range
+    qa_prompt, prompt_tokens = await asyncio.to_thread(
+        build_qa_prompt, document, query, model_name=model_name, page_range=page_range
+    )
+    return sse_response(stream_llm_events(qa_prompt, model_name, "/qa/stream/", prompt_tokens))
+
 
 # Helper Functions (adapted from app.py, st.* calls removed)
 
-def extract_key_info(pdf_text: str, model_name: str, summary_length: str = "Comprehensive", keywords: Optional[str] = None):
+def build_summary_prompt(pdf_text: str, summary_length: str = "Comprehensive", keywords: Optional[str] = None) -> str:
+    with span("prompt_build"):
+        return _build_summary_prompt(pdf_text, summary_length, keywords)
+
+def _build_summary_prompt(pdf_text: str, summary_length: str, keywords: Optional[str]) -> str:
     prompt = f"PDF Content:\n{pdf_text}\n\n"
     if keywords:
         prompt += f"Focus on these keywords: {keywords}.\n"
     prompt += f"Provide a {summary_length} summary of the key information."
-    
-    # call_llm will raise HTTPException on failure
-    return call_llm(prompt, model_name)
+    return prompt
 
-def explain_term(term: str, context: Optional[str], model_name: str):
-    prompt = f"Explain the term '{term}'."
-    if context:
-        prompt += f" Provide the explanation in the context of: {context}."
-    else:
-        prompt += " Provide a general explanation."
+async def extract_key_info(pdf_text: FittedText, model_name: str, summary_length: str = "Comprehensive", keywords: Optional[str] = None):
+    prompt, prompt_tokens = with_template_tokens(
+        pdf_text, lambda text: build_summary_prompt(text, summary_length, keywords), model_name
+    )
     # call_llm will raise HTTPException on failure
-    return call_llm(prompt, model_name)
+    return await call_llm(prompt, model_name, prompt_tokens=prompt_tokens)
 
-def detect_misinformation(text_segment: str, model_name: str):
-    prompt = (
-        f"Analyze the following text segment for potential misinformation. "
-        f"Provide a brief assessment of its likelihood of being misinformation "
-        f"and highlight any specific claims that might be inaccurate or misleading. "
-        f"Text to analyze: \"{text_segment}\""
+async def plan_summary(pages: DocumentView, model_name: str, mode: str) -> Optional[FittedText]:
+    """
+    The pages' text fitted to the model's prompt budget for a single-pass
+    summary, or None to map-reduce. In auto mode, page ranges that don't fit
+    the budget are map-reduced too. The text is tokenized once, off the event loop.
+    """
+    if use_map_reduce(pages.text, mode):
+        return None
+    with span("token_count", model_name):
+        fitted = await afit_text(pages.text, prompt_budget(model_name) - PROMPT_INSTRUCTION_TOKENS)
+    return None if mode == "auto" and fitted.truncated else fitted
+
+async def prepare_summary_prompt(
+    pages: DocumentView, model_name: str, summary_length: str, keywords: Optional[str], fitted: Optional[FittedText],
+    check_cancelled: Optional[Callable[[], None]] = None,
+) -> Tuple[str, Optional[int]]:
+    """
+    Single-pass prompt for small documents, with its token count; otherwise
+    runs the map phase and returns the (short, uncounted) reduce prompt.
+    """
+    if fitted is None:
+        prompt = await summarizer.reduce_prompt(
+            pages.file_id, pages.pages(), model_name, summary_length, keywords, first_page=pages.first_page,
+            check_cancelled=check_cancelled,
+        )
+        return prompt, None
+    return with_template_tokens(fitted, lambda text: build_summary_prompt(text, summary_length, keywords), model_name)
+
+async def summarize_document(
+    pages: DocumentView, model_name: str, summary_length: str, keywords: Optional[str], fitted: Optional[FittedText],
+    check_cancelled: Optional[Callable[[], None]] = None,
+):
+    """`check_cancelled` (background precompute) runs before each LLM call and may raise to stop the work."""
+    if fitted is not None:
+        return await extract_key_info(fitted, model_name, summary_length, keywords)
+    prompt, _ = await prepare_summary_prompt(pages, model_name, summary_length, keywords, None, check_cancelled)
+    if check_cancelled is not None:
+        check_cancelled()
+    return await call_llm(prompt, model_name)
+
+def validate_summary_mode(mode: str):
+    if mode not in SUMMARY_MODES:
+        raise HTTPException(status_code=400, detail=f"Invalid summary mode. Expected one of: {', '.join(SUMMARY_MODES)}.")
+
+def summary_cache_key(
+    file_id: str, model_name: str, summary_length: str, keywords: Optional[str], map_reduce: bool,
+    page_range: Optional[Tuple[int, int]] = None,
+) -> str:
+    return make_cache_key(
+        model_name, "summarize", file_id=file_id, summary_length=summary_length,
+        keywords=normalize_keywords(keywords), map_reduce=map_reduce, page_range=page_range,
+    )
+
+async def precompute_summary(document: StoredDocument, model_name: str, summary_length: str, task: ArtifactTask):
+    """Stores the summary that /summarize/ would return with mode=auto and no keywords in the response cache."""
+    pages = document.view()
+    fitted = await plan_summary(pages, model_name, "auto")
+    task.check_cancelled()
+    await response_cache.get_or_call(
+        "summarize", summary_cache_key(document.file_id, model_name, summary_length, None, fitted is None),
+        lambda: summarize_document(pages, model_name, summary_length, None, fitted, task.check_cancelled),
+        count=False,  # a warm-up isn't a client request, so it stays out of the hit rate
+    )
+
+def schedule_artifacts(file_id: str):
+    """
+    Queues background work for a newly extracted document: its outline, then
+    (with PRECOMPUTE_SUMMARY_MODEL) the default summary and (with
+    PRECOMPUTE_GLOSSARY_MODEL) the glossary. The retrieval index is already
+    built when the document is loaded after extraction.
+    """
+    def outline_task(task: ArtifactTask):
+        document = document_store.get(file_id)
+        task.check_cancelled()
+        if document is not None:
+            load_outline(document)
+
+    def summary_task(task: ArtifactTask):
+        document = document_store.get(file_id)
+        task.check_cancelled()
+        if document is not None:
+            asyncio.run(precompute_summary(document, PRECOMPUTE_SUMMARY_MODEL, PRECOMPUTE_SUMMARY_LENGTH, task))
+
+    def glossary_task(task: ArtifactTask):
+        document = document_store.get(file_id)
+        task.check_cancelled()
+        if document is not None:
+            asyncio.run(build_glossary(document, PRECOMPUTE_GLOSSARY_MODEL, GLOSSARY_MAX_TERMS, task.check_cancelled))
+
+    artifact_pipeline.submit(file_id, "outline", outline_task, PRIORITY_OUTLINE)
+    if PRECOMPUTE_SUMMARY_MODEL and response_cache.enabled_for("summarize"):
+        artifact_pipeline.submit(file_id, "summary", summary_task, PRIORITY_SUMMARY)
+    if PRECOMPUTE_GLOSSARY_MODEL:
+        artifact_pipeline.submit(file_id, "glossary", glossary_task, PRIORITY_GLOSSARY)
+
+async def wait_for_precomputed_summary(file_id: str, model_name: str, summary_length: str, keywords: Optional[str], mode: str):
+    """
+    A request for the summary being precomputed waits for it instead of paying
+    for it a second time. If it is still queued, it is cancelled and the
+    request computes the summary itself, filling the same cache entry.
+    """
+    if keywords or mode != "auto" or (model_name, summary_length) != (PRECOMPUTE_SUMMARY_MODEL, PRECOMPUTE_SUMMARY_LENGTH):
+        return
+    if artifact_pipeline.cancel_if_queued(file_id, "summary"):
+        return
+    task = artifact_pipeline.get(file_id, "summary")
+    if task is not None and task.status == "running":
+        await asyncio.to_thread(task.finished.wait, PRECOMPUTE_WAIT_SECONDS)
+
+async def build_glossary(
+    document: StoredDocument, model_name: str, max_terms: int, check_cancelled: Optional[Callable[[], None]] = None,
+) -> dict:
+    """
+    Extracts the document's candidate terms and explains the ones its glossary
+    doesn't have yet in batched LLM calls. Returns counts for the response.
+    Background builds pass `check_cancelled`, which stops them between batches.
+    """
+    glossary = await asyncio.to_thread(glossaries.get, document.file_id, model_name)
+    candidates = await asyncio.to_thread(extract_terms, document.pages(), max_terms)
+    missing = [candidate for candidate in candidates if glossary is None or glossary.lookup(candidate.term) is None]
+    entries = await glossary_builder.explain(missing, model_name, check_cancelled)
+    glossary = await asyncio.to_thread(glossaries.add_entries, document.file_id, model_name, entries)
+    return {
+        "candidates": len(candidates),
+        "explained": len(entries),
+        "failed": len(missing) - len(entries),
+        "terms": len(glossary.entries),
+    }
+
+async def explain_document_term(document: StoredDocument, term: str, model_name: str, response: Response) -> dict:
+    """
+    Answers from the document's glossary. A term it doesn't have is explained
+    live, in the context of its first use in the document, and added to it.
+    Terms the document never uses are explained but not added.
+    """
+    glossary = await asyncio.to_thread(glossaries.get, document.file_id, model_name)
+    entry = glossary.lookup(term) if glossary is not None else None
+    if entry is not None:
+        response.headers["X-Cache"] = "HIT"
+        return {"explanation": entry.explanation, "source": "glossary", "page": entry.page}
+    page, context = await asyncio.to_thread(locate_term, document.pages(), term)
+    explanation = await explain_term(term, context, model_name)
+    if page is not None:
+        entry = GlossaryEntry(term.strip(), explanation, page, source="live")
+        await asyncio.to_thread(glossaries.add_entries, document.file_id, model_name, [entry])
+    response.headers["X-Cache"] = "MISS"
+    return {"explanation": explanation, "source": "live", "page": page}
+
+async def explain_term(term: str, context: Optional[str], model_name: str):
+    if not context:
+        # call_llm will raise HTTPException on failure
+        return await call_llm(f"Explain the term '{term}'. Provide a general explanation.", model_name)
+    prompt, prompt_tokens = with_template_tokens(
+        await fit_segment(context, model_name),
+        lambda text: f"Explain the term '{term}'. Provide the explanation in the context of: {text}.",
+        model_name,
+    )
+    return await call_llm(prompt, model_name, prompt_tokens=prompt_tokens)
+
+async def detect_misinformation(text_segment: str, model_name: str):
+    prompt, prompt_tokens = with_template_tokens(
+        await fit_segment(text_segment, model_name),
+        lambda text: (
+            f"Analyze the following text segment for potential misinformation. "
+            f"Provide a brief assessment of its likelihood of being misinformation "
+            f"and highlight any specific claims that might be inaccurate or misleading. "
+            f"Text to analyze: \"{text}\""
+        ),
+        model_name,
     )
     # call_llm will raise HTTPException on failure
-    return call_llm(prompt, model_name)
+    return await call_llm(prompt, model_name, prompt_tokens=prompt_tokens)
 
-def analyze_sentiment(text_segment: str, model_name: str):
-    prompt = (
-        f"Analyze the sentiment of the following text segment. "
-        f"Indicate whether the sentiment is positive, negative, or neutral, "
-        f"and briefly explain your reasoning. "
-        f"Text to analyze: \"{text_segment}\""
+async def analyze_sentiment(text_segment: str, model_name: str):
+    prompt, prompt_tokens = with_template_tokens(
+        await fit_segment(text_segment, model_name),
+        lambda text: (
+            f"Analyze the sentiment of the following text segment. "
+            f"Indicate whether the sentiment is positive, negative, or neutral, "
+            f"and briefly explain your reasoning. "
+            f"Text to analyze: \"{text}\""
+        ),
+        model_name,
     )
     # call_llm will raise HTTPException on failure
-    return call_llm(prompt, model_name)
+    return await call_llm(prompt, model_name, prompt_tokens=prompt_tokens)
 
 # API Endpoints
 
 @app.post("/summarize/")
 async def summarize_text(
+    response: Response,
     file_id: str = Form(...),
     model_name: str = Form(...),
     summary_length: str = Form("Comprehensive"), # Default from app.py
-    keywords: Optional[str] = Form(None)
+    keywords: Optional[str] = Form(None),
+    mode: str = Form("auto"), # auto | single | map_reduce
+    page_start: Optional[int] = Form(None), # summarize these pages only (1-based, inclusive)
+    page_end: Optional[int] = Form(None)
 ):
-    if file_id not in pdf_texts:
-        raise HTTPException(status_code=404, detail="PDF not found. Please upload it first.")
-    
-    pdf_text = pdf_texts[file_id]
+    document = await require_document(file_id)
     if not model_name: # Basic validation
         raise HTTPException(status_code=400, detail="Model name cannot be empty.")
+    validate_summary_mode(mode)
+    pages = require_page_range(document, page_start, page_end)
+    if pages.is_whole_document:
+        await wait_for_precomputed_summary(file_id, model_name, summary_length, keywords, mode)
 
     try:
-        summary_info = extract_key_info(pdf_text, model_name, summary_length, keywords)
+        fitted = await plan_summary(pages, model_name, mode)
+        cache_key = summary_cache_key(file_id, model_name, summary_length, keywords, fitted is None, pages.page_range)
+        summary_info = await cached_llm_result(
+            "summarize", cache_key,
+            lambda: summarize_document(pages, model_name, summary_length, keywords, fitted), response
+        )
         return {"summary": summary_info}
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error during summarization: {str(e)}")
 
+@app.post("/summarize/stream/")
+async def summarize_text_stream(
+    file_id: str = Form(...),
+    model_name: str = Form(...),
+    summary_length: str = Form("Comprehensive"),
+    keywords: Optional[str] = Form(None),
+    mode: str = Form("auto"),
+    page_start: Optional[int] = Form(None),
+    page_end: Optional[int] = Form(None)
+):
+    document = await require_document(file_id)
+    if not model_name:
+        raise HTTPException(status_code=400, detail="Model name cannot be empty.")
+    validate_summary_mode(mode)
+
+    pages = require_page_range(document, page_start, page_end)
+    fitted = await plan_summary(pages, model_name, mode)
+    prompt, prompt_tokens = await prepare_summary_prompt(pages, model_name, summary_length, keywords, fitted)
+    return sse_response(stream_llm_events(prompt, model_name, "/summarize/stream/", prompt_tokens))
+
 @app.post("/explain_term/")
 async def explain_term_api(
+    response: Response,
     term: str = Form(...),
     model_name: str = Form(...),
-    context: Optional[str] = Form(None)
+    context: Optional[str] = Form(None),
+    file_id: Optional[str] = Form(None) # answer from this document's glossary
 ):
     if not term:
         raise HTTPException(status_code=400, detail="Term cannot be empty.")
     if not model_name:
         raise HTTPException(status_code=400, detail="Model name cannot be empty.")
-        
+
+    # With user-supplied context the explanation is specific to it, so it
+    # skips the document glossary and goes through the response cache.
+    if file_id and not context:
+        return await explain_document_term(await require_document(file_id), term, model_name, response)
+
     try:
-        explanation = explain_term(term, context, model_name)
+        cache_key = make_cache_key(model_name, "explain_term", term=normalize_question(term), context=normalize_text(context))
+        explanation = await cached_llm_result(
+            "explain_term", cache_key, lambda: explain_term(term, context, model_name), response
+        )
         return {"explanation": explanation}
     except HTTPException:
         raise
@@ -171,6 +1077,7 @@ async def explain_term_api(
 
 @app.post("/detect_misinformation/")
 async def detect_misinfo_api(
+    response: Response,
     text_segment: str = Form(...),
     model_name: str = Form(...)
 ):
@@ -180,7 +1087,10 @@ async def detect_misinfo_api(
         raise HTTPException(status_code=400, detail="Model name cannot be empty.")
 
     try:
-        analysis = detect_misinformation(text_segment, model_name)
+        cache_key = make_cache_key(model_name, "detect_misinformation", text=normalize_text(text_segment))
+        analysis = await cached_llm_result(
+            "detect_misinformation", cache_key, lambda: detect_misinformation(text_segment, model_name), response
+        )
         return {"misinformation_analysis": analysis}
     except HTTPException:
         raise
@@ -189,6 +1099,7 @@ async def detect_misinfo_api(
 
 @app.post("/analyze_sentiment/")
 async def analyze_sentiment_api(
+    response: Response,
     text_segment: str = Form(...),
     model_name: str = Form(...)
 ):
@@ -198,9 +1109,40 @@ async def analyze_sentiment_api(
         raise HTTPException(status_code=400, detail="Model name cannot be empty.")
 
     try:
-        sentiment_result = analyze_sentiment(text_segment, model_name)
+        cache_key = make_cache_key(model_name, "analyze_sentiment", text=normalize_text(text_segment))
+        sentiment_result = await cached_llm_result(
+            "analyze_sentiment", cache_key, lambda: analyze_sentiment(text_segment, model_name), response
+        )
         return {"sentiment_analysis": sentiment_result}
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error during sentiment analysis: {str(e)}")
+
+@app.post("/analyze_sentiment/batch/")
+async def analyze_sentiment_batch_api(
+    model_name: str = Form(...),
+    text_segments: Optional[List[str]] = Form(None),
+    file_id: Optional[str] = Form(None),
+    segmentation: str = Form("paragraph"), # paragraph | page | chunk, used with file_id
+    page_start: Optional[int] = Form(None), # analyze these pages of file_id only (1-based, inclusive)
+    page_end: Optional[int] = Form(None)
+):
+    if not model_name:
+        raise HTTPException(status_code=400, detail="Model name cannot be empty.")
+    segments = await batch_segments(text_segments, file_id, segmentation, page_start, page_end)
+    return ndjson_response(stream_batch_results("sentiment", segments, model_name))
+
+@app.post("/detect_misinformation/batch/")
+async def detect_misinfo_batch_api(
+    model_name: str = Form(...),
+    text_segments: Optional[List[str]] = Form(None),
+    file_id: Optional[str] = Form(None),
+    segmentation: str = Form("paragraph"),
+    page_start: Optional[int] = Form(None),
+    page_end: Optional[int] = Form(None)
+):
+    if not model_name:
+        raise HTTPException(status_code=400, detail="Model name cannot be empty.")
+    segments = await batch_segments(text_segments, file_id, segmentation, page_start, page_end)
+    return ndjson_response(stream_batch_results("misinformation", segments, model_name))
@@ -0,0 +1,307 @@
+import bisect
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Structured per-request log lines go to their own logger so they can be routed separately.
+request_logger = logging.getLogger("bookai.requests")
+
+# Emit one JSON log line per request with its status, duration and timing spans.
+METRICS_LOG_REQUESTS = os.getenv("METRICS_LOG_REQUESTS", "0").lower() in ("1", "true", "yes")
+
+# Seconds. Covers everything from a token count to a long map-reduce summary.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+LabelValues = Tuple[str, ...]
+
+_known_models: frozenset = frozenset()
+
+
+def endpoint_label(scope) -> str:
+    # The route template ("/documents/{file_id}") keeps label cardinality bounded.
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    return path if path else "unmatched"
+
+
+def register_models(names: Iterable[str]):
+    """Sets the models (those in models_config.json) that get their own "model" label value."""
+    global _known_models
+    _known_models = frozenset(name.rpartition("/")[2] for name in names)
+
+
+def _model_label(model: Optional[str]) -> str:
+    # The model comes from the client, so only configured models get their own
+    # series; anything else would let each request add one.
+    if not model:
+        return ""
+    name = model.rpartition("/")[2]
+    return name if name in _known_models else "other"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    """A monotonically increasing Prometheus counter with a fixed set of label names."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram:
+    """
+    A Prometheus histogram. Observations only bisect into a fixed bucket list
+    and bump a few numbers under a lock, so it is cheap enough for every request.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count], sum.
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            snapshot = sorted((labels, list(counts), total[0]) for labels, (counts, total) in self._series.items())
+        for labels, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}"
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class CallbackMetric:
+    """A counter or gauge whose values are read from `collect` at scrape time, for stats kept elsewhere."""
+
+    def __init__(self, name: str, documentation: str, kind: str, labelnames: Sequence[str], collect: Callable[[], Dict[LabelValues, float]]):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in sorted(self.collect().items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+    def clear(self):
+        pass
+
+
+class MetricsRegistry:
+    """Holds the application's metrics and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name: str, documentation: str, kind: str, labelnames: Sequence[str], collect: Callable[[], Dict[LabelValues, float]]) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, kind, labelnames, collect))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        for metric in self._metrics.values():
+            metric.clear()
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+registry = MetricsRegistry()
+requests_total = registry.counter(
+    "bookai_requests_total", "HTTP requests by endpoint, method and status code.", ("endpoint", "method", "status")
+)
+request_duration = registry.histogram(
+    "bookai_request_duration_seconds", "Time from receiving a request to sending the last byte of its response.",
+    ("endpoint", "method"),
+)
+span_duration = registry.histogram(
+    "bookai_span_duration_seconds",
+    "Time spent in one stage of a request (pdf_parse, prompt_build, token_count, queue_wait, ttft, llm_total).",
+    ("endpoint", "span", "model"),
+)
+
+
+@dataclass
+class RequestTrace:
+    """Timing spans of the request being served, filled in as it runs and reported when it ends."""
+    scope: dict
+    model: str = ""
+    spans: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def endpoint(self) -> str:
+        return endpoint_label(self.scope)
+
+    def add(self, name: str, seconds: float):
+        # Stages that run more than once (e.g. map-reduce LLM calls) accumulate.
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+
+current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar("current_trace", default=None)
+
+
+def record_span(name: str, seconds: float, model: Optional[str] = None, endpoint: Optional[str] = None):
+    """
+    Adds a timing to the span histogram and to the current request's trace.
+    Work outside a request (e.g. background PDF extraction) passes `endpoint`.
+    Models missing from models_config.json share the "other" label.
+    """
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(name, seconds)
+        if model and not trace.model:
+            trace.model = model
+    endpoint = endpoint or (trace.endpoint if trace is not None else "background")
+    span_duration.observe(seconds, endpoint, name, _model_label(model))
+
+
+@contextmanager
+def span(name: str, model: Optional[str] = None, endpoint: Optional[str] = None):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start, model, endpoint)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that traces every HTTP request: it counts requests, times
+    them until the last body chunk is sent (so streamed responses are covered)
+    and exposes a RequestTrace through `current_trace` for the spans recorded
+    while serving it. With `log_requests`, each request is also logged as JSON.
+    """
+
+    def __init__(self, app, log_requests: bool = METRICS_LOG_REQUESTS):
+        self.app = app
+        self.log_requests = log_requests
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        trace = RequestTrace(scope)
+        token = current_trace.set(trace)
+        status = 500
+        finished = False
+
+        def finish():
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+            duration = time.perf_counter() - start
+            endpoint = endpoint_label(scope)
+            requests_total.inc(endpoint, scope["method"], str(status))
+            request_duration.observe(duration, endpoint, scope["method"])
+            if self.log_requests:
+                request_logger.info(json.dumps({
+                    "endpoint": endpoint,
+                    "path": scope["path"],
+                    "method": scope["method"],
+                    "status": status,
+                    "duration_ms": round(duration * 1000, 2),
+                    "model": trace.model or None,
+                    "spans_ms": {name: round(seconds * 1000, 2) for name, seconds in trace.spans.items()},
+                }))
+
+        async def send_with_metrics(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body"):
+                finish()
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            finish()
+            current_trace.reset(token)
@@ -0,0 +1,282 @@
+import io
+import json
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import PyPDF2
+
+from storage import StorageBackend
+
+PDF_EXTRACTION_WORKERS = int(os.getenv("PDF_EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+# Pages handed to a worker per task. Each task re-opens the PDF, so very small
+# ranges waste time parsing the cross-reference table over and over.
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+# Finished jobs kept around for status polling before the oldest are dropped.
+MAX_TRACKED_JOBS = 1000
+# How long job state stays pollable in shared storage, and how long a worker's
+# claim on a document lasts without progress (so a crashed worker's claim expires).
+JOB_STATE_TTL_SECONDS = 24 * 3600
+ACTIVE_JOB_TTL_SECONDS = 15 * 60
+
+
+# PDF bytes, or the path of a PDF on disk. Paths are read through the file
+# object, so only the parts of the file PyPDF2 seeks to are loaded, and worker
+# processes receive a short string instead of a pickled copy of the whole PDF.
+PdfSource = Union[bytes, str]
+
+
+def _open(source: PdfSource):
+    return io.BytesIO(source) if isinstance(source, bytes) else open(source, "rb")
+
+
+def count_pages(source: PdfSource) -> int:
+    with _open(source) as stream:
+        return len(PyPDF2.PdfReader(stream).pages)
+
+
+def extract_page_range(source: PdfSource, start: int, end: int) -> List[str]:
+    """Extracts pages [start, end). Runs inside a worker process."""
+    with _open(source) as stream:
+        reader = PyPDF2.PdfReader(stream)
+        return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def page_ranges(num_pages: int, pages_per_task: int) -> List[Tuple[int, int]]:
+    step = max(1, pages_per_task)
+    return [(start, min(start + step, num_pages)) for start in range(0, num_pages, step)]
+
+
+def iter_pages(
+    source: PdfSource,
+    executor: Optional[Executor] = None,
+    pages_per_task: int = PDF_PAGES_PER_TASK,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> Iterator[str]:
+    """
+    Yields the text of every page in order, splitting the page ranges across
+    `executor` (in-process when None). Pages are yielded as soon as every page
+    before them is done, so callers can store them while later ranges are
+    still being parsed. `on_progress` is called with (pages_done, pages_total).
+    """
+    num_pages = count_pages(source)
+    ranges = page_ranges(num_pages, pages_per_task)
+    if on_progress:
+        on_progress(0, num_pages)
+    if executor is None or len(ranges) <= 1:
+        with _open(source) as stream:
+            reader = PyPDF2.PdfReader(stream)
+            for start, end in ranges:
+                for i in range(start, end):
+                    yield reader.pages[i].extract_text() or ""
+                if on_progress:
+                    on_progress(end, num_pages)
+        return
+
+    futures = {executor.submit(extract_page_range, source, start, end): start for start, end in ranges}
+    finished: Dict[int, List[str]] = {}
+    next_start, pages_done = 0, 0
+    try:
+        for future in as_completed(futures):
+            page_texts = future.result()
+            finished[futures[future]] = page_texts
+            pages_done += len(page_texts)
+            if on_progress:
+                on_progress(pages_done, num_pages)
+            while next_start in finished:
+                page_texts = finished.pop(next_start)
+                next_start += len(page_texts)
+                yield from page_texts
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def extract_pages(
+    source: PdfSource,
+    executor: Optional[Executor] = None,
+    pages_per_task: int = PDF_PAGES_PER_TASK,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> List[str]:
+    """All page texts in order; see `iter_pages`."""
+    return list(iter_pages(source, executor, pages_per_task, on_progress))
+
+
+def _remove_file(source: PdfSource):
+    if isinstance(source, str):
+        try:
+            os.remove(source)
+        except FileNotFoundError:
+            pass
+
+
+@dataclass
+class ExtractionJob:
+    job_id: str
+    file_id: str
+    filename: str
+    status: str = "processing"  # processing | done | failed
+    pages_done: int = 0
+    pages_total: int = 0
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        detail = self.error or ("PDF processed successfully." if self.status == "done" else "PDF is being processed.")
+        return {
+            "job_id": self.job_id,
+            "file_id": self.file_id,
+            "filename": self.filename,
+            "status": self.status,
+            "pages_done": self.pages_done,
+            "pages_total": self.pages_total,
+            "detail": detail,
+        }
+
+
+class ExtractionService:
+    """
+    Runs PDF text extraction off the event loop. Each job is coordinated from a
+    small thread pool while the page ranges themselves are parsed in a process
+    pool, so uploads return immediately and progress can be polled.
+
+    With `storage`, job state and a per-document claim are shared with the other
+    API workers: any worker can report a job's progress, and a document being
+    extracted by one worker isn't extracted again by another.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = PDF_EXTRACTION_WORKERS,
+        pages_per_task: int = PDF_PAGES_PER_TASK,
+        storage: Optional[StorageBackend] = None,
+    ):
+        self.max_workers = max(1, max_workers)
+        self.pages_per_task = pages_per_task
+        self.storage = storage
+        self.jobs: Dict[str, ExtractionJob] = {}
+        self._active_by_file: Dict[str, ExtractionJob] = {}
+        self._lock = threading.Lock()
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._coordinator = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pdf-extraction")
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._process_pool is None:
+            # Spawned workers don't inherit the server's threads or open sockets.
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._process_pool
+
+    def submit(
+        self,
+        file_id: str,
+        filename: str,
+        source: PdfSource,
+        on_pages: Callable[[ExtractionJob, Iterator[str]], None],
+        delete_source: bool = False,
+    ) -> ExtractionJob:
+        """
+        Starts extracting `source` and returns the job immediately. A document
+        already being extracted returns its existing job. `on_pages` consumes
+        the page texts in order while extraction is still running, and returns
+        before the job is marked done. With `delete_source`, the PDF file at
+        `source` is removed once it is no longer needed.
+        """
+        with self._lock:
+            active = self._active_by_file.get(file_id)
+            if active is None:
+                job = ExtractionJob(job_id=uuid.uuid4().hex, file_id=file_id, filename=filename)
+                active = self._claimed_elsewhere(job)
+            if active is None:
+                self.jobs[job.job_id] = job
+                self._prune_finished_jobs()
+                self._active_by_file[file_id] = job
+                self._publish(job)
+        if active is not None:
+            if delete_source:
+                _remove_file(source)
+            return active
+        self._coordinator.submit(self._run, job, source, on_pages, delete_source)
+        return job
+
+    def _run(
+        self, job: ExtractionJob, source: PdfSource,
+        on_pages: Callable[[ExtractionJob, Iterator[str]], None], delete_source: bool,
+    ):
+        def progress(done: int, total: int):
+            job.pages_done, job.pages_total = done, total
+            self._publish(job)
+
+        try:
+            on_pages(job, iter_pages(source, self._pool(), self.pages_per_task, progress))
+            job.status = "done"
+        except Exception as e:
+            job.error = f"Failed to process PDF: {str(e)}"
+            job.status = "failed"
+        finally:
+            if delete_source:
+                _remove_file(source)
+            with self._lock:
+                self._active_by_file.pop(job.file_id, None)
+                self._publish(job)
+                self._release(job)
+
+    def _claimed_elsewhere(self, job: ExtractionJob) -> Optional[ExtractionJob]:
+        """Claims the document for `job`, or returns the job of the worker that already did."""
+        if self.storage is None:
+            return None
+        if self.storage.add("active_extractions", job.file_id, job.job_id.encode(), ACTIVE_JOB_TTL_SECONDS):
+            return None
+        owner = self.storage.get("active_extractions", job.file_id)
+        other = self.get(owner.decode()) if owner is not None else None
+        if other is None or other.status != "processing":
+            # The claim belongs to a job that just ended; take it over.
+            self.storage.set("active_extractions", job.file_id, job.job_id.encode(), ACTIVE_JOB_TTL_SECONDS)
+            return None
+        return other
+
+    def _publish(self, job: ExtractionJob):
+        if self.storage is None:
+            return
+        self.storage.set("extraction_jobs", job.job_id, json.dumps(asdict(job)).encode(), JOB_STATE_TTL_SECONDS)
+        if job.status == "processing":
+            # Progress renews the claim, so only a stalled or crashed worker loses it.
+            self.storage.set("active_extractions", job.file_id, job.job_id.encode(), ACTIVE_JOB_TTL_SECONDS)
+
+    def _release(self, job: ExtractionJob):
+        if self.storage is None:
+            return
+        owner = self.storage.get("active_extractions", job.file_id)
+        if owner is not None and owner.decode() == job.job_id:
+            self.storage.delete("active_extractions", job.file_id)
+
+    def _prune_finished_jobs(self):
+        excess = len(self.jobs) - MAX_TRACKED_JOBS
+        if excess <= 0:
+            return
+        finished = [job_id for job_id, job in self.jobs.items() if job.status != "processing"]
+        for job_id in finished[:excess]:
+            del self.jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[ExtractionJob]:
+        job = self.jobs.get(job_id)
+        if job is None and self.storage is not None:
+            state = self.storage.get("extraction_jobs", job_id)
+            if state is not None:
+                job = ExtractionJob(**json.loads(state))
+        return job
+
+    def is_processing(self, file_id: str) -> bool:
+        if file_id in self._active_by_file:
+            return True
+        return self.storage is not None and self.storage.get("active_extractions", file_id) is not None
+
+    def shutdown(self):
+        self._coordinator.shutdown(wait=False, cancel_futures=True)
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
@@ -0,0 +1,203 @@
+import itertools
+import logging
+import os
+import queue
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Background artifact generation after an upload. PRECOMPUTE_WORKERS=0 turns it off.
+PRECOMPUTE_WORKERS = int(os.getenv("PRECOMPUTE_WORKERS", "2"))
+# Tasks waiting beyond this are not queued (the work then happens on first use instead).
+PRECOMPUTE_MAX_QUEUE = int(os.getenv("PRECOMPUTE_MAX_QUEUE", "1000"))
+# Documents whose task statuses are remembered. Beyond this, the least recently
+# submitted documents with no queued or running task are forgotten.
+PRECOMPUTE_MAX_TRACKED = int(os.getenv("PRECOMPUTE_MAX_TRACKED", "1000"))
+# Model used to precompute each document's default summary. Empty skips the
+# summary, since unlike the other artifacts it costs an LLM call per upload.
+PRECOMPUTE_SUMMARY_MODEL = os.getenv("PRECOMPUTE_SUMMARY_MODEL", "")
+PRECOMPUTE_SUMMARY_LENGTH = os.getenv("PRECOMPUTE_SUMMARY_LENGTH", "Medium")
+# Model used to build each document's glossary in batched LLM calls. Empty
+# skips it; /explain_term/ then fills the glossary one lookup at a time.
+PRECOMPUTE_GLOSSARY_MODEL = os.getenv("PRECOMPUTE_GLOSSARY_MODEL", "")
+# How long a request for the default summary waits on a precompute already in progress.
+PRECOMPUTE_WAIT_SECONDS = float(os.getenv("PRECOMPUTE_WAIT_SECONDS", "120"))
+
+# Lower runs first: cheap local artifacts before LLM work.
+PRIORITY_OUTLINE = 10
+PRIORITY_SUMMARY = 50
+PRIORITY_GLOSSARY = 60
+
+
+class TaskCancelled(Exception):
+    """Raised by ArtifactTask.check_cancelled so long-running work can stop early."""
+
+
+@dataclass
+class ArtifactTask:
+    file_id: str
+    name: str
+    run: Callable[["ArtifactTask"], None]
+    priority: int
+    status: str = "queued"  # queued | running | done | failed | cancelled | dropped
+    error: Optional[str] = None
+    finished: threading.Event = field(default_factory=threading.Event, repr=False)
+    _cancelled: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def check_cancelled(self):
+        if self._cancelled.is_set():
+            raise TaskCancelled(f"{self.name} for {self.file_id} was cancelled.")
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "status": self.status, "priority": self.priority, "error": self.error}
+
+
+class ArtifactPipeline:
+    """
+    A bounded pool of worker threads that precomputes per-document artifacts
+    from a priority queue. Tasks are keyed by (file_id, name): submitting one
+    that is already queued or running returns the existing task. `cancel`
+    drops a document's queued tasks and asks its running ones to stop at their
+    next `check_cancelled`, e.g. when the document is evicted. Statuses of
+    finished tasks are kept for at most `max_tracked` documents.
+    """
+
+    def __init__(self, workers: int = PRECOMPUTE_WORKERS, max_queue: int = PRECOMPUTE_MAX_QUEUE,
+                 max_tracked: int = PRECOMPUTE_MAX_TRACKED):
+        self.workers = max(0, workers)
+        self.max_tracked = max(0, max_tracked)
+        self._queue: "queue.PriorityQueue[Tuple[int, int, Optional[ArtifactTask]]]" = queue.PriorityQueue(max(0, max_queue))
+        self._sequence = itertools.count()
+        self._tasks: Dict[str, Dict[str, ArtifactTask]] = {}
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._counters = {"submitted": 0, "done": 0, "failed": 0, "cancelled": 0, "dropped": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"precompute-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, file_id: str, name: str, run: Callable[[ArtifactTask], None], priority: int) -> Optional[ArtifactTask]:
+        """Queues `run(task)` for a document. Returns None when the pipeline is disabled."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            existing = self._tasks.get(file_id, {}).get(name)
+            if existing is not None and existing.status in ("queued", "running"):
+                return existing
+            task = ArtifactTask(file_id, name, run, priority)
+            # Re-inserted so that documents stay ordered by their latest submission.
+            tasks = self._tasks.pop(file_id, {})
+            tasks[name] = task
+            self._tasks[file_id] = tasks
+            self._counters["submitted"] += 1
+            self._start_workers()
+            try:
+                self._queue.put_nowait((priority, next(self._sequence), task))
+            except queue.Full:
+                self._finish(task, "dropped")
+                logger.warning("Precompute queue is full; %s for %s will be computed on first use", name, file_id)
+        return task
+
+    def _finish(self, task: ArtifactTask, status: str, error: Optional[str] = None):
+        task.status, task.error = status, error
+        self._counters[status] += 1
+        task.finished.set()
+        self._prune()
+
+    def _prune(self):
+        """Forgets the oldest fully finished documents while more than `max_tracked` are tracked."""
+        excess = len(self._tasks) - self.max_tracked
+        if excess <= 0:
+            return
+        for file_id, tasks in list(self._tasks.items()):
+            if excess <= 0:
+                break
+            if all(task.finished.is_set() for task in tasks.values()):
+                del self._tasks[file_id]
+                excess -= 1
+
+    def _work(self):
+        while True:
+            _, _, task = self._queue.get()
+            if task is None:
+                return
+            with self._lock:
+                if task.cancelled:
+                    continue  # already reported as cancelled
+                task.status = "running"
+            try:
+                task.run(task)
+            except TaskCancelled:
+                with self._lock:
+                    self._finish(task, "cancelled")
+            except Exception as e:
+                logger.warning("Precomputing %s for %s failed: %s", task.name, task.file_id, e)
+                with self._lock:
+                    self._finish(task, "failed", str(e))
+            else:
+                with self._lock:
+                    self._finish(task, "cancelled" if task.cancelled else "done")
+
+    def cancel(self, file_id: str) -> int:
+        """Cancels a document's unfinished tasks and forgets its finished ones. Returns the number cancelled."""
+        with self._lock:
+            tasks = self._tasks.pop(file_id, {})
+            cancelled = 0
+            for task in tasks.values():
+                if task.status not in ("queued", "running"):
+                    continue
+                task._cancelled.set()
+                cancelled += 1
+                if task.status == "queued":
+                    self._finish(task, "cancelled")
+            return cancelled
+
+    def cancel_if_queued(self, file_id: str, name: str) -> bool:
+        """Cancels one task if no worker has started it yet, so the caller can do the work itself."""
+        with self._lock:
+            task = self._tasks.get(file_id, {}).get(name)
+            if task is None or task.status != "queued":
+                return False
+            task._cancelled.set()
+            self._finish(task, "cancelled")
+            return True
+
+    def get(self, file_id: str, name: str) -> Optional[ArtifactTask]:
+        with self._lock:
+            return self._tasks.get(file_id, {}).get(name)
+
+    def status(self, file_id: str) -> Dict[str, dict]:
+        with self._lock:
+            return {name: task.to_dict() for name, task in self._tasks.get(file_id, {}).items()}
+
+    def metrics(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._counters, "queued": self._queue.qsize(), "workers": len(self._threads)}
+
+    def clear(self):
+        """Cancels every document's tasks."""
+        for file_id in list(self._tasks):
+            self.cancel(file_id)
+
+    def shutdown(self):
+        self.clear()
+        for _ in self._threads:
+            # Sentinels sort after every real priority; cancelled tasks ahead of them are skipped.
+            try:
+                self._queue.put_nowait((float("inf"), next(self._sequence), None))
+            except queue.Full:
+                break  # the workers are daemon threads and end with the process
+        self._threads.clear()
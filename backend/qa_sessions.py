@@ -0,0 +1,246 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import List, Optional, Sequence, Tuple
+
+from llm_client import MODELS_CONFIG, provider_for_model
+from storage import StorageBackend
+from token_budget import token_counter
+
+# Idle sessions expire after this many seconds.
+QA_SESSION_TTL_SECONDS = float(os.getenv("QA_SESSION_TTL_SECONDS", "3600"))
+# Tokens of conversation history sent with each follow-up question.
+QA_SESSION_HISTORY_TOKENS = int(os.getenv("QA_SESSION_HISTORY_TOKENS", "2000"))
+# Most recent turns sent verbatim; older ones are compacted to a short recap.
+QA_SESSION_RECENT_TURNS = int(os.getenv("QA_SESSION_RECENT_TURNS", "3"))
+# Answer characters kept per compacted turn.
+COMPACT_ANSWER_CHARS = 300
+# Session prefixes (in document mode, a whole book) kept in memory with their
+# token counts, so each turn doesn't rebuild and re-count them.
+QA_SESSION_PREFIX_CACHE_SIZE = int(os.getenv("QA_SESSION_PREFIX_CACHE_SIZE", "8"))
+
+SESSION_MODES = ("auto", "document", "retrieval")
+
+DOCUMENT_INSTRUCTIONS = (
+    "You are answering a reader's questions about the document below, in a conversation. "
+    "Answer from the document, cite the page numbers you relied on, and say so when the "
+    "document doesn't contain the answer."
+)
+RETRIEVAL_INSTRUCTIONS = (
+    "You are answering a reader's questions about a document, in a conversation. Each question "
+    "comes with the most relevant excerpts of the document, marked with their page numbers. "
+    "Answer from the excerpts, cite the page numbers you relied on, and say so when they don't "
+    "contain the answer."
+)
+
+
+@dataclass
+class QATurn:
+    question: str
+    answer: str
+    prompt_tokens: int
+    # Prompt tokens the provider reported serving from its prompt cache.
+    cached_tokens: int
+    # Prompt tokens a stateless /qa/ request for the same question would have sent.
+    baseline_prompt_tokens: int
+    latency_ms: float
+
+
+@dataclass
+class QASession:
+    """
+    A conversation about one document with one model. In "document" mode the
+    whole document is a fixed prefix sent unchanged with every turn, so
+    providers with prompt caching only process it once; in "retrieval" mode
+    (documents too large for the model) each turn carries its own excerpts.
+    """
+    session_id: str
+    file_id: str
+    model_name: str
+    mode: str
+    prefix_tokens: int
+    created_at: float
+    turns: List[QATurn] = field(default_factory=list)
+    # Tokens of a stateless /qa/ prompt other than the question, measured on the first turn.
+    baseline_context_tokens: Optional[int] = None
+
+    def to_json(self) -> bytes:
+        return json.dumps(asdict(self)).encode()
+
+    @classmethod
+    def from_json(cls, data: bytes) -> "QASession":
+        values = json.loads(data)
+        values["turns"] = [QATurn(**turn) for turn in values["turns"]]
+        return cls(**values)
+
+    def stats(self) -> dict:
+        """Token and latency totals, and how many prompt tokens the session saved over stateless /qa/ calls."""
+        prompt = sum(turn.prompt_tokens for turn in self.turns)
+        cached = sum(turn.cached_tokens for turn in self.turns)
+        baseline = sum(turn.baseline_prompt_tokens for turn in self.turns)
+        return {
+            "turns": len(self.turns),
+            "prompt_tokens": prompt,
+            "cached_tokens": cached,
+            "uncached_prompt_tokens": prompt - cached,
+            "baseline_prompt_tokens": baseline,
+            "saved_prompt_tokens": baseline - (prompt - cached),
+            "total_latency_ms": sum(turn.latency_ms for turn in self.turns),
+        }
+
+    def summary(self) -> dict:
+        return {
+            "session_id": self.session_id,
+            "file_id": self.file_id,
+            "model_name": self.model_name,
+            "mode": self.mode,
+            "prefix_tokens": self.prefix_tokens,
+            "stats": self.stats(),
+        }
+
+
+class SessionStore:
+    """Q&A sessions kept in shared storage, so any worker can continue a conversation."""
+
+    namespace = "qa_sessions"
+
+    def __init__(self, storage: StorageBackend, ttl_seconds: float = QA_SESSION_TTL_SECONDS):
+        self.storage = storage
+        self.ttl_seconds = ttl_seconds
+
+    def create(self, file_id: str, model_name: str, mode: str, prefix_tokens: int) -> QASession:
+        session = QASession(uuid.uuid4().hex, file_id, model_name, mode, prefix_tokens, time.time())
+        self.save(session)
+        return session
+
+    def get(self, session_id: str) -> Optional[QASession]:
+        data = self.storage.get(self.namespace, session_id)
+        return QASession.from_json(data) if data is not None else None
+
+    def save(self, session: QASession):
+        # Every turn renews the TTL.
+        self.storage.set(self.namespace, session.session_id, session.to_json(), self.ttl_seconds)
+
+    def delete(self, session_id: str):
+        self.storage.delete(self.namespace, session_id)
+
+
+class PrefixCache:
+    """
+    Prefix texts and token counts of recently used sessions, keyed by
+    (file_id, mode). Least recently used entries are dropped beyond `max_entries`.
+    """
+
+    def __init__(self, max_entries: int = QA_SESSION_PREFIX_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[str, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, file_id: str, mode: str) -> Optional[Tuple[str, int]]:
+        with self._lock:
+            entry = self._entries.get((file_id, mode))
+            if entry is not None:
+                self._entries.move_to_end((file_id, mode))
+            return entry
+
+    def put(self, file_id: str, mode: str, text: str, tokens: int) -> Tuple[str, int]:
+        with self._lock:
+            self._entries[(file_id, mode)] = (text, tokens)
+            self._entries.move_to_end((file_id, mode))
+            while len(self._entries) > max(self.max_entries, 0):
+                self._entries.popitem(last=False)
+        return text, tokens
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def uses_cache_control(model_name: str) -> bool:
+    """
+    Whether the model's provider needs the stable prefix marked with
+    `cache_control` (providers listed under "prompt_cache_control" in
+    models_config.json). Other providers cache identical prefixes implicitly.
+    """
+    return provider_for_model(model_name) in MODELS_CONFIG.get("prompt_cache_control", [])
+
+
+def document_prefix(pages: Sequence[str]) -> str:
+    """The fixed first message of a document-mode session: instructions, then every page."""
+    body = "\n\n".join(f"[Page {number}]\n{page.strip()}" for number, page in enumerate(pages, start=1) if page.strip())
+    return f"{DOCUMENT_INSTRUCTIONS}\n\n<document>\n{body}\n</document>"
+
+
+def prefix_message(text: str, cache_control: bool) -> dict:
+    if cache_control:
+        return {"role": "system", "content": [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]}
+    return {"role": "system", "content": text}
+
+
+def _compact(turn: QATurn) -> str:
+    answer = " ".join(turn.answer.split())
+    if len(answer) > COMPACT_ANSWER_CHARS:
+        answer = answer[:COMPACT_ANSWER_CHARS].rsplit(" ", 1)[0] + "..."
+    return f"- Q: {turn.question}\n  A: {answer}"
+
+
+def compact_history(
+    turns: Sequence[QATurn], max_tokens: int = QA_SESSION_HISTORY_TOKENS, recent_turns: int = QA_SESSION_RECENT_TURNS,
+) -> Tuple[str, List[QATurn]]:
+    """
+    Splits the history into a recap of older turns and the recent turns sent
+    verbatim, newest first in priority, within `max_tokens`. Turns that don't
+    fit either way are left out.
+    """
+    used = 0
+    recent: List[QATurn] = []
+    for turn in reversed(turns[-recent_turns:] if recent_turns > 0 else []):
+        tokens = token_counter.count(turn.question) + token_counter.count(turn.answer)
+        if used + tokens > max_tokens:
+            break
+        recent.insert(0, turn)
+        used += tokens
+    recap: List[str] = []
+    for turn in reversed(turns[:len(turns) - len(recent)]):
+        line = _compact(turn)
+        tokens = token_counter.count(line)
+        if used + tokens > max_tokens:
+            break
+        recap.insert(0, line)
+        used += tokens
+    note = "Earlier in this conversation:\n" + "\n".join(recap) if recap else ""
+    return note, recent
+
+
+def build_turn_messages(prefix: dict, turns: Sequence[QATurn], question: str, excerpts: Optional[str] = None) -> List[dict]:
+    """
+    The stable prefix, then the compacted history as alternating user /
+    assistant messages, then the new question (with its excerpts in retrieval mode).
+    """
+    note, recent = compact_history(turns)
+    history: List[dict] = []
+    for turn in recent:
+        history.append({"role": "user", "content": turn.question})
+        history.append({"role": "assistant", "content": turn.answer})
+    content = f"Relevant excerpts:\n\n{excerpts}\n\nQuestion: {question}" if excerpts is not None else question
+    messages = history + [{"role": "user", "content": content}]
+    if note:
+        # The recap rides on the first user message so roles keep alternating.
+        messages[0] = {"role": "user", "content": f"{note}\n\n{messages[0]['content']}"}
+    return [prefix] + messages
+
+
+def count_message_tokens(messages: Sequence[dict]) -> int:
+    """Tokens in the text of the given messages."""
+    total = 0
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, list):
+            total += sum(token_counter.count(part.get("text", "")) for part in content)
+        else:
+            total += token_counter.count(content)
+    return total
@@ -0,0 +1,240 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from storage import StorageBackend
+
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")  # memory | sqlite | storage | none
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", str(24 * 3600)))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+RESPONSE_CACHE_PATH = os.getenv(
+    "RESPONSE_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".response_cache.sqlite3"),
+)
+# Comma-separated endpoint names (e.g. "qa,summarize") that always call the model.
+RESPONSE_CACHE_DISABLED_ENDPOINTS = frozenset(
+    name.strip() for name in os.getenv("RESPONSE_CACHE_DISABLED_ENDPOINTS", "").split(",") if name.strip()
+)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Collapses whitespace so trivially different prompts share a cache entry."""
+    return _WHITESPACE_RE.sub(" ", text or "").strip()
+
+
+def normalize_question(text: Optional[str]) -> str:
+    """Looser normalization for user questions: case and trailing punctuation don't matter."""
+    return normalize_text(text).lower().rstrip("?!. ")
+
+
+def normalize_keywords(keywords: Optional[str]) -> str:
+    return ",".join(sorted({normalize_question(k) for k in (keywords or "").split(",") if k.strip()}))
+
+
+def make_cache_key(model_name: str, operation: str, **params) -> str:
+    payload = json.dumps({"model": model_name, "operation": operation, "params": params}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryCacheBackend:
+    """LRU dict of (value, expires_at) bounded by entry count."""
+    blocking = False
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, clock: Callable[[], float] = time.time):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: str, value: str, ttl_seconds: float):
+        with self._lock:
+            self._entries[key] = (value, self._clock() + ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCacheBackend:
+    """
+    Response cache in a SQLite file, shared by every worker on the host. When
+    over `max_entries`, the least recently used rows are deleted.
+    """
+    blocking = True
+
+    def __init__(self, path: str = RESPONSE_CACHE_PATH, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+                 clock: Callable[[], float] = time.time):
+        self.path = path
+        self.max_entries = max_entries
+        self._clock = clock
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared across threads, so keep one per thread.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        now = self._clock()
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key: str, value: str, ttl_seconds: float):
+        now = self._clock()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl_seconds, now),
+            )
+            conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+            conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+
+class StorageCacheBackend:
+    """
+    Responses kept in the shared StorageBackend (e.g. Redis), so every API
+    worker sees them. Entries expire by TTL only; size limits are left to the
+    store (e.g. a Redis maxmemory eviction policy).
+    """
+    blocking = True
+
+    def __init__(self, storage: StorageBackend, namespace: str = "responses"):
+        self.storage = storage
+        self.namespace = namespace
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.storage.get(self.namespace, key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key: str, value: str, ttl_seconds: float):
+        self.storage.set(self.namespace, key, value.encode("utf-8"), ttl_seconds)
+
+    def clear(self):
+        self.storage.clear(self.namespace)
+
+
+class ResponseCache:
+    """
+    Caches LLM responses in front of `call_llm`, counting hits and misses per
+    endpoint. Endpoints listed in `disabled_endpoints` bypass the cache.
+    """
+
+    def __init__(self, backend, ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+                 disabled_endpoints: Iterable[str] = RESPONSE_CACHE_DISABLED_ENDPOINTS):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.disabled_endpoints = set(disabled_endpoints)
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def enabled_for(self, endpoint: str) -> bool:
+        return self.backend is not None and endpoint not in self.disabled_endpoints
+
+    async def _run(self, fn, *args):
+        if getattr(self.backend, "blocking", False):
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    async def lookup(self, endpoint: str, key: str, count: bool = True) -> Optional[str]:
+        """
+        Returns the cached response, or None on a miss or when the endpoint isn't
+        cached. `count=False` leaves the hit/miss stats alone, for lookups made
+        by background work rather than by clients.
+        """
+        if not self.enabled_for(endpoint):
+            return None
+        cached = await self._run(self.backend.get, key)
+        if count:
+            stats = self._stats.setdefault(endpoint, {"hits": 0, "misses": 0})
+            stats["hits" if cached is not None else "misses"] += 1
+        return cached
+
+    async def store(self, endpoint: str, key: str, response: str):
+        """Stores a response for a cached endpoint. Empty responses are never stored."""
+        if response and self.enabled_for(endpoint):
+            await self._run(self.backend.set, key, response, self.ttl_seconds)
+
+    async def get_or_call(self, endpoint: str, key: str, call: Callable[[], Awaitable[str]],
+                          count: bool = True) -> Tuple[str, bool]:
+        """Returns (response, served_from_cache). Only non-empty responses are stored."""
+        cached = await self.lookup(endpoint, key, count)
+        if cached is not None:
+            return cached, True
+        response = await call()
+        await self.store(endpoint, key, response)
+        return response, False
+
+    def stats(self) -> Dict[str, dict]:
+        result = {}
+        for endpoint, counts in self._stats.items():
+            total = counts["hits"] + counts["misses"]
+            result[endpoint] = {**counts, "hit_rate": counts["hits"] / total if total else 0.0}
+        return result
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+        self._stats.clear()
+
+
+def create_response_cache(backend_name: str = RESPONSE_CACHE_BACKEND, storage: Optional[StorageBackend] = None) -> ResponseCache:
+    if backend_name == "storage":
+        if storage is None:
+            raise ValueError("RESPONSE_CACHE_BACKEND=storage needs a storage backend.")
+        backend = StorageCacheBackend(storage)
+    elif backend_name == "sqlite":
+        backend = SQLiteCacheBackend()
+    elif backend_name == "memory":
+        backend = MemoryCacheBackend()
+    elif backend_name == "none":
+        backend = None
+    else:
+        raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND: {backend_name!r}")
+    return ResponseCache(backend)
@@ -0,0 +1,133 @@
+import math
+import re
+import sys
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Tiny stop-word list so that very common words don't dominate short queries.
+_STOP_WORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the "
+    "this to was were what when where which who why will with how does do".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cases and splits text into word tokens, dropping stop words."""
+    return [tok for tok in _TOKEN_RE.findall(text.lower()) if tok not in _STOP_WORDS]
+
+
+@dataclass
+class Chunk:
+    text: str
+    page: int  # 1-based page number the chunk was taken from
+
+
+def chunk_pages(pages: Sequence[str], chunk_size: int = 1500, overlap: int = 200) -> List[Chunk]:
+    """
+    Splits each page into chunks of roughly `chunk_size` characters.
+    Chunks never cross page boundaries so every chunk can be cited by page.
+    Consecutive chunks of the same page share `overlap` characters.
+    """
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be positive.")
+    overlap = max(0, min(overlap, chunk_size // 2))
+
+    chunks: List[Chunk] = []
+    for page_number, page_text in enumerate(pages, start=1):
+        page_text = page_text.strip()
+        start = 0
+        while start < len(page_text):
+            end = min(start + chunk_size, len(page_text))
+            if end < len(page_text):
+                # Prefer to cut on whitespace so words are not split in half.
+                cut = page_text.rfind(" ", start + chunk_size // 2, end)
+                if cut != -1:
+                    end = cut
+            piece = page_text[start:end].strip()
+            if piece:
+                chunks.append(Chunk(text=piece, page=page_number))
+            if end >= len(page_text):
+                break
+            start = max(end - overlap, start + 1)
+    return chunks
+
+
+class BM25Index:
+    """Okapi BM25 lexical index over a list of chunks."""
+
+    def __init__(self, chunks: List[Chunk], k1: float = 1.5, b: float = 0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self._term_freqs: List[Counter] = []
+        self._lengths: List[int] = []
+        self._doc_freqs: Dict[str, int] = {}
+
+        for chunk in chunks:
+            tf = Counter(tokenize(chunk.text))
+            self._term_freqs.append(tf)
+            self._lengths.append(sum(tf.values()))
+            for term in tf:
+                self._doc_freqs[term] = self._doc_freqs.get(term, 0) + 1
+
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the index, for the document store's byte budget."""
+        size = sys.getsizeof(self._doc_freqs) + sys.getsizeof(self._term_freqs)
+        for chunk, tf in zip(self.chunks, self._term_freqs):
+            size += sys.getsizeof(chunk.text) + sys.getsizeof(tf)
+            size += sum(sys.getsizeof(term) for term in tf)
+        return size
+
+    def _idf(self, term: str) -> float:
+        df = self._doc_freqs.get(term, 0)
+        n = len(self.chunks)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, top_k: int = 4, pages: Optional[Tuple[int, int]] = None) -> List[Tuple[Chunk, float]]:
+        """
+        Returns up to `top_k` (chunk, score) pairs, best match first. `pages`
+        (first, last; 1-based, inclusive) restricts the search to a page range.
+        """
+        if not self.chunks or top_k <= 0:
+            return []
+        query_terms = set(tokenize(query))
+        candidates = range(len(self.chunks))
+        if pages is not None:
+            candidates = [i for i in candidates if pages[0] <= self.chunks[i].page <= pages[1]]
+        scores: List[Tuple[int, float]] = []
+        for i in candidates:
+            tf = self._term_freqs[i]
+            score = 0.0
+            length_norm = self.k1 * (1 - self.b + self.b * self._lengths[i] / (self._avg_length or 1.0))
+            for term in query_terms:
+                freq = tf.get(term)
+                if freq:
+                    score += self._idf(term) * freq * (self.k1 + 1) / (freq + length_norm)
+            scores.append((i, score))
+
+        scores.sort(key=lambda item: item[1], reverse=True)
+        best = scores[:top_k]
+        # If nothing matched lexically, fall back to the start of the document
+        # rather than sending arbitrary chunks.
+        if all(score == 0.0 for _, score in best):
+            best = [(i, 0.0) for i in list(candidates)[:top_k]]
+        return [(self.chunks[i], score) for i, score in best]
+
+
+def build_index(pages: Sequence[str], chunk_size: int = 1500, overlap: int = 200) -> BM25Index:
+    return BM25Index(chunk_pages(pages, chunk_size, overlap))
+
+
+def format_context(results: List[Tuple[Chunk, float]]) -> str:
+    """Formats retrieved chunks in page order with page references."""
+    ordered = sorted((chunk for chunk, _ in results), key=lambda c: c.page)
+    return "\n\n".join(f"[Page {chunk.page}]\n{chunk.text}" for chunk in ordered)
@@ -0,0 +1,152 @@
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Optional
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")  # local | redis
+STORAGE_PATH = os.getenv(
+    "STORAGE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".storage.sqlite3"),
+)
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+class StorageBackend(ABC):
+    """
+    Namespaced key-value store shared by every worker serving the API: job
+    state, retrieval indexes and, with STORAGE_BACKEND=redis, documents and
+    cached responses too. Values are bytes. The operations mirror the Redis
+    commands they map to (GET, SET EX/PX, SET NX, DEL), so any Redis-compatible
+    server can back it.
+    """
+
+    @abstractmethod
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    def set(self, namespace: str, key: str, value: bytes, ttl_seconds: Optional[float] = None):
+        ...
+
+    @abstractmethod
+    def add(self, namespace: str, key: str, value: bytes, ttl_seconds: Optional[float] = None) -> bool:
+        """Sets `key` only if it is absent (or expired). Returns whether it was set."""
+
+    @abstractmethod
+    def delete(self, namespace: str, key: str):
+        ...
+
+    @abstractmethod
+    def clear(self, namespace: str):
+        ...
+
+
+class SQLiteStorage(StorageBackend):
+    """
+    Storage in one SQLite file, shared by all workers on a host. WAL mode lets
+    readers in other processes proceed while one of them writes.
+    """
+
+    def __init__(self, path: str = STORAGE_PATH, clock: Callable[[], float] = time.time):
+        self.path = path
+        self._clock = clock
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, expires_at REAL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared across threads, so keep one per thread.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _expires_at(self, ttl_seconds: Optional[float]) -> Optional[float]:
+        return self._clock() + ttl_seconds if ttl_seconds else None
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        row = self._connect().execute(
+            "SELECT value, expires_at FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= self._clock()):
+            return None
+        return bytes(row[0])
+
+    def set(self, namespace: str, key: str, value: bytes, ttl_seconds: Optional[float] = None):
+        with self._connect() as conn:
+            if ttl_seconds:
+                conn.execute("DELETE FROM kv WHERE namespace = ? AND expires_at <= ?", (namespace, self._clock()))
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, value, self._expires_at(ttl_seconds)),
+            )
+
+    def add(self, namespace: str, key: str, value: bytes, ttl_seconds: Optional[float] = None) -> bool:
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM kv WHERE namespace = ? AND key = ? AND expires_at <= ?", (namespace, key, self._clock())
+            )
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, value, self._expires_at(ttl_seconds)),
+            )
+            return cursor.rowcount == 1
+
+    def delete(self, namespace: str, key: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def clear(self, namespace: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM kv WHERE namespace = ?", (namespace,))
+
+
+class RedisStorage(StorageBackend):
+    """Storage on a Redis-compatible server, for workers spread over several hosts."""
+
+    def __init__(self, client, prefix: str = "bookaireader"):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{self.prefix}:{namespace}:{key}"
+
+    @staticmethod
+    def _px(ttl_seconds: Optional[float]) -> Optional[int]:
+        return max(1, int(ttl_seconds * 1000)) if ttl_seconds else None
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        return self.client.get(self._key(namespace, key))
+
+    def set(self, namespace: str, key: str, value: bytes, ttl_seconds: Optional[float] = None):
+        self.client.set(self._key(namespace, key), value, px=self._px(ttl_seconds))
+
+    def add(self, namespace: str, key: str, value: bytes, ttl_seconds: Optional[float] = None) -> bool:
+        return bool(self.client.set(self._key(namespace, key), value, px=self._px(ttl_seconds), nx=True))
+
+    def delete(self, namespace: str, key: str):
+        self.client.delete(self._key(namespace, key))
+
+    def clear(self, namespace: str):
+        for key in self.client.scan_iter(match=f"{self.prefix}:{namespace}:*"):
+            self.client.delete(key)
+
+
+def create_storage(backend_name: str = STORAGE_BACKEND) -> StorageBackend:
+    if backend_name == "local":
+        return SQLiteStorage()
+    if backend_name == "redis":
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=redis requires the 'redis' package (pip install redis).")
+        return RedisStorage(redis.Redis.from_url(REDIS_URL))
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend_name!r}")
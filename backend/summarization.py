@@ -0,0 +1,182 @@
+import asyncio
+import os
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional, Sequence
+
+from response_cache import ResponseCache, make_cache_key
+
+# Characters of document text summarized by each map call.
+SUMMARY_CHUNK_SIZE = int(os.getenv("SUMMARY_CHUNK_SIZE", "12000"))
+SUMMARY_MAP_CONCURRENCY = int(os.getenv("SUMMARY_MAP_CONCURRENCY", "4"))
+# In "auto" mode, documents up to this many characters are summarized in one prompt.
+SUMMARY_SINGLE_PASS_MAX_CHARS = int(os.getenv("SUMMARY_SINGLE_PASS_MAX_CHARS", "60000"))
+
+SUMMARY_MODES = ("auto", "single", "map_reduce")
+
+LENGTH_INSTRUCTIONS = {
+    "Short": "Provide a very brief summary (1-2 sentences).",
+    "Medium": "Provide a concise summary (3-5 sentences).",
+    "Long": "Provide a detailed summary (6-8 sentences).",
+}
+COMPREHENSIVE_INSTRUCTIONS = (
+    "Provide a comprehensive summary that includes:\n"
+    "1. **Main Ideas:** Identify the core concepts and arguments presented.\n"
+    "2. **Useful Information:** Extract key facts, data, or insights that are particularly valuable.\n"
+    "3. **Quotable Passages:** Pinpoint specific sentences or phrases that are impactful or representative.\n"
+    "4. **Concise Summary:** Provide a brief overview of the entire text, focusing on the most critical information."
+)
+
+
+@dataclass
+class Section:
+    text: str
+    first_page: int
+    last_page: int
+
+    @property
+    def label(self) -> str:
+        if self.first_page == self.last_page:
+            return f"Page {self.first_page}"
+        return f"Pages {self.first_page}-{self.last_page}"
+
+
+def split_into_sections(pages: Sequence[str], chunk_size: int = SUMMARY_CHUNK_SIZE, first_page_number: int = 1) -> List[Section]:
+    """
+    Groups consecutive pages into sections of at most `chunk_size` characters,
+    splitting oversized pages. `pages[0]` is numbered `first_page_number`.
+    """
+    sections: List[Section] = []
+    parts: List[str] = []
+    size = first_page = last_page = 0
+
+    for page_number, page in enumerate(pages, start=first_page_number):
+        page = page.strip()
+        for start in range(0, len(page), chunk_size):
+            piece = page[start:start + chunk_size]
+            if parts and size + len(piece) > chunk_size:
+                sections.append(Section("\n".join(parts), first_page, last_page))
+                parts, size = [], 0
+            if not parts:
+                first_page = page_number
+            parts.append(piece)
+            size += len(piece)
+            last_page = page_number
+    if parts:
+        sections.append(Section("\n".join(parts), first_page, last_page))
+    return sections
+
+
+def build_section_summary_prompt(section: Section) -> str:
+    # Deliberately independent of summary length and keywords so that the
+    # result can be reused by every later summary request for the document.
+    return (
+        f"The following text is {section.label} of a longer document.\n\n"
+        f"{section.text}\n\n"
+        "Summarize this part in a few paragraphs. Keep the main ideas, key facts, figures, "
+        "names and any notable quotable sentences, so the summary can later be combined "
+        "with summaries of the other parts."
+    )
+
+
+def build_reduce_prompt(partials: Sequence[str], summary_length: str = "Comprehensive", keywords: Optional[str] = None) -> str:
+    joined = "\n\n".join(partials)
+    prompt_parts = [f"Below are summaries of consecutive parts of a document, in order:\n\n{joined}\n"]
+    if keywords:
+        prompt_parts.append(f"Focus the summary on aspects related to the following keywords: {keywords}.")
+    prompt_parts.append(LENGTH_INSTRUCTIONS.get(summary_length, COMPREHENSIVE_INSTRUCTIONS))
+    prompt_parts.append("Summarize the document as a whole, not part by part.")
+    return "\n".join(prompt_parts)
+
+
+class MapReduceSummarizer:
+    """
+    Summarizes documents that are too large for one prompt: sections are
+    summarized concurrently (map), then the partial summaries are combined into
+    the requested summary (reduce). When the partial summaries themselves are
+    too long, they are summarized again in groups until they fit.
+
+    Section summaries are cached per (document, model, chunk size), so a later
+    request with a different length or keyword focus only pays for the reduce.
+    """
+
+    def __init__(
+        self,
+        llm_call: Callable[[str, str], Awaitable[str]],
+        cache: ResponseCache,
+        chunk_size: int = SUMMARY_CHUNK_SIZE,
+        concurrency: int = SUMMARY_MAP_CONCURRENCY,
+    ):
+        self.llm_call = llm_call
+        self.cache = cache
+        self.chunk_size = chunk_size
+        self.concurrency = max(1, concurrency)
+
+    async def _summarize_all(
+        self, file_id: str, model_name: str, level: int, sections: List[Section], check_cancelled: Optional[Callable[[], None]],
+    ) -> List[Section]:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def call(section: Section) -> str:
+            if check_cancelled is not None:
+                check_cancelled()
+            return await self.llm_call(build_section_summary_prompt(section), model_name)
+
+        async def summarize(index: int, section: Section) -> Section:
+            key = make_cache_key(
+                model_name, "summarize_section", file_id=file_id, level=level,
+                index=index, chunk_size=self.chunk_size, pages=section.label,
+            )
+            async with semaphore:
+                summary, _ = await self.cache.get_or_call("summarize_section", key, lambda: call(section))
+            return Section(summary, section.first_page, section.last_page)
+
+        return list(await asyncio.gather(*(summarize(i, section) for i, section in enumerate(sections))))
+
+    def _group(self, partials: List[Section]) -> List[Section]:
+        """Merges consecutive partial summaries into sections of at most `chunk_size` characters."""
+        groups: List[Section] = []
+        for partial in partials:
+            labelled = f"[{partial.label}]\n{partial.text}"
+            if groups and len(groups[-1].text) + len(labelled) + 2 <= self.chunk_size:
+                last = groups[-1]
+                groups[-1] = Section(f"{last.text}\n\n{labelled}", last.first_page, partial.last_page)
+            else:
+                groups.append(Section(labelled, partial.first_page, partial.last_page))
+        return groups
+
+    async def partial_summaries(
+        self, file_id: str, pages: Sequence[str], model_name: str, first_page: int = 1,
+        check_cancelled: Optional[Callable[[], None]] = None,
+    ) -> List[str]:
+        """
+        Summaries of the given pages, the first of them numbered `first_page`.
+        Sections are keyed by their page labels, so a page range starting where
+        an earlier request's range (or the whole document) starts reuses its sections.
+        `check_cancelled` runs before each section's LLM call and may raise to stop the work.
+        """
+        sections = split_into_sections(pages, self.chunk_size, first_page)
+        partials = await self._summarize_all(file_id, model_name, 0, sections, check_cancelled)
+        level = 0
+        while len(partials) > 1 and sum(len(p.text) for p in partials) > self.chunk_size:
+            groups = self._group(partials)
+            if len(groups) >= len(partials):
+                break  # each summary alone fills a chunk; reduce them as they are
+            level += 1
+            partials = await self._summarize_all(file_id, model_name, level, groups, check_cancelled)
+        return [f"[{partial.label}]\n{partial.text}" for partial in partials]
+
+    async def reduce_prompt(
+        self, file_id: str, pages: Sequence[str], model_name: str,
+        summary_length: str = "Comprehensive", keywords: Optional[str] = None, first_page: int = 1,
+        check_cancelled: Optional[Callable[[], None]] = None,
+    ) -> str:
+        partials = await self.partial_summaries(file_id, pages, model_name, first_page, check_cancelled)
+        return build_reduce_prompt(partials, summary_length, keywords)
+
+
+def use_map_reduce(text: str, mode: str = "auto") -> bool:
+    if mode not in SUMMARY_MODES:
+        raise ValueError(f"Unknown summary mode: {mode!r}. Expected one of {', '.join(SUMMARY_MODES)}.")
+    if mode == "auto":
+        return len(text) > SUMMARY_SINGLE_PASS_MAX_CHARS
+    return mode == "map_reduce"
@@ -0,0 +1,115 @@
+import asyncio
+import sys
+import os
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from admission import AdmissionController, AdmissionRejected, TokenBucket, client_id_for
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_requests_over_the_limits_queue_and_take_freed_slots():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=2, max_concurrent_per_client=2, max_queue=10, queue_timeout=5)
+        first = await controller.acquire("a")
+        await controller.acquire("a")
+        waiting = asyncio.ensure_future(controller.acquire("a"))
+        await asyncio.sleep(0)
+        assert controller.stats()["active"] == 2 and controller.stats()["waiting"] == 1
+        controller.release(first)
+        ticket = await waiting
+        assert ticket.client_id == "a"
+        assert controller.stats()["active"] == 2 and controller.stats()["waiting"] == 0
+    asyncio.run(scenario())
+
+def test_freed_slots_go_round_robin_across_clients():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_concurrent_per_client=1, max_queue=10, queue_timeout=5)
+        running = await controller.acquire("heavy")
+        order = []
+
+        async def request(client_id):
+            ticket = await controller.acquire(client_id)
+            order.append(client_id)
+            await asyncio.sleep(0)
+            controller.release(ticket)
+
+        heavy = [asyncio.ensure_future(request("heavy")) for _ in range(3)]
+        await asyncio.sleep(0)
+        light = asyncio.ensure_future(request("light"))
+        await asyncio.sleep(0)
+        controller.release(running)
+        await asyncio.gather(light, *heavy)
+        # The light client's request isn't stuck behind the heavy client's backlog.
+        assert order == ["heavy", "light", "heavy", "heavy"]
+    asyncio.run(scenario())
+
+def test_full_queues_are_rejected_with_retry_after():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_concurrent_per_client=1, max_queue=2, max_queue_per_client=1, queue_timeout=5)
+        await controller.acquire("a")
+        waiting = [asyncio.ensure_future(controller.acquire("a"))]
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as client_full:
+            await controller.acquire("a")
+        assert client_full.value.status_code == 429 and client_full.value.reason == "client_queue_full"
+        assert client_full.value.retry_after >= 1
+
+        waiting.append(asyncio.ensure_future(controller.acquire("b")))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as server_full:
+            await controller.acquire("c")
+        assert server_full.value.status_code == 503 and server_full.value.reason == "queue_full"
+        for task in waiting:
+            task.cancel()
+        await asyncio.gather(*waiting, return_exceptions=True)
+        assert controller.stats()["waiting"] == 0
+    asyncio.run(scenario())
+
+def test_queue_timeout_returns_503_and_leaves_the_queue():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=10, queue_timeout=0.01)
+        await controller.acquire("a")
+        with pytest.raises(AdmissionRejected) as timeout:
+            await controller.acquire("b")
+        assert timeout.value.status_code == 503 and timeout.value.reason == "queue_timeout"
+        stats = controller.stats()
+        assert stats["waiting"] == 0 and stats["timeouts"] == 1 and stats["clients"] == 1
+    asyncio.run(scenario())
+
+def test_client_token_budget_is_charged_after_each_request():
+    async def scenario():
+        clock = FakeClock()
+        controller = AdmissionController(max_concurrent=4, client_tokens_per_minute=600, clock=clock)
+        controller.release(await controller.acquire("a"), tokens=900)
+        with pytest.raises(AdmissionRejected) as over:
+            await controller.acquire("a")
+        # 300 tokens in debt at 10 tokens a second.
+        assert over.value.status_code == 429 and over.value.retry_after == 31
+        await controller.acquire("b")  # other clients have their own budget
+        clock.now += 31
+        await controller.acquire("a")
+    asyncio.run(scenario())
+
+def test_token_bucket_refills_up_to_one_minute_of_tokens():
+    clock = FakeClock()
+    bucket = TokenBucket(60, clock)
+    bucket.charge(100)
+    assert bucket.level() == -40 and bucket.seconds_until_available() == 41
+    clock.now += 1000
+    assert bucket.level() == 60 and bucket.full
+
+def test_client_id_uses_configured_header_or_peer_address():
+    scope = {"headers": [(b"x-real-ip", b"10.0.0.7, 10.0.0.1")], "client": ("127.0.0.1", 5000)}
+    assert client_id_for(scope, "X-Real-IP") == "10.0.0.7"
+    assert client_id_for(scope, "") == "127.0.0.1"
+    assert client_id_for({"headers": [], "client": None}, "X-Real-IP") == "unknown"
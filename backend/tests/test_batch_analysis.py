@@ -0,0 +1,97 @@
+import asyncio
+import json
+import re
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from batch_analysis import (
+    ANALYSES,
+    BatchAnalyzer,
+    parse_batch_response,
+    segment_document,
+    segment_pages,
+    segments_from_texts,
+)
+from document_cache import CachedDocument, join_pages
+from response_cache import MemoryCacheBackend, ResponseCache
+
+
+def fake_batch_llm(calls, drop_ids=()):
+    """Answers batch prompts with one sentiment object per `[id]` in the prompt."""
+    async def llm_call(prompt, model_name):
+        calls.append(prompt)
+        await asyncio.sleep(0.001)
+        ids = [int(i) for i in re.findall(r"^\[(\d+)\]", prompt, re.MULTILINE)]
+        return json.dumps([{"id": i, "sentiment": "neutral", "explanation": "x"} for i in ids if i not in drop_ids])
+    return llm_call
+
+def _collect(analyzer, segments, max_prompt_tokens=10_000):
+    async def run():
+        return [item async for item in analyzer.analyze(ANALYSES["sentiment"], segments, "m", max_prompt_tokens)]
+    return asyncio.run(run())
+
+def test_segment_pages_by_rule():
+    pages = ["First paragraph " * 20 + "\n\n" + "Second paragraph " * 20, "", "Short.\n\nAlso short."]
+    paragraphs = segment_pages(pages, "paragraph")
+    assert [s.page for s in paragraphs] == [1, 1, 3]
+    assert [s.index for s in paragraphs] == [0, 1, 2]
+    assert paragraphs[2].text == "Short. Also short."  # short paragraphs are merged
+
+    assert [s.page for s in segment_pages(pages, "page")] == [1, 3]
+    assert [s.page for s in segment_pages(pages, "page", first_page=5)] == [5, 7]
+    assert {s.page for s in segment_pages(pages, "chunk", first_page=5)} == {5, 7}
+    with pytest.raises(ValueError):
+        segment_pages(pages, "sentence")
+
+def test_document_paragraph_segments_match_its_paragraphs():
+    pages = ["Alpha " * 50 + "\n \n" + "Beta " * 50, "  ", "\n\n" + "Gamma " * 50, "Delta " * 50]
+    document = CachedDocument("doc", "doc.pdf", *join_pages(pages))
+    segments = segment_document(document.view(), "paragraph")
+    assert len(segments) == document.num_paragraphs == 4
+    assert [s.page for s in segments] == [1, 1, 3, 4]
+    assert [s.page for s in segment_document(document.view(3, 4), "paragraph")] == [3, 4]
+    assert [(s.page, s.text) for s in segment_pages(pages, "paragraph")] == [(s.page, s.text) for s in segments]
+    assert [s.page for s in segment_document(document.view(3, 4), "page")] == [3, 4]
+
+def test_parse_batch_response_tolerates_fences_and_extra_ids():
+    text = '```json\n[{"id": 1, "sentiment": "positive"}, {"id": 9, "sentiment": "x"}, "junk"]\n```'
+    assert parse_batch_response(text, [1, 2]) == {1: {"sentiment": "positive"}}
+    with pytest.raises(ValueError):
+        parse_batch_response("no json here", [1])
+
+def test_segments_are_packed_into_few_calls_and_cached_individually():
+    calls = []
+    analyzer = BatchAnalyzer(fake_batch_llm(calls), ResponseCache(MemoryCacheBackend()), segments_per_call=4)
+    segments = segments_from_texts([f"segment number {i}" for i in range(10)])
+
+    results = _collect(analyzer, segments)
+    assert len(calls) == 3
+    assert sorted(r["index"] for r in results) == list(range(10))
+    assert all(r["result"]["sentiment"] == "neutral" and not r["cached"] for r in results)
+
+    more = segments_from_texts([f"segment number {i}" for i in range(12)])
+    results = _collect(analyzer, more)
+    assert len(calls) == 4  # only the two new segments needed a call
+    assert sum(r["cached"] for r in results) == 10
+
+def test_token_budget_limits_segments_per_call():
+    calls = []
+    analyzer = BatchAnalyzer(fake_batch_llm(calls), ResponseCache(None), segments_per_call=10)
+    _collect(analyzer, segments_from_texts(["y" * 400] * 4), max_prompt_tokens=250)
+    assert len(calls) == 2
+
+def test_missing_items_and_failed_calls_become_errors():
+    calls = []
+    analyzer = BatchAnalyzer(fake_batch_llm(calls, drop_ids={1}), ResponseCache(None), segments_per_call=5)
+    results = {r["index"]: r for r in _collect(analyzer, segments_from_texts(["a", "b", "c"]))}
+    assert "error" in results[1] and "result" in results[0]
+
+    async def failing(prompt, model_name):
+        raise RuntimeError("provider down")
+    analyzer = BatchAnalyzer(failing, ResponseCache(None))
+    results = _collect(analyzer, segments_from_texts(["a", "b"]))
+    assert all("provider down" in r["error"] for r in results)
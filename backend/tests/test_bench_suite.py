@@ -0,0 +1,59 @@
+import sys
+import os
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.bench_suite import SuiteConfig, compare, percentile, run_suite
+
+
+def test_percentile_uses_nearest_rank():
+    samples = list(range(1, 101))
+    assert percentile(samples, 50) == 50
+    assert percentile(samples, 95) == 95
+    assert percentile([7.0], 95) == 7.0
+    assert percentile([], 50) == 0.0
+
+def test_suite_reports_latency_throughput_and_memory():
+    from main import document_store
+    config = SuiteConfig(
+        scenarios=["qa", "summarize", "batch_sentiment"], pages=6, words_per_page=50,
+        requests=4, concurrency=2, latency=0.001,
+    )
+    try:
+        report = run_suite(config)
+    finally:
+        document_store.clear()
+
+    assert set(report["scenarios"]) == {"qa", "summarize", "batch_sentiment"}
+    for result in report["scenarios"].values():
+        assert result["errors"] == 0
+        assert 0 < result["p50_ms"] <= result["p95_ms"]
+        assert result["throughput_rps"] > 0
+        assert result["peak_rss_mb"] > 0
+    assert report["scenarios"]["qa"]["mean_prompt_tokens"] > 0
+    # The response cache is off, so every request reached the fake provider.
+    assert report["llm_calls"] >= 12
+
+def test_suite_bypasses_admission_limits_unless_asked():
+    from main import admission_controller, document_store
+    config = SuiteConfig(scenarios=["qa"], pages=2, words_per_page=50, requests=8, concurrency=4, latency=0.05)
+    try:
+        with patch.multiple(admission_controller, max_concurrent=4, max_concurrent_per_client=1, max_queue_per_client=0):
+            bypassed = run_suite(config)
+            config.with_admission = True
+            limited = run_suite(config)
+    finally:
+        document_store.clear()
+        admission_controller.clear()
+
+    assert bypassed["scenarios"]["qa"]["errors"] == 0
+    assert limited["scenarios"]["qa"]["errors"] > 0
+
+def test_compare_flags_slower_scenarios():
+    baseline = {"scenarios": {"qa": {"p50_ms": 10, "p95_ms": 20, "throughput_rps": 100, "peak_rss_mb": 50}}}
+    slower = {"scenarios": {"qa": {"p50_ms": 12, "p95_ms": 30, "throughput_rps": 95, "peak_rss_mb": 50}}}
+    [row] = compare(slower, baseline, threshold=0.1)
+    assert row["regressed"]
+    assert row["p95_ms"] == 1.5
+    assert not compare(baseline, baseline, threshold=0.1)[0]["regressed"]
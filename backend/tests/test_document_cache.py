@@ -0,0 +1,91 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from document_cache import CachedDocument, DiskDocumentCache, content_hash, join_pages
+
+
+def test_join_pages_records_offsets_for_every_page():
+    text, offsets = join_pages(["one", "", "three"])
+    assert text == "one\nthree\n"
+    assert offsets == [0, 4, 4, 10]
+
+def test_put_and_get_round_trip(tmp_path):
+    cache = DiskDocumentCache(str(tmp_path))
+    file_id = content_hash(b"pdf bytes")
+    cache.put(file_id, "book.pdf", ["Page one", "", "Page three\nwith two lines"])
+
+    loaded = DiskDocumentCache(str(tmp_path)).get(file_id)
+    assert file_id in cache
+    assert loaded.filename == "book.pdf"
+    assert loaded.num_pages == 3
+    assert loaded.pages() == ["Page one", "", "Page three\nwith two lines"]
+
+def test_put_is_idempotent(tmp_path):
+    cache = DiskDocumentCache(str(tmp_path))
+    file_id = content_hash(b"same bytes")
+    cache.put(file_id, "a.pdf", ["text"])
+    cache.put(file_id, "a.pdf", ["text"])
+    assert cache.get(file_id).text == "text\n"
+
+def test_rejects_ids_that_are_not_digests(tmp_path):
+    cache = DiskDocumentCache(str(tmp_path))
+    assert cache.get("../../etc/passwd") is None
+    assert "test.pdf" not in cache
+
+def test_writer_appends_pages_and_publishes_on_commit(tmp_path):
+    cache = DiskDocumentCache(str(tmp_path))
+    file_id = content_hash(b"streamed")
+    with cache.writer(file_id, "big.pdf") as writer:
+        writer.append("Page one")
+        writer.append("")
+        assert file_id not in cache  # nothing visible until commit
+        writer.append("Page three")
+    assert cache.get(file_id).pages() == ["Page one", "", "Page three"]
+    assert cache.get(file_id).page_offsets == join_pages(["Page one", "", "Page three"])[1]
+
+def test_writer_discards_partial_document_on_error(tmp_path):
+    cache = DiskDocumentCache(str(tmp_path))
+    file_id = content_hash(b"broken")
+    try:
+        with cache.writer(file_id, "broken.pdf") as writer:
+            writer.append("Page one")
+            raise RuntimeError("extraction failed")
+    except RuntimeError:
+        pass
+    assert file_id not in cache
+    assert os.listdir(os.path.join(str(tmp_path), file_id[:2])) == []
+
+def _document(pages):
+    text, offsets = join_pages(pages)
+    return CachedDocument("doc", "doc.pdf", text, offsets)
+
+def test_page_range_views_slice_only_their_pages():
+    document = _document(["Page one", "", "Page three", "Page four"])
+    view = document.view(2, 3)
+    assert view.pages() == ["", "Page three"]
+    assert view.text == "Page three\n"
+    assert view.page_range == (2, 3) and view.num_pages == 2
+    assert document.view(3).pages() == ["Page three", "Page four"]
+    # A view of the whole document shares its buffer instead of copying it.
+    whole = document.view()
+    assert whole.text is document.text and whole.page_range is None
+    with pytest.raises(ValueError):
+        document.view(3, 5)
+    with pytest.raises(ValueError):
+        document.view(3, 2)
+
+def test_paragraph_offsets_follow_blank_lines_and_pages():
+    document = _document(["First.\n\nSecond.", "", "Third\n  \n\nFourth"])
+    assert document.num_paragraphs == 4
+    assert document.paragraph_offsets().itemsize == 8
+    assert document.view().paragraphs() == ["First.", "Second.", "Third", "Fourth"]
+    assert document.view(2, 3).paragraphs() == ["Third", "Fourth"]
+
+def test_blank_lines_and_pages_are_not_paragraphs():
+    document = _document(["\n\nFirst.\n \n", "   ", "Second.\n\nThird."])
+    assert document.num_paragraphs == 3
+    assert document.view().page_paragraphs() == [(1, "First."), (3, "Second."), (3, "Third.")]
@@ -0,0 +1,27 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from document_outline import build_outline
+
+
+def test_outline_finds_headings_and_their_pages():
+    pages = [
+        "Preface\nWhy this book exists.",
+        "CHAPTER 1\nPart of the problem is water.\n1.1 Rivers\nText.",
+        "Chapter 2: Mountains\nSome text ending here.",
+    ]
+    assert build_outline(pages) == [
+        {"title": "Preface", "page": 1, "level": 1},
+        {"title": "CHAPTER 1", "page": 2, "level": 1},
+        {"title": "1.1 Rivers", "page": 2, "level": 2},
+        {"title": "Chapter 2: Mountains", "page": 3, "level": 1},
+    ]
+
+def test_outline_falls_back_to_page_sections():
+    pages = ["plain text on the first page.", "and more plain text.", "x" * 50]
+    assert build_outline(pages, chunk_size=60) == [
+        {"title": "Pages 1-2", "page": 1, "level": 1},
+        {"title": "Page 3", "page": 3, "level": 1},
+    ]
@@ -0,0 +1,74 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from document_cache import DiskDocumentCache, content_hash, join_pages
+from document_store import DocumentStore, StoredDocument
+from retrieval import build_index
+
+
+def _document(name, pages, filename="book.pdf"):
+    text, offsets = join_pages(pages)
+    return StoredDocument(content_hash(name.encode()), filename, text, offsets)
+
+def test_least_recently_used_document_is_evicted_first():
+    a, b, c = (_document(name, ["x" * 1000]) for name in "abc")
+    store = DocumentStore(max_bytes=a.nbytes * 2 + 10)
+    store.put(a)
+    store.put(b)
+    store.get(a.file_id)  # a is now more recent than b
+    store.put(c)
+
+    assert a.file_id in store and c.file_id in store
+    assert b.file_id not in store
+    metrics = store.metrics()
+    assert metrics["evictions"] == 1
+    assert metrics["resident_bytes"] == a.nbytes + c.nbytes <= metrics["max_bytes"]
+
+def test_documents_expire_after_ttl():
+    now = [0.0]
+    store = DocumentStore(max_bytes=10**9, ttl_seconds=60, clock=lambda: now[0])
+    document = _document("a", ["text"])
+    store.put(document)
+    now[0] = 61
+    assert store.get(document.file_id) is None
+    assert store.metrics()["expirations"] == 1
+    assert store.metrics()["resident_bytes"] == 0
+
+def test_evicted_document_spills_to_disk_and_reloads_lazily(tmp_path):
+    spill = DiskDocumentCache(str(tmp_path))
+    store = DocumentStore(max_bytes=1, spill=spill, index_builder=lambda document: build_index(document.pages()))
+    first = _document("first", ["page one", "page two"])
+    store.put(first)
+    store.put(_document("second", ["other"]))  # over budget: first is spilled
+
+    assert first.file_id not in store
+    assert first.file_id in spill
+    reloaded = store.get(first.file_id)
+    assert reloaded.pages() == ["page one", "page two"]
+    assert reloaded.index is not None
+    metrics = store.metrics()
+    assert metrics["spill_writes"] == 2 and metrics["spill_loads"] == 1
+    assert metrics["misses"] == 1
+
+def test_get_resident_leaves_spilled_documents_on_disk(tmp_path):
+    spill = DiskDocumentCache(str(tmp_path))
+    store = DocumentStore(max_bytes=1, spill=spill)
+    first = _document("first", ["page one"])
+    store.put(first)
+    store.put(_document("second", ["other"]))
+
+    assert store.get_resident(first.file_id) is None
+    assert store.metrics()["spill_loads"] == 0
+    assert store.load_spilled(first.file_id).pages() == ["page one"]
+    assert store.get_resident(first.file_id) is not None
+    metrics = store.metrics()
+    assert metrics["misses"] == 1 and metrics["hits"] == 1 and metrics["spill_loads"] == 1
+
+def test_document_larger_than_budget_is_still_kept():
+    store = DocumentStore(max_bytes=10)
+    document = _document("big", ["y" * 5000])
+    store.put(document)
+    assert store.get(document.file_id) is document
+    assert store.metrics()["hits"] == 1
@@ -0,0 +1,84 @@
+import asyncio
+import json
+import re
+import sys
+import os
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from glossary import GlossaryBuilder, GlossaryEntry, GlossaryStore, extract_terms, locate_term
+from storage import SQLiteStorage
+
+PAGES = [
+    "A neural network has weights. The neural network uses backpropagation. Backpropagation is slow.",
+    "Gradient descent minimizes the loss function. The loss function matters. Neural network training.",
+    "Entropy appears here. Entropy and entropy again. Gradient descent, gradient descent. Loss function.",
+]
+
+
+def fake_glossary_llm(calls, drop_ids=()):
+    """Answers glossary prompts with one explanation per `[id]` in the prompt."""
+    async def llm_call(prompt, model_name):
+        calls.append(prompt)
+        ids = [int(i) for i in re.findall(r"^\[(\d+)\]", prompt, re.MULTILINE)]
+        return json.dumps([{"id": i, "explanation": f"Explanation {i}."} for i in ids if i not in drop_ids])
+    return llm_call
+
+def test_extract_terms_prefers_phrases_and_rare_terms():
+    candidates = extract_terms(PAGES, max_terms=10, min_count=2)
+    terms = [candidate.term.lower() for candidate in candidates]
+    assert terms[0] == "entropy"  # all on one page, so the highest idf
+    assert {"neural network", "loss function", "gradient descent", "backpropagation"} <= set(terms)
+    # "neural" only occurs inside "neural network", and phrases never span punctuation.
+    assert "neural" not in terms and "backpropagation backpropagation" not in terms
+    network = candidates[terms.index("neural network")]
+    assert network.page == 1 and "neural network" in network.context.lower()
+
+def test_extract_terms_respects_min_count_and_limit():
+    assert extract_terms(PAGES, max_terms=10, min_count=10) == []
+    assert len(extract_terms(PAGES, max_terms=2, min_count=2)) == 2
+
+def test_locate_term_finds_first_page_and_context():
+    assert locate_term(PAGES, "Loss  Function") == (2, PAGES[1])
+    assert locate_term(PAGES, "quantum") == (None, None)
+
+def test_builder_batches_terms_and_skips_missing_answers():
+    calls = []
+    candidates = extract_terms(PAGES, max_terms=5, min_count=2)
+    builder = GlossaryBuilder(fake_glossary_llm(calls, drop_ids={1}), terms_per_call=2)
+    entries = asyncio.run(builder.explain(candidates, "m"))
+    assert len(calls) == 3  # 5 terms, 2 per call
+    # The model skipped the second term of each full batch.
+    assert [entry.term for entry in entries] == [candidates[i].term for i in (0, 2, 4)]
+    assert entries[0].explanation == "Explanation 0." and entries[0].source == "batch"
+
+def test_builder_reports_failed_batches_as_missing():
+    async def failing(prompt, model_name):
+        raise RuntimeError("provider down")
+    candidates = extract_terms(PAGES, max_terms=3, min_count=2)
+    assert asyncio.run(GlossaryBuilder(failing).explain(candidates, "m")) == []
+
+def test_builder_stops_between_batches_when_cancelled():
+    calls = []
+    candidates = extract_terms(PAGES, max_terms=5, min_count=2)
+    builder = GlossaryBuilder(fake_glossary_llm(calls), terms_per_call=1, concurrency=1)
+
+    def check_cancelled():
+        if len(calls) >= 2:
+            raise RuntimeError("cancelled")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(builder.explain(candidates, "m", check_cancelled))
+    assert len(calls) == 2
+
+def test_store_merges_entries_and_looks_up_normalized_terms(tmp_path):
+    store = GlossaryStore(SQLiteStorage(str(tmp_path / "storage.sqlite3")))
+    store.add_entries("doc", "m", [GlossaryEntry("Entropy", "Disorder.", 3)])
+    store.add_entries("doc", "m", [GlossaryEntry("Loss function", "What training minimizes.", source="live")])
+    glossary = store.get("doc", "m")
+    assert glossary.lookup("  entropy? ").explanation == "Disorder."
+    assert glossary.lookup("LOSS FUNCTION").source == "live"
+    assert [entry["term"] for entry in glossary.to_dict()["terms"]] == ["Entropy", "Loss function"]
+    assert store.get("doc", "other-model") is None
@@ -0,0 +1,170 @@
+import asyncio
+import sys
+import os
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import llm_client
+from llm_client import ProviderLimiter, acall_completion, provider_for_model
+
+
+def test_provider_for_model_uses_models_config():
+    assert provider_for_model("gemini/gemini-2.0-flash") == "google"
+    assert provider_for_model("groq/llama-3.1-8b-instant") == "groq"
+    assert provider_for_model("openai/gpt-4o") == "openai"
+    assert provider_for_model("unknown-model") == "default"
+
+def test_acall_completion_respects_provider_cap():
+    limiter = ProviderLimiter({"google": 2}, default_limit=1)
+    in_flight = 0
+    peak = 0
+
+    async def fake_acompletion(model, messages, **kwargs):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=messages[0]["content"]))])
+
+    async def run():
+        return await asyncio.gather(*(
+            acall_completion(f"prompt {i}", "gemini/gemini-2.0-flash", limiter=limiter) for i in range(6)
+        ))
+
+    with patch.object(llm_client, "acompletion", fake_acompletion):
+        results = asyncio.run(run())
+
+    assert results == [f"prompt {i}" for i in range(6)]
+    assert peak == 2
+
+def test_provider_cap_is_shared_by_event_loops_in_other_threads():
+    import threading
+    limiter = ProviderLimiter({}, default_limit=2)
+    in_flight = 0
+    peak = 0
+    lock = threading.Lock()
+
+    async def call():
+        nonlocal in_flight, peak
+        async with limiter.semaphore("p"):
+            with lock:
+                in_flight += 1
+                peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            with lock:
+                in_flight -= 1
+
+    async def run():
+        await asyncio.gather(*(call() for _ in range(4)))
+
+    # Like the server's loop plus precompute threads, each running its own loop.
+    threads = [threading.Thread(target=asyncio.run, args=(run(),)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak == 2 and in_flight == 0
+
+from fake_llm import FakeProvider, FakeProviderError, FakeStep
+from llm_client import LatencyTracker, ResiliencePolicy, astream_completion, fallback_chain
+
+FAST_RETRIES = ResiliencePolicy(max_attempts=3, initial_wait=0.001, max_wait=0.002, hedge_percentile=0)
+
+def _run_with_fake(provider, coro_factory):
+    with patch.object(llm_client.fake_llm, "fake_provider", provider):
+        return asyncio.run(coro_factory())
+
+def test_fake_provider_answers_batch_prompts_with_json():
+    from batch_analysis import ANALYSES, build_batch_prompt, parse_batch_response, segments_from_texts
+    segments = segments_from_texts(["good", "bad"])
+    provider = FakeProvider(latency=0)
+    reply = _run_with_fake(provider, lambda: acall_completion(build_batch_prompt(ANALYSES["sentiment"], segments), "fake/m"))
+    assert parse_batch_response(reply, [0, 1])[1]["sentiment"] == "fake"
+
+def test_fake_provider_simulates_token_rates():
+    provider = FakeProvider(latency=0, prompt_tokens_per_second=1000, output_tokens_per_second=1000, reply_words=40)
+    start = time.perf_counter()
+    reply = _run_with_fake(provider, lambda: acall_completion("x" * 400, "fake/m"))
+    # 100 prompt tokens and a 40-word reply at 1000 tokens/s each.
+    assert time.perf_counter() - start >= 0.1
+    assert len(reply.split()) == 40
+
+def test_transient_errors_are_retried():
+    provider = FakeProvider(latency=0, script=[FakeStep(error=FakeProviderError(503)), FakeStep(error=FakeProviderError(429))])
+    result = _run_with_fake(provider, lambda: acall_completion("hello", "fake/m", policy=FAST_RETRIES))
+    assert result.startswith("Fake answer from fake/m")
+    assert provider.calls == 3
+
+def test_request_errors_are_not_retried_or_fallen_back():
+    provider = FakeProvider(latency=0, script=[FakeStep(error=FakeProviderError(400))])
+    with patch.dict(llm_client.MODELS_CONFIG, {"fallbacks": {"fake/m": ["fake/backup"]}}):
+        try:
+            _run_with_fake(provider, lambda: acall_completion("hello", "fake/m", policy=FAST_RETRIES))
+            assert False, "expected the 400 to be raised"
+        except FakeProviderError as e:
+            assert e.status_code == 400
+    assert provider.calls == 1
+
+def test_timeouts_are_retried():
+    provider = FakeProvider(latency=0, script=[FakeStep(latency=1.0)])
+    with patch.dict(llm_client.MODELS_CONFIG, {"provider_timeouts": {"fake": 0.05}}):
+        result = _run_with_fake(provider, lambda: acall_completion("hello", "fake/m", policy=FAST_RETRIES))
+    assert result.startswith("Fake answer")
+    assert provider.calls == 2
+
+def test_falls_back_along_the_chain_after_retries():
+    errors = [FakeStep(error=FakeProviderError(503)) for _ in range(3)]
+    provider = FakeProvider(latency=0, script=errors)
+    with patch.dict(llm_client.MODELS_CONFIG, {"fallbacks": {"fake/primary": ["fake/backup"]}}):
+        assert fallback_chain("fake/primary") == ["fake/primary", "fake/backup"]
+        result = _run_with_fake(provider, lambda: acall_completion("hello", "fake/primary", policy=FAST_RETRIES))
+    assert result.startswith("Fake answer from fake/backup")
+    assert provider.calls == 4
+
+def test_fallbacks_too_small_for_the_prompt_are_skipped():
+    errors = [FakeStep(error=FakeProviderError(503)) for _ in range(3)]
+    provider = FakeProvider(latency=0, script=errors)
+    config = {
+        "fallbacks": {"fake/big": ["fake/small", "fake/medium"]},
+        "context_windows": {"fake/big": 1_000_000, "fake/small": 8192, "fake/medium": 200_000},
+    }
+    with patch.dict(llm_client.MODELS_CONFIG, config):
+        assert fallback_chain("fake/big") == ["fake/big", "fake/small", "fake/medium"]
+        assert fallback_chain("fake/big", prompt_tokens=100_000) == ["fake/big", "fake/medium"]
+        result = _run_with_fake(
+            provider, lambda: acall_completion("hello", "fake/big", policy=FAST_RETRIES, prompt_tokens=100_000)
+        )
+    assert result.startswith("Fake answer from fake/medium")
+    assert provider.calls == 4
+
+def test_stream_falls_back_before_the_first_token():
+    provider = FakeProvider(latency=0, script=[FakeStep(error=FakeProviderError(401))])
+
+    async def collect():
+        return "".join([token async for token in astream_completion("hello", "fake/primary", policy=FAST_RETRIES)])
+
+    with patch.dict(llm_client.MODELS_CONFIG, {"fallbacks": {"fake/primary": ["fake/backup"]}}):
+        assert _run_with_fake(provider, collect).startswith("Fake answer from fake/backup")
+
+def test_slow_calls_are_hedged():
+    tracker = LatencyTracker()
+    for _ in range(20):
+        tracker.record("fake/m", 0.01)
+    assert tracker.percentile("fake/m", 95, min_samples=20) == 0.01
+    provider = FakeProvider(latency=0.01, script=[FakeStep(latency=2.0)])
+    policy = ResiliencePolicy(max_attempts=1, hedge_percentile=95, hedge_min_samples=20)
+
+    async def timed():
+        start = asyncio.get_running_loop().time()
+        result = await acall_completion("hello", "fake/m", policy=policy)
+        return result, asyncio.get_running_loop().time() - start
+
+    with patch.object(llm_client, "latency_tracker", tracker):
+        result, elapsed = _run_with_fake(provider, timed)
+    assert result.startswith("Fake answer")
+    assert elapsed < 1.0  # the hedge answered; the slow first request was cancelled
+    assert provider.calls == 2
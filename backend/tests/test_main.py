@@ -1,6 +1,6 @@
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import patch
+from unittest.mock import ANY, patch
 
 # Adjust the import path according to your project structure
 # This assumes main.py is in the directory above tests if you run pytest from backend/
@@ -14,6 +14,8 @@ from unittest.mock import patch
 
 import sys
 import os
+import time
+import json
 
 # Add the backend directory to sys.path for the test execution context
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -22,18 +24,38 @@ from main import app # Imports the FastAPI app instance from backend/main.py
 
 client = TestClient(app)
 
-# Mock data for pdf_texts in main.py for testing purposes
-# This needs to be done carefully. We can patch main.pdf_texts
-# or set it directly if the test setup allows modifying the app's state.
+# Mock data for the document store in main.py for testing purposes
+# This needs to be done carefully. We store a document directly
+# since the test setup allows modifying the app's state.
 
 @pytest.fixture(autouse=True)
-def setup_and_teardown_pdf_texts():
-    # Setup: Add a dummy PDF text for testing /qa
-    from main import pdf_texts
-    pdf_texts["test.pdf"] = "This is a test PDF content."
+def isolated_document_cache(tmp_path):
+    from document_cache import DiskDocumentCache
+    from main import document_store
+    from main import extraction_service
+    from storage import SQLiteStorage
+    cache = DiskDocumentCache(str(tmp_path / "documents"))
+    storage = SQLiteStorage(str(tmp_path / "storage.sqlite3"))
+    from main import glossaries, qa_sessions
+    with patch('main.document_cache', cache), patch.object(document_store, "spill", cache), \
+            patch('main.storage', storage), patch.object(extraction_service, "storage", storage), \
+            patch.object(qa_sessions, "storage", storage), patch.object(glossaries, "storage", storage):
+        yield
+
+@pytest.fixture(autouse=True)
+def setup_and_teardown_documents():
+    # Setup: Add a dummy PDF text (without a retrieval index) for testing /qa
+    from main import document_store
+    from document_store import StoredDocument
+    document_store.put(StoredDocument("test.pdf", "test.pdf", "This is a test PDF content.", [0, 27]))
     yield
-    # Teardown: Clear the dummy PDF text
-    pdf_texts.clear()
+    # Teardown: Clear the dummy PDF text, background tasks, cached LLM responses and token budgets
+    from main import admission_controller, artifact_pipeline, response_cache, session_prefixes
+    document_store.clear()
+    artifact_pipeline.clear()
+    response_cache.clear()
+    admission_controller.clear()
+    session_prefixes.clear()
 
 
 @patch('main.call_llm') # Mock the call_llm function in main.py
@@ -48,8 +70,79 @@ def test_qa_success(mock_call_llm):
     assert response.json() == {"answer": "This is a mock LLM answer."}
     mock_call_llm.assert_called_once_with(
         "Here is the entire document content:\n\nThis is a test PDF content.\n\nQuestion: What is this?\nAnswer:", 
-        "test-model"
+        "test-model", prompt_tokens=ANY
+    )
+
+@patch('main.call_llm')
+def test_qa_sends_only_relevant_chunks(mock_call_llm):
+    from main import store_document
+    mock_call_llm.return_value = "Page 2 says it is blue."
+    store_document("book.pdf", ["The sky chapter is short.", "The ocean is blue and deep.", "Unrelated appendix."])
+
+    response = client.post(
+        "/qa/",
+        data={"file_id": "book.pdf", "query": "What colour is the ocean?", "model_name": "test-model"}
     )
+    assert response.status_code == 200
+    prompt = mock_call_llm.call_args[0][0]
+    assert "[Page 2]\nThe ocean is blue and deep." in prompt
+    assert "Question: What colour is the ocean?" in prompt
+
+@patch('main.call_llm')
+def test_qa_and_summaries_can_be_limited_to_a_page_range(mock_call_llm):
+    from main import store_document
+    mock_call_llm.return_value = "Within range."
+    store_document("ranged.pdf", ["The ocean is blue.", "The ocean is deep.", "The ocean is cold."])
+
+    data = {"file_id": "ranged.pdf", "query": "What is the ocean like?", "model_name": "test-model", "page_start": 2, "page_end": 3}
+    assert client.post("/qa/", data=data).status_code == 200
+    prompt = mock_call_llm.call_args[0][0]
+    assert "[Page 2]" in prompt and "[Page 3]" in prompt and "[Page 1]" not in prompt
+
+    data = {"file_id": "ranged.pdf", "model_name": "test-model", "mode": "map_reduce", "page_start": 3}
+    assert client.post("/summarize/", data=data).status_code == 200
+    section_prompt = mock_call_llm.call_args_list[-2][0][0]
+    assert "Page 3 of a longer document" in section_prompt and "blue" not in section_prompt
+
+    # The same question about different pages isn't served from the other range's cache entry.
+    calls = mock_call_llm.call_count
+    client.post("/qa/", data={"file_id": "ranged.pdf", "query": "What is the ocean like?", "model_name": "test-model", "page_end": 1})
+    assert mock_call_llm.call_count == calls + 1
+
+    response = client.post("/qa/", data={"file_id": "ranged.pdf", "query": "Anything?", "model_name": "test-model", "page_start": 4})
+    assert response.status_code == 400
+    assert "the document has 3 pages" in response.json()["detail"]
+
+def test_evicted_document_is_reloaded_from_disk():
+    from benchmarks.synthetic_pdf import make_pdf
+    from main import document_store
+    file_id = _upload_and_wait(make_pdf(["Spilled page about otters"])).json()["file_id"]
+    document_store.discard(file_id)
+
+    with patch('main.call_llm', return_value="Otters.") as mock_call_llm:
+        response = client.post("/qa/", data={"file_id": file_id, "query": "Which animal?", "model_name": "test-model"})
+    assert response.status_code == 200
+    assert "otters" in mock_call_llm.call_args[0][0]
+    assert client.get("/documents/stats").json()["spill_loads"] >= 1
+
+def test_shared_retrieval_chunks_are_plain_json_with_a_ttl():
+    from document_cache import CachedDocument, join_pages
+    from main import DOCUMENT_ARTIFACT_TTL_SECONDS, QA_CHUNK_OVERLAP, QA_CHUNK_SIZE, load_qa_index
+    import main
+    document = CachedDocument("chunks.pdf", "chunks.pdf", *join_pages(["Beavers build dams.", "Owls hunt at night."]))
+    with patch.object(main.storage, "set", wraps=main.storage.set) as storage_set:
+        built = load_qa_index(document)
+    namespace, key, value, ttl_seconds = storage_set.call_args[0]
+    assert (namespace, key) == ("qa_chunks", f"chunks.pdf:{QA_CHUNK_SIZE}:{QA_CHUNK_OVERLAP}")
+    assert json.loads(value) == [{"text": "Beavers build dams.", "page": 1}, {"text": "Owls hunt at night.", "page": 2}]
+    assert ttl_seconds == DOCUMENT_ARTIFACT_TTL_SECONDS > 0
+
+    # Another worker rebuilds the same index from the stored chunks.
+    with patch('main.build_qa_index') as rebuild:
+        loaded = load_qa_index(document)
+    rebuild.assert_not_called()
+    assert loaded.chunks == built.chunks
+    assert loaded.search("owls", top_k=1)[0][0].page == 2
 
 def test_qa_pdf_not_found():
     response = client.post(
@@ -87,6 +180,176 @@ def test_qa_llm_error(mock_call_llm):
     assert response.status_code == 500 
     assert "LLM API call failed" in response.json()["detail"]
 
+@patch('main.call_llm')
+def test_repeated_question_is_served_from_response_cache(mock_call_llm):
+    mock_call_llm.return_value = "Cached answer."
+    first = client.post("/qa/", data={"file_id": "test.pdf", "query": "What is this?", "model_name": "test-model"})
+    second = client.post("/qa/", data={"file_id": "test.pdf", "query": "  what is THIS ", "model_name": "test-model"})
+
+    assert first.json() == second.json() == {"answer": "Cached answer."}
+    assert first.headers["X-Cache"] == "MISS"
+    assert second.headers["X-Cache"] == "HIT"
+    mock_call_llm.assert_called_once()
+    assert client.get("/cache/stats").json()["qa"] == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+@patch('main.call_llm')
+def test_response_cache_can_be_disabled_per_endpoint(mock_call_llm):
+    from main import response_cache
+    mock_call_llm.return_value = "Fresh explanation."
+    with patch.object(response_cache, "disabled_endpoints", {"explain_term"}):
+        for _ in range(2):
+            response = client.post("/explain_term/", data={"term": "entropy", "model_name": "test-model"})
+            assert "X-Cache" not in response.headers
+    assert mock_call_llm.call_count == 2
+
+@patch('main.call_llm')
+def test_llm_errors_are_not_cached(mock_call_llm):
+    from fastapi import HTTPException
+    mock_call_llm.side_effect = [HTTPException(status_code=500, detail="LLM API call failed: boom"), "Recovered."]
+    data = {"text_segment": "The moon is made of cheese.", "model_name": "test-model"}
+    assert client.post("/detect_misinformation/", data=data).status_code == 500
+    assert client.post("/detect_misinformation/", data=data).json() == {"misinformation_analysis": "Recovered."}
+
+@patch('main.call_llm')
+def test_map_reduce_summary_reuses_section_summaries(mock_call_llm):
+    from main import store_document
+    mock_call_llm.return_value = "A summary."
+    store_document("long.pdf", ["First chapter text.", "Second chapter text."])
+
+    data = {"file_id": "long.pdf", "model_name": "test-model", "summary_length": "Short", "mode": "map_reduce"}
+    response = client.post("/summarize/", data=data)
+    assert response.status_code == 200
+    assert response.json() == {"summary": "A summary."}
+    first_calls = mock_call_llm.call_count
+    assert first_calls >= 2  # at least one section summary plus the reduce
+
+    client.post("/summarize/", data={**data, "summary_length": "Long", "keywords": "chapters"})
+    assert mock_call_llm.call_count == first_calls + 1
+    assert "chapters" in mock_call_llm.call_args[0][0]
+
+def test_summarize_rejects_unknown_mode():
+    response = client.post("/summarize/", data={"file_id": "test.pdf", "model_name": "test-model", "mode": "fast"})
+    assert response.status_code == 400
+
+def _fake_stream(*tokens, error=None):
+    async def _stream(prompt, model_name, **kwargs):
+        for token in tokens:
+            yield token
+        if error:
+            raise error
+    return _stream
+
+def test_qa_stream_relays_tokens_as_sse():
+    with patch('main.astream_completion', _fake_stream("Hello", " world")):
+        response = client.post(
+            "/qa/stream/",
+            data={"file_id": "test.pdf", "query": "What is this?", "model_name": "test-model"}
+        )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    body = response.text
+    assert 'data: {"token": "Hello"}' in body
+    assert 'data: {"token": " world"}' in body
+    assert "event: done" in body and '"ttft_ms"' in body
+
+def test_summarize_stream_reports_llm_error_event():
+    with patch('main.astream_completion', _fake_stream("Partial", error=Exception("provider down"))):
+        response = client.post("/summarize/stream/", data={"file_id": "test.pdf", "model_name": "test-model"})
+    assert response.status_code == 200
+    assert "event: error" in response.text
+    assert "provider down" in response.text
+
+def test_qa_stream_pdf_not_found():
+    response = client.post(
+        "/qa/stream/",
+        data={"file_id": "nonexistent.pdf", "query": "What is this?", "model_name": "test-model"}
+    )
+    assert response.status_code == 404
+
+def _upload(pdf_bytes, filename="book.pdf"):
+    return client.post("/upload_pdf/", files={"file": (filename, pdf_bytes, "application/pdf")})
+
+def _wait_for_job(job_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = client.get(f"/upload_pdf/status/{job_id}").json()
+        if status["status"] != "processing":
+            return status
+        time.sleep(0.05)
+    raise AssertionError(f"Upload job {job_id} did not finish in {timeout}s")
+
+def _upload_and_wait(pdf_bytes, filename="book.pdf"):
+    response = _upload(pdf_bytes, filename)
+    assert response.status_code == 200
+    if response.json()["job_id"]:
+        assert _wait_for_job(response.json()["job_id"])["status"] == "done"
+    return response
+
+def test_upload_pdf_uses_content_hash_as_file_id():
+    from benchmarks.synthetic_pdf import make_pdf
+    from document_cache import content_hash
+    from main import document_store
+    pdf_bytes = make_pdf(["First page", "Second page"])
+
+    response = _upload_and_wait(pdf_bytes)
+    assert response.json()["file_id"] == content_hash(pdf_bytes)
+    assert response.json()["cached"] is False
+    document = document_store.get(content_hash(pdf_bytes))
+    assert document.num_pages == 2
+    assert "First page" in document.text
+    assert "Second page" in document.text
+
+def test_upload_pdf_same_name_different_content_gets_new_id():
+    from benchmarks.synthetic_pdf import make_pdf
+    first = _upload_and_wait(make_pdf(["Edition one"]), "book.pdf").json()["file_id"]
+    second = _upload_and_wait(make_pdf(["Edition two"]), "book.pdf").json()["file_id"]
+    assert first != second
+
+def test_repeat_upload_is_served_from_disk_cache_without_parsing():
+    from benchmarks.synthetic_pdf import make_pdf
+    from main import document_store
+    pdf_bytes = make_pdf(["Cached page"])
+    file_id = _upload_and_wait(pdf_bytes).json()["file_id"]
+    document_store.clear()  # e.g. a restart, or another worker handling the request
+
+    with patch('main.extraction_service.submit') as mock_submit:
+        response = _upload(pdf_bytes)
+    mock_submit.assert_not_called()
+    assert response.json()["file_id"] == file_id
+    assert response.json()["cached"] is True
+    assert "Cached page" in document_store.get(file_id).text
+
+def test_upload_pdf_reports_page_progress_and_keeps_page_order():
+    from benchmarks.synthetic_pdf import make_pdf
+    from main import document_store, extraction_service
+    pages = [f"Page marker {i}" for i in range(40)]
+    with patch.object(extraction_service, "pages_per_task", 8):
+        response = _upload(make_pdf(pages))
+        status = _wait_for_job(response.json()["job_id"])
+
+    assert status["status"] == "done"
+    assert status["pages_done"] == status["pages_total"] == 40
+    text = document_store.get(response.json()["file_id"]).text
+    positions = [text.index(f"Page marker {i}\n") for i in range(40)]
+    assert positions == sorted(positions)
+
+def test_qa_while_processing_returns_409():
+    from main import extraction_service
+    with patch.object(extraction_service, "is_processing", return_value=True):
+        response = client.post(
+            "/qa/",
+            data={"file_id": "pending.pdf", "query": "What is this?", "model_name": "test-model"}
+        )
+    assert response.status_code == 409
+
+def test_upload_status_unknown_job():
+    response = client.get("/upload_pdf/status/does-not-exist")
+    assert response.status_code == 404
+
+def test_upload_pdf_rejects_non_pdf():
+    response = client.post("/upload_pdf/", files={"file": ("notes.txt", b"hello", "text/plain")})
+    assert response.status_code == 400
+
 # Basic test for the root endpoint
 def test_read_root():
     response = client.get("/")
@@ -94,3 +357,341 @@ def test_read_root():
     assert response.json() == {"message": "Welcome to the PDF Q&A Backend API!"}
 
 # TODO: Add tests for /upload_pdf and other endpoints
+
+
+@patch('llm_client.acompletion')
+def test_qa_reports_token_usage(mock_acompletion):
+    from main import token_usage_stats
+    from types import SimpleNamespace
+    token_usage_stats.clear()
+
+    async def fake_acompletion(**kwargs):
+        message = SimpleNamespace(content="An answer.")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+    mock_acompletion.side_effect = fake_acompletion
+
+    response = client.post(
+        "/qa/",
+        data={"file_id": "test.pdf", "query": "What is this?", "model_name": "test-model"}
+    )
+    assert response.status_code == 200
+    assert int(response.headers["X-Prompt-Tokens"]) > 0
+    assert int(response.headers["X-Completion-Tokens"]) > 0
+
+    stats = client.get("/tokens/stats").json()
+    assert stats["/qa/"]["requests"] == 1
+    assert stats["/qa/"]["prompt_tokens"] == int(response.headers["X-Prompt-Tokens"])
+
+def test_token_stats_group_requests_by_route_template():
+    import llm_client
+    from fake_llm import FakeProvider
+    from main import store_document, token_usage_stats
+    token_usage_stats.clear()
+    store_document("session.pdf", ["Otters live in rivers."])
+    with patch.object(llm_client.fake_llm, "fake_provider", FakeProvider(latency=0)):
+        for _ in range(2):
+            session = client.post("/qa/sessions/", data={"file_id": "session.pdf", "model_name": "fake/chat"}).json()
+            assert client.post(f"/qa/sessions/{session['session_id']}/", data={"query": "Where?"}).status_code == 200
+    stats = client.get("/tokens/stats").json()
+    assert list(stats) == ["/qa/sessions/{session_id}/"]
+    assert stats["/qa/sessions/{session_id}/"]["requests"] == 2
+
+@patch('llm_client.acompletion')
+def test_oversized_prompt_is_rejected_with_413(mock_acompletion):
+    from main import document_store
+    from document_store import StoredDocument
+    text = "word " * 100_000
+    document_store.put(StoredDocument("big.pdf", "big.pdf", text, [0, len(text)]))
+
+    # Unknown models get the default 8192-token window; disable trimming so the prompt overflows it.
+    with patch('main.prompt_budget', return_value=10 ** 9):
+        response = client.post(
+            "/qa/",
+            data={"file_id": "big.pdf", "query": "What is this?", "model_name": "test-model"}
+        )
+    assert response.status_code == 413
+    assert "context window" in response.json()["detail"]
+    mock_acompletion.assert_not_called()
+
+@patch('main.call_llm')
+def test_full_text_qa_prompt_is_trimmed_to_budget(mock_call_llm):
+    from main import document_store
+    from document_store import StoredDocument
+    mock_call_llm.return_value = "ok"
+    text = "word " * 100_000
+    document_store.put(StoredDocument("big.pdf", "big.pdf", text, [0, len(text)]))
+
+    response = client.post(
+        "/qa/",
+        data={"file_id": "big.pdf", "query": "What is this?", "model_name": "test-model"}
+    )
+    assert response.status_code == 200
+    prompt = mock_call_llm.call_args[0][0]
+    assert "truncated to fit the model's context window" in prompt
+    assert len(prompt) < len(text)
+    # The trimmed text's count is passed along, so call_llm doesn't tokenize the prompt again.
+    from token_budget import prompt_budget
+    assert 0 < mock_call_llm.call_args.kwargs["prompt_tokens"] <= prompt_budget("test-model")
+
+@patch('main.call_llm')
+def test_sentiment_batch_streams_ndjson(mock_call_llm):
+    from test_batch_analysis import fake_batch_llm
+    calls = []
+    mock_call_llm.side_effect = fake_batch_llm(calls)
+
+    response = client.post(
+        "/analyze_sentiment/batch/",
+        data={"model_name": "test-model", "text_segments": ["I love it.", "I hate it.", "It is a table."]}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(line["index"] for line in lines[:-1]) == [0, 1, 2]
+    assert lines[-1]["done"] and lines[-1]["segments"] == 3 and lines[-1]["errors"] == 0
+    assert len(calls) == 1
+
+@patch('main.call_llm')
+def test_misinformation_batch_segments_an_uploaded_document(mock_call_llm):
+    from test_batch_analysis import fake_batch_llm
+    mock_call_llm.side_effect = fake_batch_llm([])
+
+    response = client.post(
+        "/detect_misinformation/batch/",
+        data={"model_name": "test-model", "file_id": "test.pdf", "segmentation": "page"}
+    )
+    assert response.status_code == 200
+    first = json.loads(response.text.splitlines()[0])
+    assert first["page"] == 1
+
+@patch('main.call_llm')
+def test_batch_analysis_of_a_page_range_keeps_document_page_numbers(mock_call_llm):
+    from main import store_document
+    from test_batch_analysis import fake_batch_llm
+    mock_call_llm.side_effect = fake_batch_llm([])
+    store_document("pages.pdf", ["One.", "Two.", "Three.", "Four."])
+
+    response = client.post(
+        "/analyze_sentiment/batch/",
+        data={"model_name": "test-model", "file_id": "pages.pdf", "segmentation": "page", "page_start": 2, "page_end": 3}
+    )
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(line["page"] for line in lines[:-1]) == [2, 3]
+
+def test_batch_requires_segments_or_known_document():
+    response = client.post("/analyze_sentiment/batch/", data={"model_name": "test-model"})
+    assert response.status_code == 400
+    response = client.post("/analyze_sentiment/batch/", data={"model_name": "test-model", "file_id": "missing.pdf"})
+    assert response.status_code == 404
+    response = client.post(
+        "/analyze_sentiment/batch/", data={"model_name": "test-model", "file_id": "test.pdf", "segmentation": "words"}
+    )
+    assert response.status_code == 400
+
+def test_upload_over_max_size_returns_413():
+    from benchmarks.synthetic_pdf import make_pdf
+    pdf_bytes = make_pdf(["A page"] * 5)
+    with patch('main.MAX_UPLOAD_BYTES', len(pdf_bytes) - 1):
+        response = _upload(pdf_bytes)
+    assert response.status_code == 413
+    assert "maximum upload size" in response.json()["detail"]
+
+def test_qa_retries_transient_llm_errors():
+    import llm_client
+    from fake_llm import FakeProvider, FakeProviderError, FakeStep
+    provider = FakeProvider(latency=0, script=[FakeStep(error=FakeProviderError(503))])
+    fast = llm_client.ResiliencePolicy(initial_wait=0.001, max_wait=0.002)
+    llm_client.resilience_stats.clear()
+    with patch.object(llm_client.fake_llm, "fake_provider", provider), \
+         patch.object(llm_client, "default_policy", fast):
+        response = client.post(
+            "/qa/",
+            data={"file_id": "test.pdf", "query": "What is this?", "model_name": "fake/test-model"}
+        )
+    assert response.status_code == 200
+    assert response.json()["answer"].startswith("Fake answer from fake/test-model")
+    assert client.get("/llm/stats").json()["retries"] == 1
+
+def test_metrics_endpoint_exports_request_and_span_timings():
+    from fake_llm import FakeProvider
+    import llm_client
+    with patch.object(llm_client.fake_llm, "fake_provider", FakeProvider(latency=0)):
+        response = client.post(
+            "/qa/",
+            data={"file_id": "test.pdf", "query": "How long did this take?", "model_name": "fake/metrics-model"}
+        )
+    assert response.status_code == 200
+
+    metrics = client.get("/metrics")
+    assert metrics.status_code == 200
+    assert metrics.headers["content-type"].startswith("text/plain")
+    text = metrics.text
+    assert 'bookai_requests_total{endpoint="/qa/",method="POST",status="200"}' in text
+    for stage in ("prompt_build", "token_count", "queue_wait", "llm_total"):
+        assert f'bookai_span_duration_seconds_count{{endpoint="/qa/",span="{stage}",model="other"}}' in text
+    assert "# TYPE bookai_llm_resilience_events_total counter" in text
+
+def test_endpoints_that_count_while_building_prompts_still_report_token_counting():
+    from fake_llm import FakeProvider
+    import llm_client
+    requests = {
+        "/summarize/": {"file_id": "test.pdf", "summary_length": "Short"},
+        "/explain_term/": {"term": "entropy", "context": "Entropy measures disorder."},
+        "/analyze_sentiment/": {"text_segment": "What a lovely day."},
+    }
+    with patch.object(llm_client.fake_llm, "fake_provider", FakeProvider(latency=0)):
+        for path, data in requests.items():
+            assert client.post(path, data={**data, "model_name": "fake/metrics-model"}).status_code == 200
+    text = client.get("/metrics").text
+    for path in requests:
+        assert f'bookai_span_duration_seconds_count{{endpoint="{path}",span="token_count",model="other"}}' in text
+
+def _wait_for_artifact(file_id, name, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        artifact = client.get(f"/documents/{file_id}/artifacts").json()["artifacts"].get(name)
+        if artifact and artifact["status"] not in ("queued", "running"):
+            return artifact
+        time.sleep(0.05)
+    raise AssertionError(f"Artifact {name} for {file_id} did not finish in {timeout}s")
+
+def test_upload_precomputes_outline_and_default_summary():
+    import llm_client
+    from benchmarks.synthetic_pdf import make_pdf
+    from fake_llm import FakeProvider
+    pdf_bytes = make_pdf(["CHAPTER 1 Rivers and how they flow", "More about rivers.", "CHAPTER 2 Mountains"])
+    provider = FakeProvider(latency=0)
+    with patch('main.PRECOMPUTE_SUMMARY_MODEL', "fake/precompute"), \
+         patch.object(llm_client.fake_llm, "fake_provider", provider):
+        file_id = _upload_and_wait(pdf_bytes).json()["file_id"]
+        assert _wait_for_artifact(file_id, "outline")["status"] == "done"
+        assert _wait_for_artifact(file_id, "summary")["status"] == "done"
+        calls = provider.calls
+
+        outline = client.get(f"/documents/{file_id}/outline").json()["outline"]
+        response = client.post("/summarize/", data={"file_id": file_id, "model_name": "fake/precompute", "summary_length": "Medium"})
+
+    assert [(entry["title"], entry["page"]) for entry in outline] == [
+        ("CHAPTER 1 Rivers and how they flow", 1), ("CHAPTER 2 Mountains", 3)
+    ]
+    assert response.status_code == 200
+    assert response.headers["X-Cache"] == "HIT"
+    assert provider.calls == calls
+    # The warm-up itself isn't counted as a summarize miss.
+    from main import response_cache
+    assert response_cache.stats()["summarize"]["misses"] == 0
+
+def test_qa_session_sends_the_document_once_and_reports_cache_savings():
+    import llm_client
+    from fake_llm import FakeProvider
+    from main import store_document
+    store_document("session.pdf", ["Otters live in rivers.", "Otters eat fish and crabs."])
+    provider = FakeProvider(latency=0)
+    with patch.object(llm_client.fake_llm, "fake_provider", provider):
+        session = client.post("/qa/sessions/", data={"file_id": "session.pdf", "model_name": "fake/chat"}).json()
+        assert session["mode"] == "document"
+        url = f"/qa/sessions/{session['session_id']}/"
+        first = client.post(url, data={"query": "Where do otters live?"}).json()
+        second = client.post(url, data={"query": "What do they eat?"}).json()
+
+    assert first["turn"] == 1 and second["turn"] == 2
+    assert first["usage"]["cached_tokens"] == 0
+    # The unchanged document prefix is served from the (fake) provider's prompt cache.
+    assert second["usage"]["cached_tokens"] > 0
+    assert second["usage"]["prompt_tokens"] > first["usage"]["prompt_tokens"]  # carries the first turn
+    assert second["session"]["cached_tokens"] == second["usage"]["cached_tokens"]
+
+    history = client.get(f"/qa/sessions/{session['session_id']}").json()
+    assert [turn["question"] for turn in history["turns"]] == ["Where do otters live?", "What do they eat?"]
+    assert client.delete(f"/qa/sessions/{session['session_id']}").json()["deleted"] is True
+    assert client.post(url, data={"query": "Anything else?"}).status_code == 404
+
+def test_qa_session_builds_its_prefix_and_baseline_once():
+    import llm_client
+    import main
+    from fake_llm import FakeProvider
+    main.store_document("session.pdf", ["Otters live in rivers.", "Otters eat fish and crabs."])
+    with patch.object(llm_client.fake_llm, "fake_provider", FakeProvider(latency=0)), \
+         patch('main.document_prefix', wraps=main.document_prefix) as build_prefix, \
+         patch('main.build_qa_prompt', wraps=main.build_qa_prompt) as build_baseline:
+        session = client.post("/qa/sessions/", data={"file_id": "session.pdf", "model_name": "fake/chat"}).json()
+        url = f"/qa/sessions/{session['session_id']}/"
+        turns = [client.post(url, data={"query": query}).json() for query in ("Where?", "What do they eat?", "When?")]
+    assert build_prefix.call_count == 1
+    assert build_baseline.call_count == 1
+    baselines = [turn["usage"]["baseline_prompt_tokens"] for turn in turns]
+    assert baselines[1] > baselines[0] == baselines[2]  # only the question differs
+
+def test_qa_session_uses_retrieval_for_documents_over_budget():
+    from main import store_document
+    store_document("huge.pdf", ["word " * 5000])
+    with patch('main.QA_SESSION_HISTORY_TOKENS', 10**6):
+        response = client.post("/qa/sessions/", data={"file_id": "huge.pdf", "model_name": "fake/chat"})
+        assert response.json()["mode"] == "retrieval"
+        response = client.post("/qa/sessions/", data={"file_id": "huge.pdf", "model_name": "fake/chat", "mode": "document"})
+        assert response.status_code == 413
+
+def test_glossary_is_built_in_batches_and_serves_explain_term():
+    import llm_client
+    from fake_llm import FakeProvider
+    from main import glossary_builder, store_document
+    from test_glossary import PAGES
+    # Each page twice, so the five terms reach the default minimum count and "weights" doesn't.
+    store_document("glossary.pdf", [f"{page} {page}" for page in PAGES])
+    provider = FakeProvider(latency=0)
+    with patch.object(llm_client.fake_llm, "fake_provider", provider), patch.object(glossary_builder, "terms_per_call", 2):
+        built = client.post("/documents/glossary.pdf/glossary/", data={"model_name": "fake/gloss", "max_terms": 5}).json()
+        assert built["candidates"] == 5 and built["explained"] == 5 and built["failed"] == 0
+        assert provider.calls == 3
+
+        hit = client.post("/explain_term/", data={"term": "Entropy", "model_name": "fake/gloss", "file_id": "glossary.pdf"})
+        assert hit.json() == {"explanation": "fake", "source": "glossary", "page": 3}
+        assert hit.headers["X-Cache"] == "HIT"
+        assert provider.calls == 3
+
+        # A term outside the glossary is explained live with its context in the book, then added.
+        miss = client.post("/explain_term/", data={"term": "weights", "model_name": "fake/gloss", "file_id": "glossary.pdf"})
+        assert miss.json()["source"] == "live" and miss.json()["page"] == 1
+        assert provider.calls == 4
+        again = client.post("/explain_term/", data={"term": "Weights", "model_name": "fake/gloss", "file_id": "glossary.pdf"})
+        assert again.json()["source"] == "glossary"
+        assert provider.calls == 4
+
+        # Rebuilding only explains terms the glossary doesn't have yet.
+        rebuilt = client.post("/documents/glossary.pdf/glossary/", data={"model_name": "fake/gloss", "max_terms": 5}).json()
+        assert rebuilt["explained"] == 0 and provider.calls == 4
+
+    glossary = client.get("/documents/glossary.pdf/glossary", params={"model_name": "fake/gloss"}).json()
+    assert len(glossary["terms"]) == 6
+    assert client.get("/documents/glossary.pdf/glossary", params={"model_name": "fake/other"}).status_code == 404
+    terms = client.get("/documents/glossary.pdf/terms", params={"max_terms": 3}).json()["terms"]
+    assert terms[0]["term"] == "Entropy" and len(terms) == 3
+
+def test_explaining_a_term_the_book_never_uses_leaves_the_glossary_alone():
+    import llm_client
+    from fake_llm import FakeProvider
+    from main import glossaries, store_document
+    store_document("terms.pdf", ["Entropy measures disorder."])
+    with patch.object(llm_client.fake_llm, "fake_provider", FakeProvider(latency=0)):
+        response = client.post("/explain_term/", data={"term": "Photosynthesis", "model_name": "fake/gloss", "file_id": "terms.pdf"})
+    assert response.status_code == 200
+    assert response.json()["source"] == "live" and response.json()["page"] is None
+    assert glossaries.get("terms.pdf", "fake/gloss") is None
+
+def test_admission_control_rejects_clients_over_their_token_budget():
+    import llm_client
+    from fake_llm import FakeProvider
+    from main import admission_controller
+    with patch.object(llm_client.fake_llm, "fake_provider", FakeProvider(latency=0)), \
+            patch.object(admission_controller, "client_tokens_per_minute", 1):
+        first = client.post("/explain_term/", data={"term": "entropy", "model_name": "fake/admission"})
+        assert first.status_code == 200
+        # The first request's tokens put this client over its budget for the next minute.
+        second = client.post("/explain_term/", data={"term": "gradient", "model_name": "fake/admission"})
+        assert second.status_code == 429
+        assert second.headers["Retry-After"] == "60"
+        # Endpoints that don't call an LLM aren't gated.
+        assert client.get("/documents/test.pdf").status_code == 200
+
+    stats = client.get("/admission/stats").json()
+    assert stats["admitted"] == 1 and stats["rejected_429"] == 1 and stats["active"] == 0
+    assert 'bookai_admission_rejections_total{reason="client_tokens"}' in client.get("/metrics").text
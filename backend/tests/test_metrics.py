@@ -0,0 +1,69 @@
+import asyncio
+import json
+import logging
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from metrics import Counter, Histogram, MetricsMiddleware, MetricsRegistry, current_trace, record_span, span, span_duration
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("latency_seconds", "Latency.", ("endpoint",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value, "/qa/")
+    lines = list(histogram.samples())
+    assert 'latency_seconds_bucket{endpoint="/qa/",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{endpoint="/qa/",le="1"} 3' in lines
+    assert 'latency_seconds_bucket{endpoint="/qa/",le="+Inf"} 4' in lines
+    assert 'latency_seconds_count{endpoint="/qa/"} 4' in lines
+    assert histogram.count("/qa/") == 4
+
+def test_registry_renders_prometheus_text_with_escaped_labels():
+    registry = MetricsRegistry()
+    counter = registry.register(Counter("requests_total", "Requests.", ("model",)))
+    counter.inc('say "hi"')
+    counter.inc('say "hi"', amount=2)
+    registry.callback("queue_depth", "Queued requests.", "gauge", (), lambda: {(): 3})
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{model="say \\"hi\\""} 3' in text
+    assert "# TYPE queue_depth gauge\nqueue_depth 3\n" in text
+
+def test_middleware_records_spans_and_logs_json(caplog):
+    class Route:
+        path = "/items/{item_id}"
+
+    async def app(scope, receive, send):
+        scope["route"] = Route()
+        with span("prompt_build", "fake/model"):
+            pass
+        assert current_trace.get().model == "fake/model"
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def send(message):
+        pass
+
+    scope = {"type": "http", "path": "/items/42", "method": "GET"}
+    before = span_duration.count("/items/{item_id}", "prompt_build", "other")
+    with caplog.at_level(logging.INFO, logger="bookai.requests"):
+        asyncio.run(MetricsMiddleware(app, log_requests=True)(scope, None, send))
+
+    assert span_duration.count("/items/{item_id}", "prompt_build", "other") == before + 1
+    line = json.loads(caplog.records[-1].getMessage())
+    assert line["endpoint"] == "/items/{item_id}"
+    assert line["status"] == 200
+    assert "prompt_build" in line["spans_ms"]
+
+def test_span_model_label_is_limited_to_configured_models():
+    import llm_client  # registers the models in models_config.json
+    before = span_duration.count("background", "llm_total", "gemini-2.0-flash")
+    others = span_duration.count("background", "llm_total", "other")
+    record_span("llm_total", 0.1, "gemini/gemini-2.0-flash")
+    for i in range(3):
+        record_span("llm_total", 0.1, f"made-up/model-{i}")
+    assert span_duration.count("background", "llm_total", "gemini-2.0-flash") == before + 1
+    assert span_duration.count("background", "llm_total", "other") == others + 3
+    assert span_duration.count("background", "llm_total", "made-up/model-0") == 0
@@ -0,0 +1,90 @@
+"""
+Runs two API servers as separate processes sharing one local storage
+directory, the way uvicorn workers on one host do, and checks that a document
+uploaded through one of them is usable through the other.
+"""
+import socket
+import subprocess
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+import pytest
+
+from benchmarks.synthetic_pdf import make_pdf
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _wait_until_up(base_url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(base_url + "/", timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server at {base_url} did not start.")
+
+@pytest.fixture
+def two_workers(tmp_path):
+    env = {
+        **os.environ,
+        "STORAGE_BACKEND": "local",
+        "STORAGE_PATH": str(tmp_path / "storage.sqlite3"),
+        "DOCUMENT_CACHE_DIR": str(tmp_path / "documents"),
+        "RESPONSE_CACHE_BACKEND": "storage",
+        "PDF_EXTRACTION_WORKERS": "1",
+        # Skip litellm's model cost map download at import; the test runs offline.
+        "LITELLM_LOCAL_MODEL_COST_MAP": "True",
+    }
+    servers, urls = [], []
+    try:
+        for _ in range(2):
+            port = _free_port()
+            servers.append(subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+                cwd=BACKEND_DIR, env=env,
+            ))
+            urls.append(f"http://127.0.0.1:{port}")
+        for url in urls:
+            _wait_until_up(url)
+        yield urls
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+def test_document_uploaded_to_one_worker_is_served_by_another(two_workers):
+    first, second = two_workers
+    pdf_bytes = make_pdf([f"Page {i} about the river economy" for i in range(1, 41)])
+
+    upload = httpx.post(first + "/upload_pdf/", files={"file": ("book.pdf", pdf_bytes, "application/pdf")}).json()
+    file_id, job_id = upload["file_id"], upload["job_id"]
+
+    # Progress can be polled on the worker that did not receive the upload.
+    deadline = time.monotonic() + 60
+    status = httpx.get(f"{second}/upload_pdf/status/{job_id}")
+    while status.json()["status"] == "processing" and time.monotonic() < deadline:
+        time.sleep(0.1)
+        status = httpx.get(f"{second}/upload_pdf/status/{job_id}")
+    assert status.status_code == 200
+    assert status.json()["status"] == "done"
+    assert status.json()["pages_total"] == 40
+
+    document = httpx.get(f"{second}/documents/{file_id}")
+    assert document.status_code == 200
+    assert document.json()["num_pages"] == 40
+
+    # Re-uploading through the other worker finds the finished document instead of parsing it again.
+    again = httpx.post(second + "/upload_pdf/", files={"file": ("book.pdf", pdf_bytes, "application/pdf")}).json()
+    assert again["file_id"] == file_id
+    assert again["cached"] is True
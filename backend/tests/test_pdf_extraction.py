@@ -0,0 +1,48 @@
+import threading
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.synthetic_pdf import make_pdf
+from pdf_extraction import ExtractionService, iter_pages
+from storage import SQLiteStorage
+
+
+def test_iter_pages_reads_from_a_path_in_order(tmp_path):
+    path = tmp_path / "book.pdf"
+    path.write_bytes(make_pdf([f"Page number {i}" for i in range(1, 6)]))
+    progress = []
+    pages = list(iter_pages(str(path), pages_per_task=2, on_progress=lambda done, total: progress.append(done)))
+    assert [page.strip() for page in pages] == [f"Page number {i}" for i in range(1, 6)]
+    assert progress == [0, 2, 4, 5]
+
+def test_jobs_are_shared_between_services_through_storage(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "storage.sqlite3"))
+    first, second = ExtractionService(1, storage=storage), ExtractionService(1, storage=storage)
+    pdf_bytes = make_pdf(["Shared page"])
+    release, finished = threading.Event(), threading.Event()
+
+    def on_pages(job, pages):
+        list(pages)
+        release.wait(10)
+
+    try:
+        job = first.submit("doc", "book.pdf", pdf_bytes, on_pages)
+        # Another worker asked for the same document gets the running job instead of a new one.
+        other = second.submit("doc", "book.pdf", pdf_bytes, lambda job, pages: finished.set())
+        assert other.job_id == job.job_id
+        assert second.is_processing("doc")
+        assert second.get(job.job_id).status == "processing"
+
+        release.set()
+        for _ in range(200):
+            if second.get(job.job_id).status != "processing":
+                break
+            threading.Event().wait(0.05)
+        assert second.get(job.job_id).status == "done"
+        assert not second.is_processing("doc")
+        assert not finished.is_set()
+    finally:
+        first.shutdown()
+        second.shutdown()
@@ -0,0 +1,99 @@
+import threading
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from precompute import ArtifactPipeline
+
+
+def test_tasks_run_in_priority_order_and_are_deduplicated():
+    pipeline = ArtifactPipeline(workers=1)
+    release = threading.Event()
+    order = []
+    try:
+        blocker = pipeline.submit("doc", "blocker", lambda task: release.wait(10), priority=0)
+        pipeline.submit("doc", "summary", lambda task: order.append("summary"), priority=50)
+        pipeline.submit("doc", "outline", lambda task: order.append("outline"), priority=10)
+        assert pipeline.submit("doc", "outline", lambda task: order.append("again"), priority=10).status == "queued"
+        release.set()
+        for name in ("blocker", "outline", "summary"):
+            assert pipeline.get("doc", name).finished.wait(10)
+    finally:
+        pipeline.shutdown()
+    assert blocker.status == "done"
+    assert order == ["outline", "summary"]
+
+def test_cancel_drops_queued_tasks_and_stops_running_ones():
+    pipeline = ArtifactPipeline(workers=1)
+    started, release = threading.Event(), threading.Event()
+    ran = []
+
+    def long_task(task):
+        started.set()
+        release.wait(10)
+        task.check_cancelled()
+        ran.append("long")
+
+    try:
+        running = pipeline.submit("doc", "long", long_task, priority=0)
+        queued = pipeline.submit("doc", "later", lambda task: ran.append("later"), priority=10)
+        assert started.wait(10)
+        assert pipeline.cancel("doc") == 2
+        release.set()
+        assert running.finished.wait(10)
+    finally:
+        pipeline.shutdown()
+    assert queued.status == "cancelled" and running.status == "cancelled"
+    assert ran == []
+    assert pipeline.status("doc") == {}
+    assert pipeline.metrics()["cancelled"] == 2
+
+def test_full_queue_drops_tasks_and_disabled_pipeline_skips_them():
+    pipeline = ArtifactPipeline(workers=1, max_queue=1)
+    release = threading.Event()
+    try:
+        pipeline.submit("a", "blocker", lambda task: release.wait(10), priority=0)
+        tasks = [pipeline.submit(f"doc{i}", "outline", lambda task: None, priority=10) for i in range(3)]
+        assert "dropped" in {task.status for task in tasks}
+        release.set()
+    finally:
+        pipeline.shutdown()
+    assert ArtifactPipeline(workers=0).submit("doc", "outline", lambda task: None, priority=0) is None
+
+def test_cancel_if_queued_only_cancels_tasks_not_yet_started():
+    pipeline = ArtifactPipeline(workers=1)
+    started, release = threading.Event(), threading.Event()
+    ran = []
+    try:
+        running = pipeline.submit("doc", "blocker", lambda task: (started.set(), release.wait(10)), priority=0)
+        queued = pipeline.submit("doc", "summary", lambda task: ran.append("summary"), priority=50)
+        assert started.wait(10)
+        assert not pipeline.cancel_if_queued("doc", "blocker")
+        assert pipeline.cancel_if_queued("doc", "summary")
+        assert not pipeline.cancel_if_queued("doc", "missing")
+        release.set()
+        assert running.finished.wait(10)
+    finally:
+        pipeline.shutdown()
+    assert running.status == "done" and queued.status == "cancelled"
+    assert ran == []
+
+def test_finished_documents_beyond_max_tracked_are_forgotten():
+    pipeline = ArtifactPipeline(workers=2, max_tracked=2)
+    started, release = threading.Event(), threading.Event()
+    try:
+        busy = pipeline.submit("busy", "summary", lambda task: (started.set(), release.wait(10)), priority=0)
+        assert started.wait(10)
+        for file_id in ("a", "b", "c"):
+            assert pipeline.submit(file_id, "outline", lambda task: None, priority=10).finished.wait(10)
+        # The oldest document is still running, so the oldest finished ones go instead.
+        assert pipeline.status("a") == {} and pipeline.status("b") == {}
+        assert pipeline.status("c")["outline"]["status"] == "done"
+        assert pipeline.get("busy", "summary") is busy
+        release.set()
+        assert busy.finished.wait(10)
+    finally:
+        pipeline.shutdown()
+    assert busy.status == "done"
+    assert pipeline.metrics()["done"] == 4
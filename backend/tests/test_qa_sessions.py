@@ -0,0 +1,52 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from qa_sessions import PrefixCache, QASession, QATurn, build_turn_messages, compact_history, prefix_message
+
+
+def _turn(i, answer="An answer."):
+    return QATurn(f"Question {i}?", answer, prompt_tokens=100, cached_tokens=40, baseline_prompt_tokens=150, latency_ms=5.0)
+
+def test_history_keeps_recent_turns_and_recaps_older_ones():
+    turns = [_turn(i, answer="word " * 200) for i in range(6)]
+    note, recent = compact_history(turns, max_tokens=10_000, recent_turns=2)
+    assert [turn.question for turn in recent] == ["Question 4?", "Question 5?"]
+    assert note.startswith("Earlier in this conversation:")
+    assert "Question 0?" in note and "Question 3?" in note and "Question 4?" not in note
+    assert note.count("...") == 4  # long answers are shortened
+
+def test_history_respects_token_budget():
+    turns = [_turn(i, answer="word " * 200) for i in range(6)]
+    note, recent = compact_history(turns, max_tokens=50, recent_turns=2)
+    assert recent == []
+    assert note.count("- Q:") < 6
+
+def test_turn_messages_keep_the_prefix_first_and_alternate_roles():
+    prefix = prefix_message("The document.", cache_control=True)
+    messages = build_turn_messages(prefix, [_turn(1), _turn(2)], "Question 3?", excerpts=None)
+    assert messages[0] is prefix
+    assert messages[0]["content"][0]["cache_control"] == {"type": "ephemeral"}
+    assert [m["role"] for m in messages[1:]] == ["user", "assistant", "user", "assistant", "user"]
+    assert messages[-1]["content"] == "Question 3?"
+
+    with_excerpts = build_turn_messages(prefix_message("Instructions.", False), [], "Why?", excerpts="[Page 2]\nBecause.")
+    assert with_excerpts[-1]["content"] == "Relevant excerpts:\n\n[Page 2]\nBecause.\n\nQuestion: Why?"
+
+def test_session_round_trips_and_reports_savings():
+    session = QASession("s1", "doc", "fake/m", "document", prefix_tokens=80, created_at=0.0, turns=[_turn(1), _turn(2)])
+    restored = QASession.from_json(session.to_json())
+    assert restored == session
+    stats = restored.stats()
+    assert stats["prompt_tokens"] == 200 and stats["cached_tokens"] == 80
+    assert stats["saved_prompt_tokens"] == 300 - 120
+
+def test_prefix_cache_keeps_the_most_recently_used_entries():
+    cache = PrefixCache(max_entries=2)
+    assert cache.put("a", "document", "prefix a", 3) == ("prefix a", 3)
+    cache.put("b", "document", "prefix b", 4)
+    assert cache.get("a", "document") == ("prefix a", 3)  # a is now more recent than b
+    cache.put("a", "retrieval", "instructions", 1)
+    assert cache.get("b", "document") is None
+    assert cache.get("a", "document") == ("prefix a", 3)
@@ -0,0 +1,78 @@
+import asyncio
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from response_cache import (
+    MemoryCacheBackend,
+    ResponseCache,
+    SQLiteCacheBackend,
+    make_cache_key,
+    normalize_keywords,
+)
+
+
+def test_cache_key_ignores_keyword_order_and_case():
+    first = make_cache_key("m", "summarize", file_id="abc", keywords=normalize_keywords("Trade, WAR"))
+    second = make_cache_key("m", "summarize", file_id="abc", keywords=normalize_keywords("war ,trade"))
+    assert first == second
+    assert first != make_cache_key("other-model", "summarize", file_id="abc", keywords=normalize_keywords("war,trade"))
+
+def test_memory_backend_is_lru_with_ttl():
+    now = [0.0]
+    backend = MemoryCacheBackend(max_entries=2, clock=lambda: now[0])
+    backend.set("a", "1", ttl_seconds=10)
+    backend.set("b", "2", ttl_seconds=10)
+    backend.get("a")
+    backend.set("c", "3", ttl_seconds=10)
+    assert backend.get("b") is None
+    assert backend.get("a") == "1"
+    now[0] = 11
+    assert backend.get("a") is None
+
+def test_sqlite_backend_persists_across_instances_and_expires(tmp_path):
+    now = [100.0]
+    path = str(tmp_path / "cache.sqlite3")
+    SQLiteCacheBackend(path, clock=lambda: now[0]).set("key", "value", ttl_seconds=5)
+    other_worker = SQLiteCacheBackend(path, clock=lambda: now[0])
+    assert other_worker.get("key") == "value"
+    now[0] = 106
+    assert other_worker.get("key") is None
+
+def test_sqlite_backend_evicts_least_recently_used(tmp_path):
+    now = [0.0]
+    backend = SQLiteCacheBackend(str(tmp_path / "cache.sqlite3"), max_entries=2, clock=lambda: now[0])
+    for i, key in enumerate(["a", "b", "c"]):
+        now[0] = i
+        backend.set(key, key.upper(), ttl_seconds=100)
+    assert backend.get("a") is None
+    assert backend.get("c") == "C"
+
+def test_get_or_call_counts_hits_and_misses(tmp_path):
+    cache = ResponseCache(SQLiteCacheBackend(str(tmp_path / "cache.sqlite3")))
+    calls = []
+
+    async def call():
+        calls.append(1)
+        return "answer"
+
+    async def run():
+        return [await cache.get_or_call("qa", "k", call) for _ in range(3)]
+
+    assert asyncio.run(run()) == [("answer", False), ("answer", True), ("answer", True)]
+    assert len(calls) == 1
+    assert cache.stats()["qa"]["hit_rate"] == 2 / 3
+
+def test_uncounted_lookups_leave_the_hit_rate_alone():
+    cache = ResponseCache(MemoryCacheBackend())
+
+    async def call():
+        return "summary"
+
+    async def run():
+        warm = await cache.get_or_call("summarize", "k", call, count=False)
+        return warm, await cache.get_or_call("summarize", "k", call)
+
+    assert asyncio.run(run()) == (("summary", False), ("summary", True))
+    assert cache.stats()["summarize"] == {"hits": 1, "misses": 0, "hit_rate": 1.0}
@@ -0,0 +1,31 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from retrieval import build_index, chunk_pages, format_context
+
+
+def test_chunk_pages_keeps_page_numbers():
+    pages = ["word " * 100, "", "other " * 10]
+    chunks = chunk_pages(pages, chunk_size=120, overlap=20)
+    assert {chunk.page for chunk in chunks} == {1, 3}
+    assert all(len(chunk.text) <= 120 for chunk in chunks)
+
+def test_search_ranks_matching_chunk_first():
+    pages = ["The cat sat on the mat.", "Quantum chromodynamics describes the strong force.", "Dogs bark loudly."]
+    index = build_index(pages, chunk_size=200)
+    results = index.search("What describes the strong force?", top_k=1)
+    assert results[0][0].page == 2
+
+def test_format_context_cites_pages_in_order():
+    index = build_index(["alpha beta", "gamma alpha"], chunk_size=200)
+    context = format_context(index.search("alpha", top_k=2))
+    assert context == "[Page 1]\nalpha beta\n\n[Page 2]\ngamma alpha"
+
+def test_search_can_be_limited_to_a_page_range():
+    pages = ["alpha " * 5, "beta gamma", "alpha beta", "delta"]
+    index = build_index(pages, chunk_size=200)
+    assert [chunk.page for chunk, _ in index.search("alpha", top_k=2, pages=(2, 4))] == [3, 2]
+    # Without a lexical match, the start of the range is used.
+    assert [chunk.page for chunk, _ in index.search("omega", top_k=1, pages=(4, 4))] == [4]
@@ -0,0 +1,87 @@
+import fnmatch
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from document_cache import StorageDocumentCache, content_hash
+from response_cache import ResponseCache, StorageCacheBackend
+from storage import RedisStorage, SQLiteStorage
+
+
+class FakeRedis:
+    """The subset of the redis-py client API that RedisStorage uses, without expiry."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, px=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def scan_iter(self, match):
+        return [key for key in list(self.data) if fnmatch.fnmatch(key, match)]
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def storage(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteStorage(str(tmp_path / "storage.sqlite3"))
+    return RedisStorage(FakeRedis())
+
+def test_get_set_delete_and_clear_by_namespace(storage):
+    storage.set("a", "k", b"1")
+    storage.set("b", "k", b"2")
+    assert storage.get("a", "k") == b"1"
+    storage.delete("a", "k")
+    assert storage.get("a", "k") is None
+    storage.clear("b")
+    assert storage.get("b", "k") is None
+
+def test_add_only_sets_missing_keys(storage):
+    assert storage.add("claims", "doc", b"job-1")
+    assert not storage.add("claims", "doc", b"job-2")
+    assert storage.get("claims", "doc") == b"job-1"
+
+def test_sqlite_entries_expire_and_expired_claims_can_be_retaken(tmp_path):
+    now = [0.0]
+    storage = SQLiteStorage(str(tmp_path / "storage.sqlite3"), clock=lambda: now[0])
+    storage.set("jobs", "j", b"state", ttl_seconds=10)
+    assert storage.add("claims", "doc", b"job-1", ttl_seconds=10)
+    now[0] = 11
+    assert storage.get("jobs", "j") is None
+    assert storage.add("claims", "doc", b"job-2", ttl_seconds=10)
+
+def test_sqlite_storage_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "storage.sqlite3")
+    SQLiteStorage(path).set("jobs", "j", b"state")
+    assert SQLiteStorage(path).get("jobs", "j") == b"state"
+
+def test_storage_document_cache_round_trip(storage):
+    cache = StorageDocumentCache(storage)
+    file_id = content_hash(b"pdf")
+    assert file_id not in cache
+    cache.put(file_id, "book.pdf", ["Page one", "", "Page three"])
+    loaded = cache.get(file_id)
+    assert file_id in cache
+    assert loaded.filename == "book.pdf"
+    assert loaded.pages() == ["Page one", "", "Page three"]
+    with pytest.raises(ValueError):
+        cache.put("../escape", "x.pdf", ["text"])
+
+def test_storage_response_cache_backend(storage):
+    backend = StorageCacheBackend(storage)
+    backend.set("key", "cached answer", ttl_seconds=60)
+    assert backend.get("key") == "cached answer"
+    ResponseCache(backend).clear()
+    assert backend.get("key") is None
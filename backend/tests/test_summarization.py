@@ -0,0 +1,74 @@
+import asyncio
+import sys
+import os
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from response_cache import MemoryCacheBackend, ResponseCache
+from summarization import MapReduceSummarizer, split_into_sections, use_map_reduce
+
+
+def test_split_into_sections_groups_pages_and_tracks_ranges():
+    sections = split_into_sections(["a" * 40, "b" * 40, "c" * 40, "d" * 250], chunk_size=100)
+    assert [(s.first_page, s.last_page) for s in sections] == [(1, 2), (3, 3), (4, 4), (4, 4), (4, 4)]
+    assert all(len(s.text) <= 100 + 1 for s in sections)
+    assert sections[0].label == "Pages 1-2"
+    # Sections of a page range keep the document's page numbers.
+    assert split_into_sections(["a" * 40, "b" * 40], chunk_size=100, first_page_number=7)[0].label == "Pages 7-8"
+
+def test_use_map_reduce_modes():
+    assert use_map_reduce("short text", "map_reduce")
+    assert not use_map_reduce("x" * 10**7, "single")
+    assert not use_map_reduce("short text", "auto")
+
+def _summarizer(calls, chunk_size=100, concurrency=2):
+    in_flight = [0, 0]  # current, peak
+
+    async def llm_call(prompt, model_name):
+        calls.append(prompt)
+        in_flight[0] += 1
+        in_flight[1] = max(in_flight[1], in_flight[0])
+        await asyncio.sleep(0.001)
+        in_flight[0] -= 1
+        return f"summary {len(calls)}"
+
+    cache = ResponseCache(MemoryCacheBackend())
+    return MapReduceSummarizer(llm_call, cache, chunk_size=chunk_size, concurrency=concurrency), in_flight
+
+def test_section_summaries_are_bounded_and_reused_across_lengths():
+    calls = []
+    summarizer, in_flight = _summarizer(calls)
+    pages = [f"page {i} " + "x" * 80 for i in range(6)]
+
+    short = asyncio.run(summarizer.reduce_prompt("doc", pages, "m", "Short"))
+    map_calls = len(calls)
+    assert map_calls == 6
+    assert in_flight[1] <= 2
+    assert "very brief summary" in short and "[Page 1]" in short
+
+    long = asyncio.run(summarizer.reduce_prompt("doc", pages, "m", "Long", keywords="trade"))
+    assert len(calls) == map_calls  # no new section summaries needed
+    assert "trade" in long
+
+def test_partial_summaries_are_reduced_hierarchically_when_too_long():
+    calls = []
+    summarizer, _ = _summarizer(calls, chunk_size=40)
+    partials = asyncio.run(summarizer.partial_summaries("doc", ["y" * 40] * 8, "m"))
+    assert len(calls) > 8
+    assert len(partials) < 8
+    assert partials[0].startswith("[Pages 1-")
+
+def test_cancelled_map_phase_makes_no_further_calls():
+    calls = []
+    summarizer, _ = _summarizer(calls, concurrency=1)
+    pages = [f"page {i} " + "x" * 80 for i in range(6)]
+
+    def check_cancelled():
+        if len(calls) >= 2:
+            raise RuntimeError("cancelled")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(summarizer.reduce_prompt("doc", pages, "m", check_cancelled=check_cancelled))
+    assert len(calls) == 2
@@ -0,0 +1,67 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from token_budget import (
+    RequestTokenUsage,
+    TokenCounter,
+    TokenUsageStats,
+    context_window,
+    fit_text,
+    fit_to_budget,
+)
+
+
+def _estimating_counter():
+    counter = TokenCounter(encoding_name="no-such-encoding")
+    assert not counter.exact
+    return counter
+
+def test_counter_falls_back_to_character_estimate():
+    counter = _estimating_counter()
+    assert counter.count("") == 0
+    assert counter.count("abcdefgh") == 2
+    assert counter.count("abcdefghi") == 3
+
+def test_truncate_and_fits():
+    counter = _estimating_counter()
+    text = "x" * 100
+    assert counter.truncate(text, 10) == "x" * 40
+    assert counter.truncate(text, 0) == ""
+    assert counter.fits(text, 25)
+    assert not counter.fits(text, 24)
+
+def test_context_window_lookup_accepts_provider_prefix():
+    assert context_window("gemini/gemini-2.0-flash") == context_window("gemini-2.0-flash")
+    assert context_window("gemini/gemini-2.0-flash") > 100_000
+    assert context_window("unknown-model") == 8192
+
+def test_fit_to_budget_marks_truncation():
+    short = "a short text"
+    assert fit_to_budget(short, 1000) == short
+    trimmed = fit_to_budget("word " * 10_000, 100)
+    assert trimmed.endswith("[...truncated to fit the model's context window...]")
+    assert len(trimmed) < len("word " * 10_000)
+
+def test_fit_text_reports_the_count_of_what_it_kept():
+    counter = _estimating_counter()
+    short = counter.fit("a short text", 1000)
+    assert (short.text, short.tokens, short.truncated) == ("a short text", 3, False)
+    trimmed = counter.fit("x" * 1000, 50, marker="[cut]")
+    assert trimmed.truncated and trimmed.text.endswith("[cut]")
+    assert trimmed.tokens == counter.count(trimmed.text) <= 50
+    assert fit_text("word " * 10_000, 100).tokens <= 100
+
+def test_usage_stats_accumulate_per_endpoint():
+    stats = TokenUsageStats()
+    usage = RequestTokenUsage()
+    usage.add(100, 20, 0.5)
+    usage.add(50, 10, 0.25)
+    stats.record("/qa/", usage)
+    stats.record("/qa/", usage)
+    totals = stats.snapshot()["/qa/"]
+    assert totals["requests"] == 2
+    assert totals["llm_calls"] == 4
+    assert totals["prompt_tokens"] == 300
+    assert totals["completion_tokens"] == 60
@@ -0,0 +1,43 @@
+import io
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from document_cache import content_hash
+from uploads import UploadSizeLimitMiddleware, UploadTooLarge, spool_to_disk
+
+
+def test_spool_to_disk_hashes_and_copies(tmp_path):
+    data = os.urandom(3 * 1024 * 1024 + 17)
+    upload = spool_to_disk(io.BytesIO(data), max_bytes=len(data), spool_dir=str(tmp_path))
+    assert upload.file_id == content_hash(data)
+    assert upload.size == len(data)
+    with open(upload.path, "rb") as spooled:
+        assert spooled.read() == data
+    upload.discard()
+    assert os.listdir(tmp_path) == []
+
+def test_spool_to_disk_stops_at_max_size(tmp_path):
+    with pytest.raises(UploadTooLarge):
+        spool_to_disk(io.BytesIO(b"x" * (2 * 1024 * 1024)), max_bytes=1024 * 1024, spool_dir=str(tmp_path))
+    assert os.listdir(tmp_path) == []  # the partial file is removed
+
+def test_middleware_rejects_declared_oversized_uploads():
+    async def upload(request):
+        return PlainTextResponse("ok")
+
+    app = Starlette(routes=[Route("/upload", upload, methods=["POST"]), Route("/other", upload, methods=["POST"])])
+    client = TestClient(UploadSizeLimitMiddleware(app, paths=["/upload"], max_bytes=1024))
+    big = b"x" * (200 * 1024)
+    assert client.post("/upload", content=b"small").status_code == 200
+    response = client.post("/upload", content=big)
+    assert response.status_code == 413
+    assert "maximum upload size" in response.json()["detail"]
+    assert client.post("/other", content=big).status_code == 200
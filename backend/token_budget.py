@@ -0,0 +1,227 @@
+import asyncio
+import contextvars
+import logging
+import math
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from starlette.datastructures import MutableHeaders
+
+from llm_client import context_window
+from metrics import endpoint_label
+
+logger = logging.getLogger(__name__)
+
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+# Tokens kept free in the context window for the model's answer.
+RESERVED_OUTPUT_TOKENS = int(os.getenv("RESERVED_OUTPUT_TOKENS", "4096"))
+# Optional cost cap on prompt size, applied on top of the context window. 0 disables it.
+MAX_PROMPT_TOKENS = int(os.getenv("MAX_PROMPT_TOKENS", "0"))
+
+# Texts longer than this are tokenized in a worker thread by the async helpers,
+# so counting or trimming a whole book never blocks the event loop.
+TOKENIZE_INLINE_MAX_CHARS = int(os.getenv("TOKENIZE_INLINE_MAX_CHARS", "20000"))
+
+# Used when no tokenizer is available (e.g. tiktoken can't download its encoding).
+_CHARS_PER_TOKEN = 4
+_TRUNCATION_MARKER = "\n[...truncated to fit the model's context window...]"
+
+
+class TokenCounter:
+    """
+    Counts tokens with tiktoken. The encoding is an OpenAI one, so counts for
+    Gemini or Llama models are close approximations rather than exact. If the
+    encoding can't be loaded, a characters-per-token estimate is used instead.
+    """
+
+    def __init__(self, encoding_name: str = TOKENIZER_ENCODING):
+        self.encoding_name = encoding_name
+        self._encoding = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _get_encoding(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    try:
+                        import tiktoken
+                        self._encoding = tiktoken.get_encoding(self.encoding_name)
+                    except Exception as e:
+                        logger.warning("Tokenizer %s unavailable, estimating token counts: %s", self.encoding_name, e)
+                    self._loaded = True
+        return self._encoding
+
+    @property
+    def exact(self) -> bool:
+        return self._get_encoding() is not None
+
+    def count(self, text: str) -> int:
+        encoding = self._get_encoding()
+        if encoding is None:
+            return math.ceil(len(text) / _CHARS_PER_TOKEN)
+        return len(encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Returns the longest prefix of `text` that fits in `max_tokens`."""
+        if max_tokens <= 0:
+            return ""
+        encoding = self._get_encoding()
+        if encoding is None:
+            return text[:max_tokens * _CHARS_PER_TOKEN]
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return encoding.decode(tokens[:max_tokens])
+
+    def fits(self, text: str, max_tokens: int) -> bool:
+        # A token is at least one character, so short texts fit without encoding them.
+        return len(text) <= max_tokens or self.count(text) <= max_tokens
+
+    def fit(self, text: str, max_tokens: int, marker: str = "") -> "FittedText":
+        """
+        Like truncate, appending `marker` to a cut text, but it also reports the
+        result's token count, encoding `text` only once.
+        """
+        encoding = self._get_encoding()
+        if encoding is None:
+            tokens = self.count(text)
+            if tokens <= max_tokens:
+                return FittedText(text, tokens, False)
+            cut = self.truncate(text, max_tokens - self.count(marker))
+            return FittedText(cut + marker, self.count(cut) + self.count(marker), True)
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return FittedText(text, len(tokens), False)
+        kept = max(0, max_tokens - self.count(marker))
+        return FittedText(encoding.decode(tokens[:kept]) + marker, kept + self.count(marker), True)
+
+
+@dataclass
+class FittedText:
+    """Text trimmed to a token budget, with its token count so callers needn't count it again."""
+    text: str
+    tokens: int
+    truncated: bool
+
+
+token_counter = TokenCounter()
+
+
+def prompt_budget(model_name: str) -> int:
+    """Tokens available for the prompt: the context window minus the output reserve, capped by MAX_PROMPT_TOKENS."""
+    budget = max(context_window(model_name) - RESERVED_OUTPUT_TOKENS, 1)
+    if MAX_PROMPT_TOKENS > 0:
+        budget = min(budget, MAX_PROMPT_TOKENS)
+    return budget
+
+
+def fit_to_budget(text: str, max_tokens: int) -> str:
+    """Truncates `text` to `max_tokens`, marking the cut so the model knows text is missing."""
+    if token_counter.fits(text, max_tokens):
+        return text
+    return token_counter.truncate(text, max_tokens - token_counter.count(_TRUNCATION_MARKER)) + _TRUNCATION_MARKER
+
+
+def fit_text(text: str, max_tokens: int) -> FittedText:
+    """fit_to_budget that also returns the token count of the result."""
+    return token_counter.fit(text, max_tokens, _TRUNCATION_MARKER)
+
+
+async def acount_tokens(text: str) -> int:
+    """token_counter.count, in a worker thread for long texts."""
+    if len(text) <= TOKENIZE_INLINE_MAX_CHARS:
+        return token_counter.count(text)
+    return await asyncio.to_thread(token_counter.count, text)
+
+
+async def afit_text(text: str, max_tokens: int) -> FittedText:
+    """fit_text, in a worker thread for long texts."""
+    if len(text) <= TOKENIZE_INLINE_MAX_CHARS:
+        return fit_text(text, max_tokens)
+    return await asyncio.to_thread(fit_text, text, max_tokens)
+
+
+@dataclass
+class RequestTokenUsage:
+    """Tokens sent and received, and time spent, by the LLM calls made while serving one request."""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    llm_calls: int = 0
+    llm_seconds: float = 0.0
+
+    def add(self, prompt_tokens: int, completion_tokens: int, llm_seconds: float):
+        self.llm_calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.llm_seconds += llm_seconds
+
+
+current_request_usage: contextvars.ContextVar[Optional[RequestTokenUsage]] = contextvars.ContextVar(
+    "current_request_usage", default=None
+)
+
+
+class TokenUsageStats:
+    """Per-endpoint totals of requests, tokens and LLM time, for cost and latency tracking."""
+
+    def __init__(self):
+        self._totals: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, usage: RequestTokenUsage):
+        with self._lock:
+            totals = self._totals.setdefault(
+                endpoint, {"requests": 0, "llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "llm_seconds": 0.0}
+            )
+            totals["requests"] += 1
+            totals["llm_calls"] += usage.llm_calls
+            totals["prompt_tokens"] += usage.prompt_tokens
+            totals["completion_tokens"] += usage.completion_tokens
+            totals["llm_seconds"] += usage.llm_seconds
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {endpoint: dict(totals) for endpoint, totals in self._totals.items()}
+
+    def clear(self):
+        with self._lock:
+            self._totals.clear()
+
+
+class TokenUsageMiddleware:
+    """
+    ASGI middleware that gives each request a RequestTokenUsage (via a context
+    variable that call_llm updates), reports it in X-Prompt-Tokens /
+    X-Completion-Tokens headers and adds it to the per-endpoint totals once the
+    response body has been sent, which also covers streamed responses. Totals
+    are keyed by route template, so /qa/sessions/{session_id}/ is one endpoint.
+    """
+
+    def __init__(self, app, stats: TokenUsageStats):
+        self.app = app
+        self.stats = stats
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        usage = RequestTokenUsage()
+        token = current_request_usage.set(usage)
+
+        async def send_with_usage(message):
+            if message["type"] == "http.response.start" and usage.llm_calls:
+                headers = MutableHeaders(scope=message)
+                headers["X-Prompt-Tokens"] = str(usage.prompt_tokens)
+                headers["X-Completion-Tokens"] = str(usage.completion_tokens)
+            elif message["type"] == "http.response.body" and not message.get("more_body") and usage.llm_calls:
+                self.stats.record(endpoint_label(scope), usage)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_usage)
+        finally:
+            current_request_usage.reset(token)
@@ -0,0 +1,83 @@
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import BinaryIO, Iterable, Optional
+
+from starlette.responses import JSONResponse
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(512 * 1024 * 1024)))
+# Where uploads are spooled while they are parsed. Empty means the system temp dir.
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None
+
+_CHUNK_SIZE = 1024 * 1024
+# Multipart boundaries and headers around the file part.
+_MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+@dataclass
+class SpooledUpload:
+    path: str
+    file_id: str  # SHA-256 of the content, see document_cache.content_hash
+    size: int
+
+    def discard(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def spool_to_disk(stream: BinaryIO, max_bytes: int = MAX_UPLOAD_BYTES, spool_dir: Optional[str] = UPLOAD_SPOOL_DIR) -> SpooledUpload:
+    """
+    Copies an upload to a temporary file in fixed-size chunks, hashing it on
+    the way, so the whole PDF is never held in memory. Raises UploadTooLarge
+    (and removes the partial file) once more than `max_bytes` have been read.
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(prefix="upload-", suffix=".pdf", dir=spool_dir)
+    try:
+        with os.fdopen(fd, "wb") as spool_file:
+            while True:
+                chunk = stream.read(_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"File exceeds the maximum upload size of {max_bytes // (1024 * 1024)} MB.")
+                hasher.update(chunk)
+                spool_file.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return SpooledUpload(path, hasher.hexdigest(), size)
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Rejects uploads whose declared Content-Length is over the limit before the
+    body is read. Bodies without a length are still cut off by spool_to_disk.
+    """
+
+    def __init__(self, app, paths: Iterable[str], max_bytes: int = MAX_UPLOAD_BYTES):
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.paths:
+            headers = dict(scope["headers"])
+            try:
+                length = int(headers.get(b"content-length", b"0"))
+            except ValueError:
+                length = 0
+            if length > self.max_bytes + _MULTIPART_OVERHEAD:
+                detail = f"File exceeds the maximum upload size of {self.max_bytes // (1024 * 1024)} MB."
+                await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
@@ -6,10 +6,24 @@ interface PdfUploaderProps {
   apiBaseUrl: string;
 }
 
+const POLL_INTERVAL_MS = 500;
+
 const PdfUploader: React.FC<PdfUploaderProps> = ({ onUploadSuccess, apiBaseUrl }) => {
   const [selectedFile, setSelectedFile] = useState<File | null>(null);
   const [isLoading, setIsLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
+  const [progress, setProgress] = useState<string | null>(null);
+
+  // Text extraction runs in the background; poll until the upload job finishes.
+  const waitForJob = async (jobId: string) => {
+    for (;;) {
+      const { data } = await axios.get(`${apiBaseUrl}/upload_pdf/status/${jobId}`);
+      if (data.status === 'done') return;
+      if (data.status === 'failed') throw { response: { data } };
+      if (data.pages_total) setProgress(`Processing pages: ${data.pages_done} / ${data.pages_total}`);
+      await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
+    }
+  };
 
   const handleFileChange = (event: React.ChangeEvent<HTMLInputElement>) => {
     setSelectedFile(event.target.files ? event.target.files[0] : null);
@@ -33,6 +47,9 @@ const PdfUploader: React.FC<PdfUploaderProps> = ({ onUploadSuccess, apiBaseUrl }
           'Content-Type': 'multipart/form-data',
         },
       });
+      if (response.data.job_id) {
+        await waitForJob(response.data.job_id);
+      }
       onUploadSuccess(response.data.file_id, response.data.filename);
       setSelectedFile(null); // Clear selection after upload
     } catch (err: any) {
@@ -40,6 +57,7 @@ const PdfUploader: React.FC<PdfUploaderProps> = ({ onUploadSuccess, apiBaseUrl }
       console.error("Upload error:", err);
     } finally {
       setIsLoading(false);
+      setProgress(null);
     }
   };
 
@@ -49,6 +67,7 @@ const PdfUploader: React.FC<PdfUploaderProps> = ({ onUploadSuccess, apiBaseUrl }
       <button onClick={handleUpload} disabled={isLoading || !selectedFile}>
         {isLoading ? 'Uploading...' : 'Upload PDF'}
       </button>
+      {progress && <p>{progress}</p>}
       {error && <p style={{ color: 'red' }}>{error}</p>}
     </div>
   );
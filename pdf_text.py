@@ -0,0 +1,30 @@
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import PyPDF2
+
+
+# The worker lives in an importable module rather than in app.py: with the
+# "spawn" start method (Windows, macOS) each process imports it by name, and
+# the Streamlit script isn't importable that way.
+def extract_page_range(pdf_bytes, start, end):
+    reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+    return [reader.pages[i].extract_text() for i in range(start, end)]
+
+
+def extract_pdf_text(pdf_bytes, pages_per_task=16, max_workers=None):
+    """
+    Extracts the text of all pages, splitting page ranges across a process pool
+    for large PDFs. Pages are joined in their original order.
+    """
+    num_pages = len(PyPDF2.PdfReader(io.BytesIO(pdf_bytes)).pages)
+    starts = list(range(0, num_pages, pages_per_task))
+    ends = [min(start + pages_per_task, num_pages) for start in starts]
+    if len(starts) <= 1 or (os.cpu_count() or 1) == 1:
+        page_groups = [extract_page_range(pdf_bytes, 0, num_pages)]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            page_groups = list(pool.map(extract_page_range, repeat(pdf_bytes), starts, ends))
+    return "\n".join(page for group in page_groups for page in group)